@@ -1,7 +1,5 @@
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
-from AI_container.credentials.api_load import load_api
 import time
 import tempfile
 import numpy as np
@@ -11,30 +9,127 @@ import os
 import pandas as pd
 import logging
 from End.Operations import SheetOperations
+from AI_container.credentials.response_cache import get_response_cache
+from AI_container.credentials.gemini_client import GEMINI_MODEL, get_model, record_call
+from AI_container.credentials.prompt_context import build_stock_context
 
 class PDFQA:
     def __init__(self):
-        load_api()  
-        self.model = genai.GenerativeModel('gemini-2.5-flash-preview-05-20')
+        # Sem custo de inicialização: o cliente Gemini é compartilhado e só é
+        # configurado na primeira chamada ao modelo
+        self.model_name = GEMINI_MODEL
         self.embedding_model = 'models/embedding-001'
+        self.last_call_metrics = None
+
+    @property
+    def model(self):
+        return get_model(self.model_name)
 
     def clean_text(self, text):
         text = re.sub(r'\s+', ' ', text)
         text = re.sub(r'[^\w\s,.!?\'\"-]', '', text)
         return text.strip()
 
-    def ask_gemini(self, context, question):
+    def _new_metrics(self, streamed):
+        return {
+            'model': self.model_name, 'streamed': streamed, 'cached': True,
+            'ttft': None, 'total': None, 'chars': 0, 'completed': False
+        }
+
+    def _record(self, metrics, start):
+        metrics['total'] = time.perf_counter() - start
+        self.last_call_metrics = metrics
+        record_call(metrics)
+
+    def generate(self, prompt, use_cache=True):
+        """
+        Texto gerado pelo Gemini para o prompt, passando pelo cache de
+        respostas persistente.
+        
+        Args:
+            prompt (str): Prompt completo
+            use_cache (bool): False força uma nova resposta (e atualiza o cache)
+            
+        Returns:
+            str: Texto da resposta
+        """
+        start = time.perf_counter()
+        metrics = self._new_metrics(streamed=False)
+        
+        def call():
+            metrics['cached'] = False
+            return self.model.generate_content(prompt).text
+        
+        try:
+            response = get_response_cache().get_or_generate(
+                prompt, self.model_name, call, refresh=not use_cache
+            )
+            metrics['ttft'] = time.perf_counter() - start
+            metrics['chars'] = len(response)
+            metrics['completed'] = True
+            return response
+        finally:
+            self._record(metrics, start)
+
+    def generate_stream(self, prompt, use_cache=True):
+        """
+        Gerador dos trechos da resposta do Gemini conforme chegam, para
+        exibição incremental (ex.: ``st.write_stream``).
+        
+        Uma resposta em cache sai num único trecho; uma resposta nova é
+        gravada no cache ao final do stream. O tempo até o primeiro trecho e
+        o tempo total ficam em ``last_call_metrics`` e no histórico de
+        ``gemini_client.recent_calls``.
+        
+        Args:
+            prompt (str): Prompt completo
+            use_cache (bool): False força uma nova resposta (e atualiza o cache)
+            
+        Yields:
+            str: Trechos do texto da resposta
+        """
+        start = time.perf_counter()
+        metrics = self._new_metrics(streamed=True)
+        
+        def stream():
+            metrics['cached'] = False
+            for chunk in self.model.generate_content(prompt, stream=True):
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Trecho sem partes de texto (ex.: só o motivo de término)
+                    continue
+                if text:
+                    yield text
+        
+        try:
+            for text in get_response_cache().stream_or_generate(
+                prompt, self.model_name, stream, refresh=not use_cache
+            ):
+                if metrics['ttft'] is None:
+                    metrics['ttft'] = time.perf_counter() - start
+                metrics['chars'] += len(text)
+                yield text
+            metrics['completed'] = True
+        finally:
+            self._record(metrics, start)
+
+    def ask_gemini(self, context, question, use_cache=True, stream=False):
         try:
             st.info("Enviando pergunta para o modelo Gemini...")
-            response = self.model.generate_content(f"""
+            prompt = f"""
             Contexto: {context}
 
             Pergunta: {question}
 
             Por favor, forneça uma resposta detalhada e precisa.
-            """)
+            """
+            if stream:
+                # Erros da chamada aparecem durante o consumo do gerador
+                return self.generate_stream(prompt, use_cache)
+            response = self.generate(prompt, use_cache)
             st.success("Resposta recebida do modelo Gemini.")
-            return response.text
+            return response
         except Exception as e:
             st.error(f"Erro ao obter resposta do modelo Gemini: {str(e)}")
             return None
@@ -58,7 +153,7 @@ class PDFQA:
             st.exception(e)
             return f"Ocorreu um erro ao processar a pergunta: {str(e)}", 0
 
-    def stock_analysis(self, stock_data, purchase_history=None, usage_history=None):
+    def stock_analysis(self, stock_data, purchase_history=None, usage_history=None, use_cache=True, stream=False):
         """
         Analisa dados de estoque e fornece recomendações de compra
         
@@ -66,6 +161,9 @@ class PDFQA:
             stock_data (dict): Dados atuais do estoque com quantidades
             purchase_history (dict, optional): Histórico de compras
             usage_history (dict, optional): Histórico de uso dos EPIs
+            use_cache (bool): False ignora o cache de respostas e força uma nova análise
+            stream (bool): True devolve em "recommendations" um gerador dos
+                trechos da resposta (ver ``generate_stream``)
             
         Returns:
             dict: Recomendações de compra e análise de estoque
@@ -108,50 +206,23 @@ class PDFQA:
                 }
             }
             
-            employee_context = ""
-            if employee_data is not None:
-                size_counts = {
-                    'Camisa Manga Comprida': employee_data['Tamanho Camisa Manga Comprida'].value_counts().to_dict(),
-                    'Calça': employee_data['Tamanho Calça'].value_counts().to_dict(),
-                    'Jaleco': employee_data['Tamanho Jaleco para laboratório'].value_counts().to_dict(),
-                    'Camisa Polo': employee_data['Tamanho Camisa Polo'].value_counts().to_dict(),
-                    'Japona de Lã': employee_data['Tamanho de Japona de Lã (para frio)'].value_counts().to_dict(),
-                    'Jaqueta': employee_data['Tamanho Jaquetas (para frio)'].value_counts().to_dict(),
-                    'Calçado': employee_data['Tamanho do calçado'].value_counts().to_dict()
-                }
-                
-                total_needs = {
-                    'Calça': employee_data['Quantidade de Calças'].sum(),
-                    'Jaleco': employee_data['Quantidade de Jalecos'].sum(),
-                    'Camisa Polo': employee_data['Quantidade de Camisa Polo'].sum(),
-                    'Japona de Lã': employee_data['Quantidade de Japona de Lã'].sum(),
-                    'Jaqueta': employee_data['Quantidade de Jaquetas'].sum(),
-                    'Calçado': employee_data['Quantidade de Calçado'].sum()
-                }
-                area_analysis = employee_data.groupby('Área de Atuação').size().to_dict()
-                gender_analysis = employee_data.groupby('Gênero').size().to_dict()
-                employee_context = f"""
-                Informações adicionais dos funcionários:
-                
-                Distribuição de tamanhos por EPI: {size_counts}
-                
-                Necessidades totais por EPI: {total_needs}
-                
-                Distribuição por área: {area_analysis}
-                
-                Distribuição por gênero: {gender_analysis}
-                
-                Por favor, considere estas informações ao fazer as recomendações de compra,
-                levando em conta os tamanhos necessários e as quantidades adequadas para cada funcionário.
-                """
-            context = f"""
-            Dados atuais do estoque: {stock_data}
+            # Dados em tabelas compactas dentro do orçamento de tokens
+            data_context, context_stats = build_stock_context(
+                stock_data, purchase_history, usage_history, employee_data
+            )
+            logging.info(f"Contexto da análise de estoque: {context_stats['tokens']} tokens estimados")
+            
+            employee_note = """
+            Considere as informações dos funcionários ao fazer as recomendações de compra,
+            levando em conta os tamanhos necessários e as quantidades adequadas para cada funcionário.
+            """ if employee_data is not None else ''
             
-            {f'Histórico de compras: {purchase_history}' if purchase_history else ''}
+            context = f"""
+            Dados (tabelas com colunas separadas por "|"):
             
-            {f'Histórico de uso: {usage_history}' if usage_history else ''}
+{data_context}
             
-            {employee_context if employee_context else ''}
+            {employee_note}
             
             Informações importantes sobre periodicidade de troca dos EPIs:
             
@@ -183,13 +254,15 @@ class PDFQA:
                - Excesso de estoque que possa deteriorar
             6. Quando indicar compra seja especifico, indique o EPI o CA e a quantidade especifica.   
             """
-            response = self.model.generate_content(context)
-            recommendations = response.text
-            
-            st.success("Análise de estoque concluída com sucesso.")
+            if stream:
+                recommendations = self.generate_stream(context, use_cache)
+            else:
+                recommendations = self.generate(context, use_cache)
+                st.success("Análise de estoque concluída com sucesso.")
             
             return {
                 "recommendations": recommendations,
+                "context_tokens": context_stats['tokens'],
                 "timestamp": time.time()
             }
             
@@ -1,6 +1,5 @@
 from dotenv import load_dotenv
 import os
-import google.generativeai as genai
 import streamlit as st
 import logging
 
@@ -8,11 +7,14 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 def load_api():
     try:
+        # Importado aqui: a biblioteca só é carregada quando a IA é usada
+        import google.generativeai as genai
+        
         api_key = None
         try:
             api_key = st.secrets["general"]["GOOGLE_API_KEY"]
             logging.info("API key loaded from Streamlit secrets.")
-        except (KeyError, TypeError, AttributeError):
+        except (KeyError, TypeError, AttributeError, FileNotFoundError):
             logging.info("API key not found in Streamlit secrets, trying environment variables.")
         if not api_key:
             load_dotenv()
@@ -0,0 +1,86 @@
+"""
+Cliente Gemini compartilhado pelo processo
+"""
+import logging
+import threading
+from collections import deque
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+# Modelo usado em todas as chamadas (faz parte da chave do cache de respostas)
+GEMINI_MODEL = 'gemini-2.5-flash-preview-05-20'
+
+# Chamadas mantidas no histórico de latência (as mais recentes)
+CALL_HISTORY_SIZE = 200
+
+_lock = threading.Lock()
+_genai = None
+_models = {}
+_calls = deque(maxlen=CALL_HISTORY_SIZE)
+
+
+def get_genai():
+    """
+    Módulo ``google.generativeai`` já configurado com a chave da API.
+
+    A importação e o ``load_api`` (segredos, .env e ``genai.configure``)
+    acontecem só na primeira chamada; as seguintes reutilizam o mesmo
+    cliente. Se a chave não for encontrada, nada fica guardado e a próxima
+    chamada tenta de novo.
+
+    Raises:
+        RuntimeError: Se a API não pôde ser configurada
+    """
+    global _genai
+    with _lock:
+        if _genai is None:
+            from AI_container.credentials.api_load import load_api
+
+            genai = load_api()
+            if genai is None:
+                raise RuntimeError("API do Gemini não configurada (verifique a GOOGLE_API_KEY).")
+            _genai = genai
+            logger.info("Cliente Gemini inicializado")
+        return _genai
+
+
+def get_model(model_name: str = GEMINI_MODEL):
+    """``GenerativeModel`` único por nome de modelo, criado no primeiro uso."""
+    genai = get_genai()
+    with _lock:
+        if model_name not in _models:
+            _models[model_name] = genai.GenerativeModel(model_name)
+        return _models[model_name]
+
+
+def reset_client():
+    """Descarta o cliente e os modelos (ex.: após trocar a chave da API)."""
+    global _genai
+    with _lock:
+        _genai = None
+        _models.clear()
+
+
+def record_call(metrics: Dict):
+    """
+    Registra a latência de uma chamada ao modelo.
+
+    Args:
+        metrics: ``model``, ``streamed``, ``cached``, ``ttft`` (segundos até o
+            primeiro trecho), ``total`` (segundos), ``chars`` e ``completed``
+    """
+    _calls.append(dict(metrics))
+    ttft = f"{metrics['ttft']:.2f}s" if metrics.get('ttft') is not None else '-'
+    logger.info(
+        f"Gemini ({metrics.get('model')}): primeiro trecho em {ttft}, total {metrics.get('total', 0):.2f}s, "
+        f"{metrics.get('chars', 0)} caracteres"
+        f"{' (cache)' if metrics.get('cached') else ''}{' (stream)' if metrics.get('streamed') else ''}"
+        f"{'' if metrics.get('completed', True) else ' [interrompida]'}"
+    )
+
+
+def recent_calls() -> List[Dict]:
+    """Métricas das últimas chamadas, da mais antiga para a mais recente."""
+    return list(_calls)
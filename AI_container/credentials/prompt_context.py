@@ -0,0 +1,228 @@
+"""
+Contexto compacto de estoque para os prompts do Gemini
+"""
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+# Orçamento de tokens da parte de dados do prompt de análise de estoque
+STOCK_CONTEXT_TOKEN_BUDGET = 2500
+
+# Colunas da aba 'funcionarios' usadas no contexto
+SIZE_COLUMNS = {
+    'Camisa Manga Comprida': 'Tamanho Camisa Manga Comprida',
+    'Calça': 'Tamanho Calça',
+    'Jaleco': 'Tamanho Jaleco para laboratório',
+    'Camisa Polo': 'Tamanho Camisa Polo',
+    'Japona de Lã': 'Tamanho de Japona de Lã (para frio)',
+    'Jaqueta': 'Tamanho Jaquetas (para frio)',
+    'Calçado': 'Tamanho do calçado'
+}
+
+QUANTITY_COLUMNS = {
+    'Calça': 'Quantidade de Calças',
+    'Jaleco': 'Quantidade de Jalecos',
+    'Camisa Polo': 'Quantidade de Camisa Polo',
+    'Japona de Lã': 'Quantidade de Japona de Lã',
+    'Jaqueta': 'Quantidade de Jaquetas',
+    'Calçado': 'Quantidade de Calçado'
+}
+
+
+def estimate_tokens(text: str, model=None) -> int:
+    """
+    Tokens de um texto: ``model.count_tokens`` quando um modelo é passado,
+    senão a aproximação de 4 caracteres por token.
+    """
+    if model is not None:
+        try:
+            return model.count_tokens(text).total_tokens
+        except Exception as e:
+            logger.warning(f"Contagem de tokens pelo modelo falhou, usando estimativa: {e}")
+    return (len(text) + 3) // 4
+
+
+def _number(value) -> str:
+    """Número sem casas decimais desnecessárias (12.0 -> 12, 3.456 -> 3.5)."""
+    value = float(value)
+    return str(int(value)) if value == int(value) else f"{value:.1f}"
+
+
+def compact_table(df: pd.DataFrame, max_rows: int = None, keep_ends: bool = False) -> str:
+    """
+    Tabela com separador ``|``, sem espaçamento de alinhamento e com os
+    números arredondados. Linhas além de ``max_rows`` viram uma linha de
+    resumo com a contagem omitida: no fim da tabela ou, com ``keep_ends``,
+    no meio (ficam as primeiras e as últimas linhas).
+    """
+    if df.empty:
+        return "(sem dados)"
+    
+    def rows(part: pd.DataFrame) -> List[str]:
+        return [
+            '|'.join(_number(v) if isinstance(v, (int, float, np.number)) and not pd.isna(v) else str(v) for v in row)
+            for row in part.itertuples(index=False)
+        ]
+    
+    lines = ['|'.join(map(str, df.columns))]
+    if max_rows is None or len(df) <= max_rows:
+        return '\n'.join(lines + rows(df))
+    
+    omitted = f"... +{len(df) - max_rows} linha(s) omitida(s)"
+    if keep_ends:
+        head = (max_rows + 1) // 2
+        tail = df.tail(max_rows - head) if max_rows > head else df.iloc[:0]
+        return '\n'.join(lines + rows(df.head(head)) + [omitted] + rows(tail))
+    return '\n'.join(lines + rows(df.head(max_rows)) + [omitted])
+
+
+def _stock_table(stock_data: Dict[str, float]) -> pd.DataFrame:
+    """Estoque por EPI, dos mais críticos (menor saldo) para os maiores."""
+    stock = pd.Series(stock_data, dtype=float).round(1)
+    return stock.sort_values(kind='stable').rename_axis('EPI').reset_index(name='Saldo')
+
+
+def _purchases_table(purchase_history: List[Dict]) -> pd.DataFrame:
+    """Compras agregadas por EPI: quantidade total, último valor unitário e última data."""
+    df = pd.DataFrame(purchase_history)
+    if df.empty:
+        return df
+    df['date'] = pd.to_datetime(df['date'], errors='coerce')
+    df = df.sort_values('date')
+    table = df.groupby('epi_name').agg(
+        Qtd=('quantity', 'sum'),
+        Compras=('quantity', 'size'),
+        UltimoValor=('value', 'last'),
+        UltimaData=('date', 'max')
+    ).sort_values('Qtd', ascending=False)
+    table['UltimaData'] = table['UltimaData'].dt.strftime('%d/%m/%y')
+    return table.rename_axis('EPI').reset_index()
+
+
+def _usage_table(usage_history: List[Dict]) -> pd.DataFrame:
+    """Saídas agregadas por EPI: quantidade, retiradas, solicitantes e última data."""
+    df = pd.DataFrame(usage_history)
+    if df.empty:
+        return df
+    df['date'] = pd.to_datetime(df['date'], errors='coerce')
+    table = df.groupby('epi_name').agg(
+        Qtd=('quantity', 'sum'),
+        Retiradas=('quantity', 'size'),
+        Solicitantes=('requester', 'nunique'),
+        UltimaData=('date', 'max')
+    ).sort_values('Qtd', ascending=False)
+    table['UltimaData'] = table['UltimaData'].dt.strftime('%d/%m/%y')
+    return table.rename_axis('EPI').reset_index()
+
+
+def _employee_lines(employee_data: pd.DataFrame, top_sizes: Optional[int]) -> List[str]:
+    """Tamanhos (mais frequentes primeiro), quantidades necessárias e distribuição por área/gênero."""
+    lines = [f"Funcionários: {len(employee_data)}"]
+    
+    sizes = []
+    for item, column in SIZE_COLUMNS.items():
+        if column not in employee_data.columns:
+            continue
+        counts = employee_data[column].replace('', pd.NA).dropna().value_counts()
+        omitted = len(counts) - top_sizes if top_sizes is not None and len(counts) > top_sizes else 0
+        if omitted:
+            counts = counts.head(top_sizes)
+        if not counts.empty:
+            sizes.append(
+                f"{item}: " + ', '.join(f"{size}={count}" for size, count in counts.items())
+                + (f", +{omitted} outros" if omitted else "")
+            )
+    if sizes:
+        lines.append("Tamanhos (tamanho=funcionários): " + '; '.join(sizes))
+    
+    needs = [
+        f"{item}={_number(pd.to_numeric(employee_data[column], errors='coerce').sum())}"
+        for item, column in QUANTITY_COLUMNS.items() if column in employee_data.columns
+    ]
+    if needs:
+        lines.append("Quantidade total necessária: " + ', '.join(needs))
+    
+    for label, column in (('Área', 'Área de Atuação'), ('Gênero', 'Gênero')):
+        if column in employee_data.columns:
+            counts = employee_data[column].value_counts()
+            lines.append(f"Por {label.lower()}: " + ', '.join(f"{name}={count}" for name, count in counts.items()))
+    return lines
+
+
+def build_stock_context(
+    stock_data: Dict[str, float],
+    purchase_history: List[Dict] = None,
+    usage_history: List[Dict] = None,
+    employee_data: pd.DataFrame = None,
+    token_budget: int = STOCK_CONTEXT_TOKEN_BUDGET
+) -> Tuple[str, Dict]:
+    """
+    Parte de dados do prompt de análise de estoque, em tabelas compactas.
+    
+    Nenhuma tabela é cortada se tudo couber em ``token_budget``. Acima do
+    orçamento, primeiro as tabelas de histórico (uso e compras) e os
+    tamanhos têm o número de linhas reduzido pela metade, depois o estoque.
+    Do histórico ficam os EPIs de maior movimento; do estoque ficam as duas
+    pontas, os mais críticos (menor saldo) e os de maior saldo. Cada corte é
+    indicado no texto.
+    
+    Args:
+        stock_data: Saldo atual por EPI
+        purchase_history: Últimas entradas (``date``, ``epi_name``, ``quantity``, ``value``)
+        usage_history: Últimas saídas (``date``, ``epi_name``, ``quantity``, ``requester``)
+        employee_data: Aba 'funcionarios' (opcional)
+        token_budget: Máximo de tokens estimados para os dados
+    
+    Returns:
+        Texto do contexto e dict com ``tokens`` e os limites de linhas usados
+        (None = tabela inteira)
+    """
+    stock = _stock_table(stock_data)
+    purchases = _purchases_table(purchase_history or [])
+    usage = _usage_table(usage_history or [])
+    
+    sizes = [
+        employee_data[column].replace('', pd.NA).dropna().nunique()
+        for column in SIZE_COLUMNS.values()
+        if employee_data is not None and column in employee_data.columns
+    ]
+    rows = {'estoque': len(stock), 'compras': len(purchases), 'uso': len(usage), 'tamanhos': max(sizes, default=0)}
+    limits = {name: None for name in rows}
+    
+    def shown(name: str) -> int:
+        return rows[name] if limits[name] is None else limits[name]
+    
+    def render():
+        sections = [
+            f"Estoque atual ({len(stock)} EPIs, menor saldo primeiro; saldo <= 0 = crítico):\n"
+            + compact_table(stock, limits['estoque'], keep_ends=True)
+        ]
+        if not purchases.empty:
+            sections.append("Compras recentes por EPI:\n" + compact_table(purchases, limits['compras']))
+        if not usage.empty:
+            sections.append("Uso recente por EPI:\n" + compact_table(usage, limits['uso']))
+        if employee_data is not None and not employee_data.empty:
+            sections.append('\n'.join(_employee_lines(employee_data, limits['tamanhos'])))
+        return '\n\n'.join(sections)
+    
+    # Histórico e tamanhos são reduzidos antes do estoque (o maior primeiro)
+    text = render()
+    tokens = estimate_tokens(text)
+    while tokens > token_budget:
+        candidates = [n for n in ('uso', 'compras', 'tamanhos') if shown(n) > 1]
+        candidates = candidates or [n for n in ('estoque',) if shown(n) > 1]
+        if not candidates:
+            logger.warning(f"Contexto de estoque acima do orçamento mesmo truncado: {tokens} tokens")
+            break
+        name = max(candidates, key=shown)
+        limits[name] = max(1, shown(name) // 2)
+        text = render()
+        tokens = estimate_tokens(text)
+    
+    return text, {'tokens': tokens, **limits}
+
@@ -0,0 +1,215 @@
+"""
+Cache persistente das respostas do Gemini
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Validade de uma resposta em cache (segundos)
+RESPONSE_CACHE_TTL = 24 * 3600
+
+# Limites do cache: respostas menos usadas recentemente saem primeiro
+RESPONSE_CACHE_MAX_ENTRIES = 500
+RESPONSE_CACHE_MAX_BYTES = 20 * 1024 * 1024
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Forma canônica do prompt para a chave do cache: Unicode normalizado e
+    espaços/quebras de linha colapsados, de modo que prompts que só diferem
+    na indentação das f-strings caiam na mesma entrada.
+    """
+    return ' '.join(unicodedata.normalize('NFC', prompt).split())
+
+
+def cache_key(prompt: str, model_name: str) -> str:
+    """Hash do modelo + prompt normalizado."""
+    return hashlib.sha256(f"{model_name}\n{normalize_prompt(prompt)}".encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Respostas do Gemini gravadas em SQLite, pela chave ``cache_key``.
+    
+    - Entradas mais antigas que ``ttl`` são descartadas na leitura
+    - Acima de ``max_entries`` ou ``max_bytes``, saem as respostas lidas há
+      mais tempo (LRU)
+    - ``refresh=True`` em ``get_or_generate`` ignora o cache e grava a
+      resposta nova no lugar da anterior
+    - ``stats`` reporta acertos, faltas e recálculos forçados do processo
+    """
+    
+    def __init__(self, path: str, ttl: float = RESPONSE_CACHE_TTL,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'bypassed': 0}
+        
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    response TEXT,
+                    size INTEGER,
+                    created_at REAL,
+                    last_access REAL,
+                    hits INTEGER DEFAULT 0
+                )
+            """)
+    
+    @contextmanager
+    def _connect(self):
+        # Uma conexão por operação: o cache é usado por várias threads
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+    
+    def _count(self, counter: str):
+        with self._lock:
+            self._counters[counter] += 1
+    
+    def get(self, prompt: str, model_name: str) -> Optional[str]:
+        """Resposta em cache ou None (faltas e expiradas contam como miss)."""
+        key = cache_key(prompt, model_name)
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is not None:
+                conn.execute(
+                    "UPDATE responses SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key)
+                )
+        
+        self._count('hits' if row is not None else 'misses')
+        return row[0] if row is not None else None
+    
+    def set(self, prompt: str, model_name: str, response: str):
+        """Grava uma resposta e aplica os limites de tamanho."""
+        if not response:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_access, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (cache_key(prompt, model_name), model_name, response, len(response.encode('utf-8')), now, now)
+            )
+            self._evict(conn, now)
+    
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        
+        rows = conn.execute("SELECT key, size FROM responses ORDER BY last_access DESC").fetchall()
+        total, evicted = 0, []
+        for index, (key, size) in enumerate(rows):
+            total += size
+            if index >= self.max_entries or total > self.max_bytes:
+                evicted.append((key,))
+        if evicted:
+            conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+            logger.info(f"Cache de respostas: {len(evicted)} entrada(s) removida(s) por limite de tamanho")
+    
+    def get_or_generate(self, prompt: str, model_name: str, generate: Callable[[], str],
+                        refresh: bool = False) -> str:
+        """
+        Resposta do cache ou de ``generate()`` (que é então gravada).
+        
+        Args:
+            prompt: Prompt enviado ao modelo
+            model_name: Nome do modelo (faz parte da chave)
+            generate: Função que chama o modelo e devolve o texto
+            refresh: Ignora o cache e força uma nova resposta
+        """
+        if refresh:
+            self._count('bypassed')
+        else:
+            cached = self.get(prompt, model_name)
+            if cached is not None:
+                return cached
+        
+        response = generate()
+        self.set(prompt, model_name, response)
+        return response
+    
+    def stream_or_generate(self, prompt: str, model_name: str, stream: Callable[[], Iterable[str]],
+                           refresh: bool = False) -> Iterator[str]:
+        """
+        Versão em streaming de ``get_or_generate``: a resposta em cache sai
+        num único trecho; senão os trechos de ``stream()`` são repassados
+        conforme chegam e o texto completo é gravado ao final. Se o consumo
+        for interrompido, nada é gravado.
+        
+        Args:
+            prompt: Prompt enviado ao modelo
+            model_name: Nome do modelo (faz parte da chave)
+            stream: Função que chama o modelo e devolve os trechos do texto
+            refresh: Ignora o cache e força uma nova resposta
+        """
+        if refresh:
+            self._count('bypassed')
+        else:
+            cached = self.get(prompt, model_name)
+            if cached is not None:
+                yield cached
+                return
+        
+        parts = []
+        for chunk in stream():
+            parts.append(chunk)
+            yield chunk
+        self.set(prompt, model_name, ''.join(parts))
+    
+    def stats(self) -> Dict:
+        """Acertos, faltas e recálculos do processo, mais entradas e bytes em disco."""
+        with self._connect() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters['hits'] + counters['misses']
+        return {
+            **counters,
+            'hit_rate': counters['hits'] / lookups if lookups else 0.0,
+            'entries': entries,
+            'size_bytes': size
+        }
+    
+    def clear(self):
+        """Remove todas as respostas gravadas."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Cache único do processo, em ``config.cache_dir/ai/responses.sqlite``."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            from ML.config import config
+            _cache = ResponseCache(os.path.join(config.cache_dir, 'ai', 'responses.sqlite'))
+        return _cache
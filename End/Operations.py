@@ -251,7 +251,24 @@ class SheetOperations:
     def carregar_dados_budget(self):
         """Carrega os dados da aba 'budget'"""
         return self.carregar_dados_aba('budget')
-    
+
+    def carregar_regras_troca(self):
+        """
+        Carrega as regras de periodicidade de troca da aba 'regras_troca'.
+        A aba é opcional: se não existir, retorna None sem exibir erro
+        (as regras padrão de ``Utils.epi_rules`` são usadas).
+        """
+        if not self.credentials or not self.my_archive_google_sheets:
+            return None
+        try:
+            archive = self.credentials.open_by_url(self.my_archive_google_sheets)
+            if 'regras_troca' not in [sheet.title for sheet in archive.worksheets()]:
+                return None
+            return archive.worksheet_by_title('regras_troca').get_all_values()
+        except Exception as e:
+            logging.error(f"Erro ao ler a aba 'regras_troca': {e}")
+            return None
+
     def adc_budget(self, ano, valor):
         """Adiciona um novo registro de orçamento"""
         if not self.credentials or not self.my_archive_google_sheets:
@@ -9,6 +9,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from End.Operations import SheetOperations
 from AI_container.credentials.API_Operation import PDFQA
+from AI_container.credentials.response_cache import get_response_cache
 
 def ai_recommendations_page():
     """
@@ -86,22 +87,37 @@ def ai_recommendations_page():
         # Seção para análise de IA
         st.subheader("Análise de Estoque por Inteligência Artificial")
         
+        # A mesma foto do estoque reaproveita a resposta guardada no cache
+        force_refresh = st.checkbox(
+            "Ignorar cache e gerar uma nova análise",
+            help="Sem esta opção, dados idênticos aos de uma análise recente reutilizam a resposta anterior."
+        )
+        
         # Botão para gerar recomendações
         if st.button("Gerar Recomendações de Compra"):
-            with st.spinner("Analisando dados de estoque e gerando recomendações..."):
-                # Chamar a função de análise de estoque da IA
+            with st.spinner("Preparando os dados de estoque para a análise..."):
+                # Chamar a função de análise de estoque da IA (resposta em streaming)
                 recommendations = ai_engine.stock_analysis(
                     stock_data, 
                     purchase_history,
-                    usage_history
+                    usage_history,
+                    use_cache=not force_refresh,
+                    stream=True
                 )
                 
-                if "error" in recommendations:
-                    st.error(recommendations["error"])
-                else:
-                    # Exibir as recomendações
-                    st.markdown("### Recomendações de Compra")
-                    st.markdown(recommendations["recommendations"])
+            if "error" in recommendations:
+                st.error(recommendations["error"])
+            else:
+                # Exibir as recomendações conforme o modelo gera o texto
+                st.markdown("### Recomendações de Compra")
+                try:
+                    text = st.write_stream(recommendations["recommendations"])
+                except Exception as e:
+                    st.error(f"Erro ao gerar as recomendações: {str(e)}")
+                    text = None
+                
+                if text:
+                    st.success("Análise de estoque concluída com sucesso.")
                     
                     # Salvar as recomendações no histórico de sessão
                     if 'recommendation_history' not in st.session_state:
@@ -110,9 +126,23 @@ def ai_recommendations_page():
                     # Adicionar nova recomendação ao histórico
                     st.session_state.recommendation_history.append({
                         "timestamp": datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
-                        "recommendations": recommendations["recommendations"]
+                        "recommendations": text
                     })
         
+        metrics = ai_engine.last_call_metrics
+        if metrics and metrics['ttft'] is not None:
+            st.caption(
+                f"Última resposta: primeiro trecho em {metrics['ttft']:.1f}s, "
+                f"concluída em {metrics['total']:.1f}s"
+                f"{' (do cache)' if metrics['cached'] else ''}."
+            )
+        
+        cache_stats = get_response_cache().stats()
+        st.caption(
+            f"Cache de respostas da IA: {cache_stats['entries']} resposta(s) guardada(s), "
+            f"{cache_stats['hits']} acerto(s) e {cache_stats['misses']} falta(s) desde o início do servidor."
+        )
+        
         # Exibir histórico de recomendações
         if 'recommendation_history' in st.session_state and st.session_state.recommendation_history:
             st.subheader("Histórico de Recomendações")
@@ -1,7 +1,15 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 from End.Operations import SheetOperations
-from Utils.alert_system import analyze_replacement_alerts, get_ia_insights_for_alert
+from Utils.alert_system import get_ia_insights_for_alert, get_ia_insights_batch
+from Utils.alert_store import get_alert_store
+from Utils.epi_rules import get_rule_matcher
+
+# Limite de alertas enviados de uma vez na análise em lote
+MAX_BATCH_INSIGHTS = 30
+
+CHANGE_LABELS = {'new': '🆕 Novo', 'resolved': '✅ Resolvido', 'escalated': '⬆️ Agravado'}
 
 def alerts_page():
     st.title("🚨 Alertas de Troca Periódica de EPI")
@@ -22,56 +30,122 @@ def alerts_page():
         st.error("Não foi possível carregar os dados de estoque para análise.")
         return
 
+    # Regras de troca da aba 'regras_troca' (ou padrão), compartilhadas com a IA
+    matcher = get_rule_matcher(sheet_operations)
+
+    # Tabela de alertas materializada: só as novas saídas e a virada do dia
+    # são processadas; trocar o filtro ou a janela só consulta os índices
+    store = get_alert_store()
     with st.spinner("Analisando registros e gerando alertas..."):
-        alerts = analyze_replacement_alerts(df_stock)
+        store.update(df_stock, matcher=matcher)
+        engine = store.engine()
+
+    if not store.change_log.empty:
+        with st.expander("🔔 Mudanças recentes nos alertas"):
+            change_log = store.change_log.iloc[::-1].rename(columns={
+                'detected_at': 'Detectado em',
+                'requester': 'Funcionário',
+                'epi_name': 'EPI',
+                'change': 'Mudança',
+                'level_before': 'Nível Anterior',
+                'level_after': 'Nível Atual',
+                'due_date': 'Troca Prevista',
+                'days_overdue': 'Dias Vencido'
+            })
+            change_log['Mudança'] = change_log['Mudança'].map(CHANGE_LABELS)
+            st.dataframe(change_log.head(200), hide_index=True, use_container_width=True)
+            st.download_button(
+                "Exportar mudanças (CSV)",
+                change_log.to_csv(index=False).encode('utf-8'),
+                file_name="mudancas_alertas_epi.csv",
+                mime="text/csv"
+            )
 
-    if not alerts:
+    due_within_days = st.number_input(
+        "Incluir também trocas previstas para os próximos (dias)",
+        min_value=0, max_value=365, value=0, step=15,
+        help="0 mostra apenas as trocas já vencidas."
+    )
+    alerts = engine.query(due_within_days)
+
+    if alerts.empty:
         st.success("✅ Nenhuma troca de EPI vencida encontrada. Tudo em dia!")
         return # Termina a execução aqui se não houver alertas
     
-    total_alerts = len(alerts)
-    st.warning(f"Encontrado(s) {total_alerts} alerta(s) de troca vencida:")
+    total_overdue = int((alerts['days_overdue'] >= 0).sum())
+    total_upcoming = len(alerts) - total_overdue
+    if total_overdue:
+        st.warning(f"Encontrado(s) {total_overdue} alerta(s) de troca vencida.")
+    if total_upcoming:
+        st.info(f"{total_upcoming} troca(s) prevista(s) nos próximos {due_within_days} dias.")
 
-    # Converte os alertas para um DataFrame para facilitar a manipulação
-    df_alerts = pd.DataFrame(alerts)
+    if due_within_days > 0:
+        with st.expander("📦 Demanda de trocas por EPI (para compras)"):
+            demand = engine.upcoming_demand(due_within_days)
+            demand['next_due'] = demand['next_due'].dt.strftime('%d/%m/%Y')
+            st.dataframe(demand.rename(columns={
+                'epi_name': 'EPI',
+                'overdue': 'Vencidas',
+                'upcoming': f'A vencer ({due_within_days} dias)',
+                'total': 'Total',
+                'next_due': 'Próxima Troca'
+            }), hide_index=True, use_container_width=True)
 
     # Adiciona um filtro para o usuário focar em um funcionário específico, se desejar
     st.markdown("---")
-    funcionarios_com_alerta = sorted(df_alerts['Funcionário'].unique())
+    funcionarios_com_alerta = sorted(alerts['requester'].unique())
     selected_employee = st.selectbox(
         "Filtrar por funcionário (opcional)",
         options=["Todos"] + funcionarios_com_alerta
     )
 
-    # Filtra o DataFrame de alertas se um funcionário foi selecionado
+    # Consulta pelo índice do funcionário se um foi selecionado
     if selected_employee != "Todos":
-        df_alerts_display = df_alerts[df_alerts['Funcionário'] == selected_employee]
-    else:
-        df_alerts_display = df_alerts
+        alerts = engine.query(due_within_days, requester=selected_employee)
+
+    # Colunas de exibição a partir do DataFrame tipado de alertas
+    days = alerts['days_overdue']
+    df_alerts_display = pd.DataFrame({
+        'Funcionário': alerts['requester'],
+        'EPI': alerts['epi_name'],
+        'Última Retirada': alerts['last_withdrawal'].dt.strftime('%d/%m/%Y'),
+        'Próxima Troca Prevista': alerts['due_date'].dt.strftime('%d/%m/%Y'),
+        'Status': np.where(days >= 0, days.astype(str) + ' dias vencido', 'vence em ' + (-days).astype(str) + ' dias'),
+        'Dias Vencido': days
+    })
+
+    # Análises de IA já obtidas nesta sessão, por (funcionário, EPI)
+    ai_insights = st.session_state.setdefault('alert_ai_insights', {})
 
     if df_alerts_display.empty:
         st.info(f"Nenhum alerta para {selected_employee}.")
     else:
+        batch_pairs = list(zip(df_alerts_display['Funcionário'], df_alerts_display['EPI']))[:MAX_BATCH_INSIGHTS]
+        if st.button(f"Analisar com IA os {len(batch_pairs)} primeiros alertas da lista 🤖"):
+            with st.spinner("A Inteligência Artificial está analisando os históricos..."):
+                ai_insights.update(get_ia_insights_batch(batch_pairs, df_stock, matcher))
+
         # Loop sobre os alertas (filtrados ou não) e exibe os expanders
         for index, row in df_alerts_display.iterrows():
-            # Usamos o índice original do DataFrame para garantir uma chave única para o botão
-            original_index = row.name 
-            
+            pair = (row['Funcionário'], row['EPI'])
+
             # Título do expander mais informativo
             expander_title = f"**{row['Funcionário']}** — EPI: **{row['EPI']}** (Status: {row['Status']})"
             
             with st.expander(expander_title):
                 col1, col2 = st.columns(2)
                 col1.metric("Última Retirada", row['Última Retirada'])
-                col2.metric("Troca Prevista", row['Próxima Troca Prevista'], delta=f"-{row['Status'].split(' ')[0]} dias", delta_color="inverse")
+                col2.metric("Troca Prevista", row['Próxima Troca Prevista'], delta=f"{-row['Dias Vencido']} dias", delta_color="inverse")
                 
-                # Botão para chamar a análise de IA
-                if st.button("Analisar Padrão de Consumo com IA 🤖", key=f"ia_btn_{original_index}"):
+                # Botão para chamar a análise de IA (funcionário + EPI identificam o alerta)
+                if st.button("Analisar Padrão de Consumo com IA 🤖", key=f"ia_btn_{row['Funcionário']}_{row['EPI']}"):
                     with st.spinner("A Inteligência Artificial está analisando o histórico..."):
-                        insights = get_ia_insights_for_alert(row['Funcionário'], row['EPI'], df_stock)
-                        st.markdown("---")
-                        st.markdown("#### Análise da IA:")
-                        st.info(insights) # st.info é ótimo para destacar a resposta da IA
+                        ai_insights[pair] = get_ia_insights_for_alert(row['Funcionário'], row['EPI'], df_stock, matcher)
+
+                if ai_insights.get(pair):
+                    st.markdown("---")
+                    st.markdown("#### Análise da IA:")
+                    st.info(ai_insights[pair]) # st.info é ótimo para destacar a resposta da IA
 
     st.markdown("---")
     st.info("ℹ️ **Como resolver um alerta?** Para remover um alerta da lista, registre uma nova saída do mesmo EPI para o funcionário correspondente na Página Principal.")
@@ -1,7 +1,10 @@
 import streamlit as st
 from Utils.consultaca import CAQuery
+from Utils.semantic_index import get_semantic_index, refresh_catalog_index
 from auth import can_edit # Apenas editores e admins podem consultar
 
+SEARCH_SCOPES = {"CAs e EPIs do estoque": None, "Somente CAs": "ca", "Somente EPIs do estoque": "epi"}
+
 def ca_lookup_page():
     st.title("🔎 Consulta de Certificado de Aprovação (CA)")
 
@@ -48,3 +51,29 @@ def ca_lookup_page():
                 # Informa se o dado veio do cache
                 if 'ultima_consulta' in result:
                     st.caption(f"Este dado foi obtido do nosso banco de dados em {result['ultima_consulta']}.")
+
+    st.markdown("---")
+    st.subheader("🧭 Busca por Semelhança")
+    st.markdown("Encontre CAs já consultados e EPIs do estoque com nome ou descrição parecidos. Use o nome de um item do estoque para descobrir o CA correspondente, ou um termo como \"luva nitrílica\" para achar itens equivalentes.")
+
+    search_text = st.text_input("Texto da busca:", placeholder="Ex: luva nitrílica")
+    scope = st.radio("Buscar em:", list(SEARCH_SCOPES), horizontal=True)
+
+    if st.button("Buscar Semelhantes") and search_text.strip():
+        with st.spinner("Atualizando o índice do catálogo e buscando..."):
+            # Só documentos novos ou alterados desde a última busca são reprocessados
+            epi_names = st.session_state['data']['epi_name'].tolist() if 'data' in st.session_state else None
+            refresh_catalog_index(ca_consultor.sheet_ops, db_ca_df=ca_consultor.db_ca_df, epi_names=epi_names)
+            results = get_semantic_index().search(search_text, k=10, kind=SEARCH_SCOPES[scope], min_score=0.1)
+
+        if results.empty:
+            st.info("Nenhum item parecido encontrado.")
+        else:
+            results['Tipo'] = results['kind'].map({'ca': 'CA', 'epi': 'EPI do estoque'})
+            st.dataframe(
+                results[['Tipo', 'key', 'text', 'score']].rename(
+                    columns={'key': 'CA / EPI', 'text': 'Descrição', 'score': 'Similaridade'}
+                ),
+                use_container_width=True,
+                hide_index=True
+            )
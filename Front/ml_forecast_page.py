@@ -2,13 +2,447 @@ import streamlit as st
 import pandas as pd
 import sys
 import os
+from contextlib import closing
 from datetime import datetime
-import plotly.graph_objects as go
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from End.Operations import SheetOperations
 from ML.demand_forecasting import DemandForecasting
 from ML.data_loader import DataLoader
+from ML.inventory_optimizer import remaining_budget, unit_costs_from_transactions
+from ML.job_runner import ACTIVE_STATES, DONE, QUEUED, STATUS_LABELS, get_job_runner
+
+
+JOB_STATE_KEYS = {
+    'forecast': 'job_forecast',
+    'recommendations': 'job_recommendations',
+    'backtest': 'job_backtest',
+    'compare': 'job_compare'
+}
+
+
+@st.fragment(run_every=3)
+def _poll_job(runner, job_id):
+    """Acompanha uma tarefa ativa e recarrega a página quando ela termina."""
+    status = runner.status(job_id)
+    
+    if status is None or status['status'] not in ACTIVE_STATES:
+        st.rerun()
+    
+    st.info(
+        f"{STATUS_LABELS[status['status']]}: {status['description']} (tarefa `{job_id}`). "
+        "Você pode navegar para outras páginas; o resultado ficará disponível aqui."
+    )
+    if status['status'] == QUEUED and st.button("⏹️ Cancelar tarefa", key=f"cancel_{job_id}"):
+        runner.cancel(job_id)
+        st.rerun()
+
+
+def _job_result(runner, state_key: str, empty_message: str):
+    """
+    Devolve o resultado da tarefa guardada em ``st.session_state[state_key]``.
+    
+    Enquanto a tarefa está ativa mostra o estado (atualizado periodicamente)
+    e devolve None; o resultado carregado do disco fica em cache na sessão.
+    """
+    job_id = st.session_state.get(state_key)
+    if not job_id:
+        return None
+    
+    cached = st.session_state.get(f"{state_key}_result")
+    if cached and cached[0] == job_id:
+        return cached[1]
+    
+    status = runner.status(job_id)
+    if status is None:
+        return None
+    
+    if status['status'] in ACTIVE_STATES:
+        _poll_job(runner, job_id)
+        return None
+    
+    if status['status'] == DONE:
+        result = runner.result(job_id)
+        if result is None:
+            st.error(empty_message)
+        else:
+            st.session_state[f"{state_key}_result"] = (job_id, result)
+        return result
+    
+    st.error(f"{STATUS_LABELS[status['status']]}: {status.get('error') or empty_message}")
+    return None
+
+
+def _jobs_panel(runner):
+    """Lista as tarefas recentes e permite reabrir resultados já calculados."""
+    jobs = [job for job in runner.list_jobs(limit=20) if job['kind'] in JOB_STATE_KEYS]
+    active = sum(job['status'] in ACTIVE_STATES for job in jobs)
+    
+    with st.expander(f"🗂️ Tarefas em Segundo Plano ({active} ativas)", expanded=False):
+        if not jobs:
+            st.info("Nenhuma tarefa executada ainda.")
+            return
+        
+        jobs_df = pd.DataFrame([{
+            'Tarefa': job['job_id'],
+            'Descrição': job.get('description', ''),
+            'Estado': STATUS_LABELS.get(job['status'], job['status']),
+            'Criada em': pd.to_datetime(job['created_at']).strftime('%d/%m/%Y %H:%M'),
+        } for job in jobs])
+        st.dataframe(jobs_df, hide_index=True, use_container_width=True)
+        
+        done_jobs = {job['job_id']: job for job in jobs if job['status'] == DONE}
+        if done_jobs:
+            col1, col2 = st.columns([3, 1])
+            selected_job = col1.selectbox(
+                "Abrir resultado:",
+                list(done_jobs),
+                format_func=lambda job_id: f"{done_jobs[job_id].get('description', '')} ({job_id})",
+                key="job_to_open"
+            )
+            if col2.button("📂 Abrir", key="btn_open_job"):
+                st.session_state[JOB_STATE_KEYS[done_jobs[selected_job]['kind']]] = selected_job
+                st.success("Resultado carregado na aba correspondente.")
+
+
+def _show_forecast(forecaster, df_prepared, predictions, epi_name):
+    """Resumo, gráficos e tabela de uma previsão."""
+    # Métricas de resumo
+    st.markdown("### 📊 Resumo da Previsão")
+    col1, col2, col3, col4 = st.columns(4)
+    
+    total_demand = predictions['ensemble_prediction'].sum()
+    avg_daily_demand = predictions['ensemble_prediction'].mean()
+    max_demand = predictions['ensemble_prediction'].max()
+    min_demand = predictions['ensemble_prediction'].min()
+    
+    col1.metric("Demanda Total Prevista", f"{total_demand:.0f}")
+    col2.metric("Média Diária", f"{avg_daily_demand:.1f}")
+    col3.metric("Pico Máximo", f"{max_demand:.0f}")
+    col4.metric("Mínimo", f"{min_demand:.0f}")
+    
+    # Gráfico de previsão
+    st.markdown("### 📈 Visualização da Previsão")
+    fig = forecaster.plot_forecast(df_prepared, predictions, epi_name)
+    st.plotly_chart(fig, use_container_width=True)
+    
+    # Comparação dos modelos
+    st.markdown("### 🔄 Comparação dos Modelos")
+    
+    model_columns = {
+        'prophet_prediction': 'Prophet',
+        'xgboost_prediction': 'XGBoost',
+        'lightgbm_prediction': 'LightGBM Global',
+        'intermittent_prediction': 'Intermitente (Croston/SBA)',
+        'ensemble_prediction': 'Ensemble'
+    }
+    available = [col for col in model_columns if col in predictions.columns]
+    comparison_df = predictions[['date'] + available].rename(
+        columns={'date': 'Data', **model_columns}
+    )
+    
+    st.line_chart(comparison_df.set_index('Data'))
+    
+    # Tabela de dados
+    with st.expander("📋 Ver Dados Detalhados"):
+        display_df = predictions.copy()
+        display_df['date'] = display_df['date'].dt.strftime('%d/%m/%Y')
+        quantile_columns = [col for col in ('p10', 'p50', 'p90') if col in display_df.columns]
+        display_df = display_df.rename(columns={
+            'date': 'Data',
+            'ensemble_prediction': 'Previsão',
+            'lower_bound': 'Limite Inferior',
+            'upper_bound': 'Limite Superior',
+            **{col: col.upper() for col in quantile_columns}
+        })
+        st.dataframe(
+            display_df[['Data', 'Previsão'] + [col.upper() for col in quantile_columns]
+                       + ['Limite Inferior', 'Limite Superior']],
+            hide_index=True
+        )
+        if quantile_columns:
+            st.caption(
+                "P10/P50/P90: quantis estimados com os erros de previsões de validação fora da "
+                "amostra, por faixa de horizonte, salvos no treino do agendador (EPIs sem modelo "
+                "salvo usam o intervalo do Prophet). A cobertura real ainda não foi medida: use-os "
+                "como referência da incerteza, não como garantia."
+            )
+
+
+def _show_recommendations(recommendations):
+    """Resumo, tabela e gráfico das recomendações de compra."""
+    # Exibir resumo
+    st.markdown("### 📋 Resumo das Recomendações")
+    
+    col1, col2, col3 = st.columns(3)
+    
+    criticas = len(recommendations[recommendations['prioridade'] == 'CRÍTICA'])
+    altas = len(recommendations[recommendations['prioridade'] == 'ALTA'])
+    
+    col1.metric("Compras Críticas", criticas, delta="Atenção!", delta_color="inverse")
+    col2.metric("Compras Alta Prioridade", altas)
+    col3.metric("Total de EPIs", len(recommendations))
+    
+    # Filtro por prioridade
+    st.markdown("### 🎯 Recomendações por Prioridade")
+    
+    prioridades = ['TODAS'] + recommendations['prioridade'].unique().tolist()
+    selected_priority = st.selectbox("Filtrar por prioridade:", prioridades)
+    
+    if selected_priority != 'TODAS':
+        filtered_recs = recommendations[recommendations['prioridade'] == selected_priority]
+    else:
+        filtered_recs = recommendations
+    
+    # Tabela de recomendações
+    display_recs = filtered_recs.copy()
+    display_recs = display_recs.rename(columns={
+        'epi': 'EPI',
+        'estoque_atual': 'Estoque Atual',
+        'demanda_prevista_90d': 'Demanda 90d',
+        'demanda_media_diaria': 'Média Diária',
+        'quantidade_recomendada': 'Qtd. Recomendada',
+        'prioridade': 'Prioridade',
+        'dias_cobertura': 'Dias de Cobertura'
+    })
+    
+    # Formatação
+    display_recs['Estoque Atual'] = display_recs['Estoque Atual'].apply(lambda x: f"{x:.0f}")
+    display_recs['Demanda 90d'] = display_recs['Demanda 90d'].apply(lambda x: f"{x:.0f}")
+    display_recs['Média Diária'] = display_recs['Média Diária'].apply(lambda x: f"{x:.1f}")
+    display_recs['Qtd. Recomendada'] = display_recs['Qtd. Recomendada'].apply(lambda x: f"{x:.0f}")
+    display_recs['Dias de Cobertura'] = display_recs['Dias de Cobertura'].apply(
+        lambda x: f"{x:.0f}" if x < 999 else "∞"
+    )
+    
+    st.dataframe(
+        display_recs[['EPI', 'Estoque Atual', 'Demanda 90d', 
+                     'Média Diária', 'Qtd. Recomendada', 
+                     'Dias de Cobertura', 'Prioridade']],
+        hide_index=True,
+        use_container_width=True
+    )
+    
+    # Gráfico de priorização
+    st.markdown("### 📊 Visualização de Prioridades")
+    
+    import plotly.express as px
+    
+    fig = px.bar(
+        recommendations,
+        x='epi',
+        y='quantidade_recomendada',
+        color='prioridade',
+        title='Quantidade Recomendada por EPI',
+        labels={
+            'epi': 'EPI',
+            'quantidade_recomendada': 'Quantidade',
+            'prioridade': 'Prioridade'
+        },
+        color_discrete_map={
+            'CRÍTICA': '#FF4444',
+            'ALTA': '#FF8800',
+            'MÉDIA': '#FFBB00',
+            'BAIXA': '#00CC66'
+        }
+    )
+    fig.update_layout(xaxis_tickangle=-45)
+    st.plotly_chart(fig, use_container_width=True)
+    
+    # Exportar recomendações
+    st.markdown("### 💾 Exportar Recomendações")
+    
+    csv = recommendations.to_csv(index=False)
+    st.download_button(
+        label="📥 Baixar CSV",
+        data=csv,
+        file_name=f"recomendacoes_compra_{datetime.now().strftime('%Y%m%d')}.csv",
+        mime="text/csv"
+    )
+
+
+def _show_stockout_risk(risk):
+    """Tabela da simulação de Monte Carlo: risco de ruptura e ponto de pedido."""
+    st.markdown("### 🎲 Risco de Ruptura (Simulação de Monte Carlo)")
+    
+    st.caption(
+        "Milhares de cenários de demanda sorteados a partir do intervalo de previsão. "
+        "O ponto de pedido cobre a demanda durante o prazo de reposição no nível de serviço indicado."
+    )
+    
+    risk = risk.sort_values('prob_ruptura', ascending=False)
+    col1, col2 = st.columns(2)
+    col1.metric("EPIs com risco de ruptura > 50%", int((risk['prob_ruptura'] > 0.5).sum()))
+    col2.metric("Falta esperada total (unid.)", f"{risk['falta_esperada'].sum():.0f}")
+    
+    rop_columns = [col for col in risk.columns if col.startswith('ponto_pedido_')]
+    display_risk = risk[['epi', 'estoque_atual', 'prob_ruptura', 'prob_ruptura_lead_time',
+                         'falta_esperada', 'dias_ate_ruptura_p50'] + rop_columns].rename(columns={
+        'epi': 'EPI',
+        'estoque_atual': 'Estoque Atual',
+        'prob_ruptura': 'Prob. Ruptura (horizonte)',
+        'prob_ruptura_lead_time': 'Prob. Ruptura (reposição)',
+        'falta_esperada': 'Falta Esperada',
+        'dias_ate_ruptura_p50': 'Dias até Ruptura (mediana)',
+        **{col: f"Ponto de Pedido {col.rsplit('_', 1)[1]}%" for col in rop_columns}
+    })
+    
+    st.dataframe(
+        display_risk,
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            'Prob. Ruptura (horizonte)': st.column_config.ProgressColumn(format="percent", min_value=0, max_value=1),
+            'Prob. Ruptura (reposição)': st.column_config.ProgressColumn(format="percent", min_value=0, max_value=1)
+        }
+    )
+
+
+def _show_purchase_plan(plan, budget=None):
+    """Plano de compras do otimizador: ponto de pedido, lote econômico e orçamento."""
+    st.markdown("### 🧮 Plano de Compras Otimizado")
+    
+    st.caption(
+        "Ponto de pedido pelo nível de serviço alvo, lote econômico (EOQ) limitado pela vida útil "
+        "em estoque e, se houver orçamento cadastrado, quantidades ajustadas priorizando o risco de ruptura."
+    )
+    
+    if plan is None or plan.empty:
+        st.info("Nenhum EPI com previsão para montar o plano de compras.")
+        return
+    
+    to_order = plan[plan['quantidade_pedido'] > 0]
+    col1, col2, col3 = st.columns(3)
+    col1.metric("EPIs a Pedir", len(to_order))
+    col2.metric("Custo do Plano", f"R$ {plan['custo_pedido'].sum():,.2f}")
+    if budget is not None:
+        col3.metric("Orçamento Disponível", f"R$ {budget:,.2f}",
+                    delta=f"R$ {budget - plan['custo_orcamento'].sum():,.2f} de saldo")
+    else:
+        col3.metric("Orçamento Disponível", "Não cadastrado")
+    
+    if budget is not None and plan['custo_pedido'].sum() > budget:
+        st.warning("⚠️ O plano completo excede o orçamento; veja a coluna 'Qtd. no Orçamento'.")
+    
+    if plan['custo_unitario'].eq(0).any():
+        st.caption("EPIs sem custo nas entradas usam a demanda do prazo de reposição como lote.")
+    
+    display_plan = to_order[['epi', 'estoque_atual', 'ponto_pedido', 'lote_economico', 'nivel_maximo',
+                             'quantidade_pedido', 'custo_unitario', 'custo_pedido',
+                             'quantidade_orcamento', 'prob_ruptura_lead_time']].rename(columns={
+        'epi': 'EPI',
+        'estoque_atual': 'Estoque Atual',
+        'ponto_pedido': 'Ponto de Pedido',
+        'lote_economico': 'Lote Econômico',
+        'nivel_maximo': 'Nível Máximo',
+        'quantidade_pedido': 'Qtd. a Pedir',
+        'custo_unitario': 'Custo Unit. (R$)',
+        'custo_pedido': 'Custo (R$)',
+        'quantidade_orcamento': 'Qtd. no Orçamento',
+        'prob_ruptura_lead_time': 'Prob. Ruptura (reposição)'
+    })
+    
+    st.dataframe(
+        display_plan,
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            'Custo Unit. (R$)': st.column_config.NumberColumn(format="%.2f"),
+            'Custo (R$)': st.column_config.NumberColumn(format="%.2f"),
+            'Prob. Ruptura (reposição)': st.column_config.ProgressColumn(format="percent", min_value=0, max_value=1)
+        }
+    )
+    
+    st.download_button(
+        label="📥 Baixar Plano de Compras (CSV)",
+        data=plan.to_csv(index=False),
+        file_name=f"plano_compras_{datetime.now().strftime('%Y%m%d')}.csv",
+        mime="text/csv"
+    )
+
+
+def _show_backtest(analyzer, backtest_result):
+    """Métricas, gráfico e interpretação de um backtest."""
+    st.success("Backtest concluído!")
+    
+    # Métricas principais
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("MAE Médio", f"{backtest_result['avg_mae']:.2f}")
+    col2.metric("RMSE Médio", f"{backtest_result['avg_rmse']:.2f}")
+    col3.metric("MAPE Médio", f"{backtest_result['avg_mape']:.1f}%")
+    col4.metric("Testes Realizados", backtest_result['num_backtests'])
+    
+    # Gráfico
+    fig = analyzer.plot_backtest_results(backtest_result)
+    if fig:
+        st.plotly_chart(fig, use_container_width=True)
+    
+    # Interpretação
+    st.markdown("### 📖 Interpretação dos Resultados")
+    
+    mape = backtest_result['avg_mape']
+    if mape < 10:
+        st.success(f"✅ Excelente! MAPE de {mape:.1f}% indica alta precisão.")
+    elif mape < 20:
+        st.info(f"ℹ️ Bom! MAPE de {mape:.1f}% indica precisão aceitável.")
+    elif mape < 30:
+        st.warning(f"⚠️ Moderado. MAPE de {mape:.1f}% indica que há espaço para melhoria.")
+    else:
+        st.error(f"❌ MAPE de {mape:.1f}% indica baixa precisão. Considere revisar os dados.")
+    
+    # Tabela de resultados
+    with st.expander("📋 Ver Resultados Detalhados"):
+        st.dataframe(
+            backtest_result['results'],
+            hide_index=True,
+            use_container_width=True
+        )
+
+
+def _show_comparison(analyzer, comparison_result):
+    """Ranking e gráfico da comparação entre métodos."""
+    st.success("Comparação concluída!")
+    
+    # Tabela de comparação
+    st.markdown("### 📊 Ranking de Métodos")
+    
+    comp_table = comparison_result['comparison_table'].copy()
+    comp_table['MAE'] = comp_table['MAE'].apply(lambda x: f"{x:.2f}")
+    comp_table['RMSE'] = comp_table['RMSE'].apply(lambda x: f"{x:.2f}")
+    comp_table['Rank'] = comp_table['Rank'].apply(lambda x: f"#{int(x)}")
+    
+    st.dataframe(
+        comp_table,
+        use_container_width=True,
+        column_config={
+            'Rank': st.column_config.TextColumn('Posição')
+        }
+    )
+    
+    # Identificar o melhor método
+    best_method = comp_table.index[0]
+    st.success(f"🏆 **Melhor Método**: {best_method}")
+    
+    # Gráfico comparativo
+    fig = analyzer.plot_method_comparison(comparison_result)
+    if fig:
+        st.plotly_chart(fig, use_container_width=True)
+    
+    # Insights
+    st.markdown("### 💡 Insights")
+    
+    if best_method == "ML Ensemble":
+        st.info("""
+        ✅ O ML Ensemble demonstrou o melhor desempenho, justificando o uso de 
+        algoritmos mais complexos para este EPI. Os modelos de Machine Learning 
+        estão capturando padrões que métodos tradicionais não conseguem identificar.
+        """)
+    else:
+        st.warning(f"""
+        ⚠️ O método {best_method} obteve melhor desempenho neste caso. 
+        Isso pode indicar que os dados para este EPI têm padrões simples que 
+        não justificam o uso de ML, ou que há necessidade de mais dados de treino.
+        """)
 
 
 def ml_forecast_page():
@@ -91,13 +525,18 @@ def ml_forecast_page():
     with col2:
         st.metric("Dias de Histórico", (df_prepared['date'].max() - df_prepared['date'].min()).days)
     with col3:
-        st.metric("Total de Transações", len(df_prepared))
+        # A série preparada tem um registro por dia, inclusive dias sem retirada
+        st.metric("Total de Transações", int((df_prepared['quantity'] > 0).sum()))
     with col4:
         avg_daily = df_prepared.groupby('date')['quantity'].sum().mean()
         st.metric("Média Diária", f"{avg_daily:.1f}")
     
     st.markdown("---")
     
+    # Tarefas pesadas rodam em processos separados; a página só acompanha o estado
+    runner = get_job_runner()
+    _jobs_panel(runner)
+    
     # Tabs principais
     tab1, tab2, tab3, tab4, tab5 = st.tabs([
         "📊 Previsão de Demanda", 
@@ -136,90 +575,34 @@ def ml_forecast_page():
                 value=95
             )
         
+        use_global_model = st.checkbox(
+            "Usar modelo global (LightGBM)",
+            value=False,
+            key="global_forecast",
+            help="Um único modelo treinado com todos os EPIs, usado também nos itens de demanda "
+                 "intermitente. Permite prever itens com menos de 30 dias desde a primeira retirada."
+        )
+        
         if st.button("🚀 Gerar Previsão", type="primary", key="btn_forecast"):
-            with st.spinner(f"Treinando modelos e gerando previsão para {selected_epi}..."):
-                
-                # Criar barra de progresso
-                progress_bar = st.progress(0)
-                status_text = st.empty()
-                
-                status_text.text("Preparando dados...")
-                progress_bar.progress(20)
-                
-                status_text.text("Treinando modelo XGBoost...")
-                progress_bar.progress(40)
-                
-                status_text.text("Treinando modelo Prophet...")
-                progress_bar.progress(60)
-                
-                # Fazer previsão
-                predictions = forecaster.predict_future_demand(
-                    df_prepared, 
-                    selected_epi, 
-                    days_ahead
-                )
-                
-                status_text.text("Gerando visualizações...")
-                progress_bar.progress(80)
-                
-                if predictions is not None:
-                    # Salvar no session state
-                    st.session_state['last_prediction'] = predictions
-                    st.session_state['last_epi'] = selected_epi
-                    
-                    progress_bar.progress(100)
-                    status_text.text("Concluído!")
-                    
-                    # Métricas de resumo
-                    st.markdown("### 📊 Resumo da Previsão")
-                    col1, col2, col3, col4 = st.columns(4)
-                    
-                    total_demand = predictions['ensemble_prediction'].sum()
-                    avg_daily_demand = predictions['ensemble_prediction'].mean()
-                    max_demand = predictions['ensemble_prediction'].max()
-                    min_demand = predictions['ensemble_prediction'].min()
-                    
-                    col1.metric("Demanda Total Prevista", f"{total_demand:.0f}")
-                    col2.metric("Média Diária", f"{avg_daily_demand:.1f}")
-                    col3.metric("Pico Máximo", f"{max_demand:.0f}")
-                    col4.metric("Mínimo", f"{min_demand:.0f}")
-                    
-                    # Gráfico de previsão
-                    st.markdown("### 📈 Visualização da Previsão")
-                    fig = forecaster.plot_forecast(df_prepared, predictions, selected_epi)
-                    st.plotly_chart(fig, use_container_width=True)
-                    
-                    # Comparação dos modelos
-                    st.markdown("### 🔄 Comparação dos Modelos")
-                    
-                    comparison_df = predictions[['date', 'prophet_prediction', 'xgboost_prediction', 'ensemble_prediction']].copy()
-                    comparison_df.columns = ['Data', 'Prophet', 'XGBoost', 'Ensemble']
-                    
-                    st.line_chart(comparison_df.set_index('Data'))
-                    
-                    # Tabela de dados
-                    with st.expander("📋 Ver Dados Detalhados"):
-                        display_df = predictions.copy()
-                        display_df['date'] = display_df['date'].dt.strftime('%d/%m/%Y')
-                        display_df = display_df.rename(columns={
-                            'date': 'Data',
-                            'ensemble_prediction': 'Previsão',
-                            'lower_bound': 'Limite Inferior',
-                            'upper_bound': 'Limite Superior'
-                        })
-                        st.dataframe(
-                            display_df[['Data', 'Previsão', 'Limite Inferior', 'Limite Superior']],
-                            hide_index=True
-                        )
-                    
-                    # Limpar
-                    progress_bar.empty()
-                    status_text.empty()
-                    
-                else:
-                    st.error("Não foi possível gerar a previsão. Verifique se há dados suficientes.")
-                    progress_bar.empty()
-                    status_text.empty()
+            st.session_state['job_forecast'] = runner.submit(
+                'forecast',
+                description=f"Previsão de {selected_epi} ({days_ahead} dias)",
+                df=df_prepared,
+                epi=selected_epi,
+                days_ahead=days_ahead,
+                use_global_model=use_global_model
+            )
+        
+        predictions = _job_result(
+            runner, 'job_forecast',
+            "Não foi possível gerar a previsão. Verifique se há dados suficientes."
+        )
+        if predictions is not None:
+            # Salvar no session state
+            st.session_state['last_prediction'] = predictions
+            st.session_state['last_epi'] = predictions['epi_name'].iloc[0]
+            
+            _show_forecast(forecaster, df_prepared, predictions, st.session_state['last_epi'])
     
     # TAB 2: RECOMENDAÇÕES DE COMPRA
     with tab2:
@@ -252,125 +635,40 @@ def ml_forecast_page():
             help="Quantidade de dias de demanda média a manter como margem de segurança"
         )
         
+        use_global_recs = st.checkbox(
+            "Usar modelo global (LightGBM)",
+            value=False,
+            key="global_recommendations",
+            help="Um único modelo para todos os EPIs, inclusive os intermitentes. Inclui EPIs com "
+                 "menos de 30 dias desde a primeira retirada, que não têm modelo individual."
+        )
+        
         if st.button("📊 Gerar Recomendações", type="primary", key="btn_recommendations"):
-            with st.spinner("Gerando recomendações inteligentes..."):
-                
-                all_predictions = []
-                epis_to_analyze = df_prepared['epi_name'].unique()
-                
-                progress = st.progress(0)
-                for idx, epi in enumerate(epis_to_analyze):
-                    pred = forecaster.predict_future_demand(df_prepared, epi, 90)
-                    if pred is not None:
-                        all_predictions.append(pred)
-                    progress.progress((idx + 1) / len(epis_to_analyze))
-                
-                progress.empty()
-                
-                if all_predictions:
-                    all_predictions_df = pd.concat(all_predictions, ignore_index=True)
-                    
-                    # Gerar recomendações
-                    recommendations = forecaster.generate_purchase_recommendations(
-                        all_predictions_df,
-                        current_stock,
-                        safety_days
-                    )
-                    
-                    # Salvar no session state
-                    st.session_state['recommendations'] = recommendations
-                    
-                    # Exibir resumo
-                    st.markdown("### 📋 Resumo das Recomendações")
-                    
-                    col1, col2, col3 = st.columns(3)
-                    
-                    criticas = len(recommendations[recommendations['prioridade'] == 'CRÍTICA'])
-                    altas = len(recommendations[recommendations['prioridade'] == 'ALTA'])
-                    
-                    col1.metric("Compras Críticas", criticas, delta="Atenção!", delta_color="inverse")
-                    col2.metric("Compras Alta Prioridade", altas)
-                    col3.metric("Total de EPIs", len(recommendations))
-                    
-                    # Filtro por prioridade
-                    st.markdown("### 🎯 Recomendações por Prioridade")
-                    
-                    prioridades = ['TODAS'] + recommendations['prioridade'].unique().tolist()
-                    selected_priority = st.selectbox("Filtrar por prioridade:", prioridades)
-                    
-                    if selected_priority != 'TODAS':
-                        filtered_recs = recommendations[recommendations['prioridade'] == selected_priority]
-                    else:
-                        filtered_recs = recommendations
-                    
-                    # Tabela de recomendações
-                    display_recs = filtered_recs.copy()
-                    display_recs = display_recs.rename(columns={
-                        'epi': 'EPI',
-                        'estoque_atual': 'Estoque Atual',
-                        'demanda_prevista_90d': 'Demanda 90d',
-                        'demanda_media_diaria': 'Média Diária',
-                        'quantidade_recomendada': 'Qtd. Recomendada',
-                        'prioridade': 'Prioridade',
-                        'dias_cobertura': 'Dias de Cobertura'
-                    })
-                    
-                    # Formatação
-                    display_recs['Estoque Atual'] = display_recs['Estoque Atual'].apply(lambda x: f"{x:.0f}")
-                    display_recs['Demanda 90d'] = display_recs['Demanda 90d'].apply(lambda x: f"{x:.0f}")
-                    display_recs['Média Diária'] = display_recs['Média Diária'].apply(lambda x: f"{x:.1f}")
-                    display_recs['Qtd. Recomendada'] = display_recs['Qtd. Recomendada'].apply(lambda x: f"{x:.0f}")
-                    display_recs['Dias de Cobertura'] = display_recs['Dias de Cobertura'].apply(
-                        lambda x: f"{x:.0f}" if x < 999 else "∞"
-                    )
-                    
-                    st.dataframe(
-                        display_recs[['EPI', 'Estoque Atual', 'Demanda 90d', 
-                                     'Média Diária', 'Qtd. Recomendada', 
-                                     'Dias de Cobertura', 'Prioridade']],
-                        hide_index=True,
-                        use_container_width=True
-                    )
-                    
-                    # Gráfico de priorização
-                    st.markdown("### 📊 Visualização de Prioridades")
-                    
-                    import plotly.express as px
-                    
-                    fig = px.bar(
-                        recommendations,
-                        x='epi',
-                        y='quantidade_recomendada',
-                        color='prioridade',
-                        title='Quantidade Recomendada por EPI',
-                        labels={
-                            'epi': 'EPI',
-                            'quantidade_recomendada': 'Quantidade',
-                            'prioridade': 'Prioridade'
-                        },
-                        color_discrete_map={
-                            'CRÍTICA': '#FF4444',
-                            'ALTA': '#FF8800',
-                            'MÉDIA': '#FFBB00',
-                            'BAIXA': '#00CC66'
-                        }
-                    )
-                    fig.update_layout(xaxis_tickangle=-45)
-                    st.plotly_chart(fig, use_container_width=True)
-                    
-                    # Exportar recomendações
-                    st.markdown("### 💾 Exportar Recomendações")
-                    
-                    csv = recommendations.to_csv(index=False)
-                    st.download_button(
-                        label="📥 Baixar CSV",
-                        data=csv,
-                        file_name=f"recomendacoes_compra_{datetime.now().strftime('%Y%m%d')}.csv",
-                        mime="text/csv"
-                    )
-                    
-                else:
-                    st.error("Não foi possível gerar recomendações.")
+            st.session_state['job_recommendations'] = runner.submit(
+                'recommendations',
+                description=f"Recomendações de compra ({safety_days} dias de segurança)",
+                df=df_prepared,
+                current_stock=current_stock,
+                safety_days=safety_days,
+                use_global_model=use_global_recs,
+                unit_costs=unit_costs_from_transactions(df),
+                budget=remaining_budget(df, sheet_operations.carregar_dados_budget())
+            )
+        
+        recommendations_result = _job_result(runner, 'job_recommendations', "Não foi possível gerar recomendações.")
+        if recommendations_result:
+            recommendations = recommendations_result['recommendations']
+            
+            # Salvar no session state
+            st.session_state['recommendations'] = recommendations
+            
+            _show_recommendations(recommendations)
+            
+            if recommendations_result.get('risk') is not None:
+                _show_stockout_risk(recommendations_result['risk'])
+            
+            if recommendations_result.get('purchase_plan') is not None:
+                _show_purchase_plan(recommendations_result['purchase_plan'], recommendations_result.get('budget'))
     
     # TAB 3: ANÁLISE DE SAZONALIDADE
     with tab3:
@@ -509,6 +807,7 @@ def ml_forecast_page():
                     st.markdown("### 🎯 Importância das Features (XGBoost)")
                     
                     import plotly.express as px
+                    import plotly.graph_objects as go
                     
                     fig = px.bar(
                         xgb_result['feature_importance'].head(10),
@@ -580,6 +879,25 @@ def ml_forecast_page():
                 else:
                     st.error("Dados insuficientes para treinar os modelos. São necessários pelo menos 30 dias de histórico.")
         
+        # Modelos treinados pelo agendador (apenas manifestos, sem carregar os modelos)
+        with st.expander("💾 Modelos Salvos pelo Agendador"):
+            from ML.model_registry import ModelRegistry
+            from ML.config import get_scheduler_config
+            
+            manifests = ModelRegistry(get_scheduler_config().models_dir).list_manifests()
+            if manifests:
+                saved_df = pd.DataFrame([{
+                    'EPI': m.get('epi_name'),
+                    'Treinado em': m.get('trained_at', m.get('saved_at')),
+                    'Modo': m.get('training_mode', '-'),
+                    'Registros': m.get('data_points'),
+                    'MAE XGBoost': (m.get('metrics', {}).get('xgboost') or {}).get('mae'),
+                    'MAE Prophet': (m.get('metrics', {}).get('prophet') or {}).get('mae')
+                } for m in manifests])
+                st.dataframe(saved_df, hide_index=True, use_container_width=True)
+            else:
+                st.info("Nenhum modelo salvo ainda. Execute o agendador (ML/model_scheduler.py).")
+        
         # Informações adicionais sobre os modelos
         with st.expander("ℹ️ Sobre os Modelos Utilizados"):
             st.markdown("""
@@ -680,51 +998,21 @@ def ml_forecast_page():
                 )
             
             if st.button("🚀 Executar Backtest", type="primary", key="btn_backtest"):
-                with st.spinner("Executando backtest... Isso pode levar alguns minutos."):
-                    backtest_result = analyzer.backtest_model(
-                        df_prepared,
-                        selected_epi_backtest,
-                        train_days,
-                        test_days
-                    )
-                    
-                    if backtest_result:
-                        st.success("Backtest concluído!")
-                        
-                        # Métricas principais
-                        col1, col2, col3, col4 = st.columns(4)
-                        col1.metric("MAE Médio", f"{backtest_result['avg_mae']:.2f}")
-                        col2.metric("RMSE Médio", f"{backtest_result['avg_rmse']:.2f}")
-                        col3.metric("MAPE Médio", f"{backtest_result['avg_mape']:.1f}%")
-                        col4.metric("Testes Realizados", backtest_result['num_backtests'])
-                        
-                        # Gráfico
-                        fig = analyzer.plot_backtest_results(backtest_result)
-                        if fig:
-                            st.plotly_chart(fig, use_container_width=True)
-                        
-                        # Interpretação
-                        st.markdown("### 📖 Interpretação dos Resultados")
-                        
-                        mape = backtest_result['avg_mape']
-                        if mape < 10:
-                            st.success(f"✅ Excelente! MAPE de {mape:.1f}% indica alta precisão.")
-                        elif mape < 20:
-                            st.info(f"ℹ️ Bom! MAPE de {mape:.1f}% indica precisão aceitável.")
-                        elif mape < 30:
-                            st.warning(f"⚠️ Moderado. MAPE de {mape:.1f}% indica que há espaço para melhoria.")
-                        else:
-                            st.error(f"❌ MAPE de {mape:.1f}% indica baixa precisão. Considere revisar os dados.")
-                        
-                        # Tabela de resultados
-                        with st.expander("📋 Ver Resultados Detalhados"):
-                            st.dataframe(
-                                backtest_result['results'],
-                                hide_index=True,
-                                use_container_width=True
-                            )
-                    else:
-                        st.error("Não foi possível executar o backtest. Verifique se há dados suficientes.")
+                st.session_state['job_backtest'] = runner.submit(
+                    'backtest',
+                    description=f"Backtest de {selected_epi_backtest} ({train_days}/{test_days} dias)",
+                    df=df_prepared,
+                    epi=selected_epi_backtest,
+                    train_size=int(train_days),
+                    test_size=int(test_days)
+                )
+            
+            backtest_result = _job_result(
+                runner, 'job_backtest',
+                "Não foi possível executar o backtest. Verifique se há dados suficientes."
+            )
+            if backtest_result:
+                _show_backtest(analyzer, backtest_result)
         
         with subtab2:
             st.markdown("### Comparação entre Métodos de Previsão")
@@ -744,57 +1032,16 @@ def ml_forecast_page():
             )
             
             if st.button("🏆 Comparar Métodos", type="primary", key="btn_compare"):
-                with st.spinner("Comparando diferentes métodos de previsão..."):
-                    comparison_result = analyzer.compare_forecast_methods(
-                        df_prepared,
-                        selected_epi_comp
-                    )
-                    
-                    if comparison_result:
-                        st.success("Comparação concluída!")
-                        
-                        # Tabela de comparação
-                        st.markdown("### 📊 Ranking de Métodos")
-                        
-                        comp_table = comparison_result['comparison_table'].copy()
-                        comp_table['MAE'] = comp_table['MAE'].apply(lambda x: f"{x:.2f}")
-                        comp_table['RMSE'] = comp_table['RMSE'].apply(lambda x: f"{x:.2f}")
-                        comp_table['Rank'] = comp_table['Rank'].apply(lambda x: f"#{int(x)}")
-                        
-                        st.dataframe(
-                            comp_table,
-                            use_container_width=True,
-                            column_config={
-                                'Rank': st.column_config.TextColumn('Posição')
-                            }
-                        )
-                        
-                        # Identificar o melhor método
-                        best_method = comp_table.index[0]
-                        st.success(f"🏆 **Melhor Método**: {best_method}")
-                        
-                        # Gráfico comparativo
-                        fig = analyzer.plot_method_comparison(comparison_result)
-                        if fig:
-                            st.plotly_chart(fig, use_container_width=True)
-                        
-                        # Insights
-                        st.markdown("### 💡 Insights")
-                        
-                        if best_method == "ML Ensemble":
-                            st.info("""
-                            ✅ O ML Ensemble demonstrou o melhor desempenho, justificando o uso de 
-                            algoritmos mais complexos para este EPI. Os modelos de Machine Learning 
-                            estão capturando padrões que métodos tradicionais não conseguem identificar.
-                            """)
-                        else:
-                            st.warning(f"""
-                            ⚠️ O método {best_method} obteve melhor desempenho neste caso. 
-                            Isso pode indicar que os dados para este EPI têm padrões simples que 
-                            não justificam o uso de ML, ou que há necessidade de mais dados de treino.
-                            """)
-                    else:
-                        st.error("Não foi possível executar a comparação.")
+                st.session_state['job_compare'] = runner.submit(
+                    'compare',
+                    description=f"Comparação de métodos: {selected_epi_comp}",
+                    df=df_prepared,
+                    epi=selected_epi_comp
+                )
+            
+            comparison_result = _job_result(runner, 'job_compare', "Não foi possível executar a comparação.")
+            if comparison_result:
+                _show_comparison(analyzer, comparison_result)
         
         with subtab3:
             st.markdown("### Relatório Completo de Performance")
@@ -805,60 +1052,93 @@ def ml_forecast_page():
             **Atenção**: Este processo pode levar vários minutos dependendo da quantidade de EPIs.
             """)
             
-            if st.button("📊 Gerar Relatório Completo", type="primary", key="btn_full_report"):
+            col_run, col_cancel = st.columns(2)
+            run_report = col_run.button("📊 Gerar Relatório Completo", type="primary", key="btn_full_report")
+            # Qualquer clique reinicia o script, o que interrompe a iteração e
+            # cancela os backtests pendentes; os resultados parciais ficam na sessão
+            col_cancel.button("⏹️ Cancelar", key="btn_cancel_report",
+                              help="Interrompe a análise mantendo os resultados já obtidos")
+            
+            if run_report:
                 epi_list = df_prepared['epi_name'].unique().tolist()
+                st.session_state['performance_report'] = None
+                st.session_state['performance_report_done'] = False
+                
+                progress_bar = st.progress(0)
+                status_text = st.empty()
+                partial_table = st.empty()
+                individual_results = {}
+                
+                with closing(analyzer.iter_performance_report(df_prepared, epi_list)) as report_items:
+                    for item in report_items:
+                        if item['result']:
+                            individual_results[item['epi']] = item['result']
+                        st.session_state['performance_report'] = analyzer.summarize_report(
+                            individual_results, len(epi_list)
+                        )
+                        
+                        progress_bar.progress(item['completed'] / item['total'])
+                        status_text.text(f"{item['completed']}/{item['total']} EPIs analisados (último: {item['epi']})")
+                        if individual_results:
+                            partial_table.dataframe(
+                                pd.DataFrame(individual_results).T.sort_values('avg_mae'),
+                                use_container_width=True
+                            )
+                
+                st.session_state['performance_report_done'] = True
+                status_text.empty()
+                progress_bar.empty()
+                partial_table.empty()
+            
+            report = st.session_state.get('performance_report')
+            if report is not None:
+                if not st.session_state.get('performance_report_done'):
+                    st.warning(
+                        f"Relatório parcial: análise interrompida com {len(report['individual_results'])} "
+                        f"de {report['epis_analyzed']} EPIs."
+                    )
+                elif report.get('summary_statistics'):
+                    st.success("Relatório gerado com sucesso!")
                 
-                with st.spinner(f"Analisando {len(epi_list)} EPIs... Por favor aguarde."):
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
+                if report.get('summary_statistics'):
+                    # Resumo executivo
+                    st.markdown("### 📋 Resumo Executivo")
                     
-                    report = analyzer.generate_performance_report(df_prepared, epi_list)
+                    stats = report['summary_statistics']
                     
-                    progress_bar.progress(100)
-                    status_text.empty()
-                    progress_bar.empty()
+                    col1, col2, col3 = st.columns(3)
+                    col1.metric("MAE Geral", f"{stats['overall_mae']:.2f}")
+                    col2.metric("RMSE Geral", f"{stats['overall_rmse']:.2f}")
+                    col3.metric("MAPE Geral", f"{stats['overall_mape']:.1f}%")
                     
-                    if report and report.get('summary_statistics'):
-                        st.success("Relatório gerado com sucesso!")
-                        
-                        # Resumo executivo
-                        st.markdown("### 📋 Resumo Executivo")
-                        
-                        stats = report['summary_statistics']
-                        
-                        col1, col2, col3 = st.columns(3)
-                        col1.metric("MAE Geral", f"{stats['overall_mae']:.2f}")
-                        col2.metric("RMSE Geral", f"{stats['overall_rmse']:.2f}")
-                        col3.metric("MAPE Geral", f"{stats['overall_mape']:.1f}%")
-                        
-                        col1, col2 = st.columns(2)
-                        col1.success(f"🏆 Melhor EPI: **{stats['best_epi']}**")
-                        col2.error(f"⚠️ EPI com maior erro: **{stats['worst_epi']}**")
-                        
-                        # Gráfico resumo
-                        fig = analyzer.plot_performance_summary(report)
-                        if fig:
-                            st.plotly_chart(fig, use_container_width=True)
-                        
-                        # Tabela detalhada
-                        with st.expander("📊 Ver Resultados Individuais"):
-                            individual_df = pd.DataFrame(report['individual_results']).T
-                            individual_df = individual_df.sort_values('avg_mae')
-                            individual_df.columns = ['MAE Médio', 'RMSE Médio', 'MAPE Médio', 'Nº Testes']
-                            st.dataframe(individual_df, use_container_width=True)
-                        
-                        # Exportar relatório
-                        import json
-                        report_json = json.dumps(report, indent=2, default=str)
-                        
-                        st.download_button(
-                            label="💾 Baixar Relatório JSON",
-                            data=report_json,
-                            file_name=f"performance_report_{datetime.now().strftime('%Y%m%d')}.json",
-                            mime="application/json"
-                        )
-                    else:
-                        st.error("Não foi possível gerar o relatório.")
+                    col1, col2 = st.columns(2)
+                    col1.success(f"🏆 Melhor EPI: **{stats['best_epi']}**")
+                    col2.error(f"⚠️ EPI com maior erro: **{stats['worst_epi']}**")
+                    
+                    # Gráfico resumo
+                    fig = analyzer.plot_performance_summary(report)
+                    if fig:
+                        st.plotly_chart(fig, use_container_width=True)
+                    
+                    # Tabela detalhada
+                    with st.expander("📊 Ver Resultados Individuais"):
+                        individual_df = pd.DataFrame(report['individual_results']).T
+                        individual_df = individual_df.sort_values('avg_mae')
+                        individual_df.columns = ['MAE Médio', 'RMSE Médio', 'MAPE Médio', 'Nº Testes']
+                        st.dataframe(individual_df, use_container_width=True)
+                    
+                    # Exportar relatório
+                    import json
+                    report_json = json.dumps(report, indent=2, default=str)
+                    
+                    st.download_button(
+                        label="💾 Baixar Relatório JSON",
+                        data=report_json,
+                        file_name=f"performance_report_{datetime.now().strftime('%Y%m%d')}.json",
+                        mime="application/json"
+                    )
+                else:
+                    st.error("Não foi possível gerar o relatório.")
         
         # Informações adicionais sobre os modelos
         with st.expander("ℹ️ Sobre os Modelos Utilizados"):
@@ -1,15 +1,35 @@
 """
 Módulo de Machine Learning para previsão de demanda
+
+Os submódulos pesados são importados sob demanda: ``from ML import
+DemandForecasting`` só carrega prophet, xgboost e lightgbm quando a classe
+é acessada, e ``import ML.config`` não paga esse custo.
 """
+import importlib
 
-from .demand_forecasting import DemandForecasting
-from .performance_analyzer import PerformanceAnalyzer
-from .data_loader import DataLoader
 from .config import config
 
+_LAZY_EXPORTS = {
+    'DemandForecasting': 'ML.demand_forecasting',
+    'PerformanceAnalyzer': 'ML.performance_analyzer',
+    'DataLoader': 'ML.data_loader'
+}
+
 __all__ = [
     'DemandForecasting',
     'PerformanceAnalyzer',
     'DataLoader',
     'config'
 ]
+
+
+def __getattr__(name):
+    if name in _LAZY_EXPORTS:
+        value = getattr(importlib.import_module(_LAZY_EXPORTS[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module 'ML' has no attribute '{name}'")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
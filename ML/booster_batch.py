@@ -0,0 +1,114 @@
+"""
+Previsão em lote com vários boosters XGBoost, um por linha da matriz
+"""
+import json
+import logging
+from typing import List
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# Objetivos cuja previsão é a soma das folhas mais o base_score (sem link)
+IDENTITY_OBJECTIVES = {'reg:squarederror', 'reg:absoluteerror', 'reg:pseudohubererror'}
+
+
+def _learner(booster) -> dict:
+    return json.loads(booster.save_raw('json'))['learner']
+
+
+def _base_score(learner: dict) -> float:
+    # XGBoost 2.x grava "5E-1"; o 3.x grava um vetor "[5E-1]"
+    return float(learner['learner_model_param']['base_score'].strip('[]'))
+
+
+class BoosterBatch:
+    """
+    As árvores de vários boosters XGBoost em arrays únicos, para prever a
+    linha ``i`` de uma matriz com o booster ``i`` em uma só passada.
+
+    Substitui ``n`` chamadas a ``inplace_predict`` com uma linha cada (uma
+    por EPI, a cada dia da previsão recursiva) por um percurso vetorizado
+    de todas as árvores de todos os EPIs: um passo por nível de
+    profundidade. Os resultados são os de ``inplace_predict`` (soma em
+    float64, diferenças da ordem de 1e-6).
+
+    Só boosters ``gbtree`` com objetivo de regressão sem função de ligação e
+    sem splits categóricos são aceitos (ver ``supports``).
+    """
+
+    def __init__(self, boosters: List):
+        learners = [_learner(booster) for booster in boosters]
+        trees = [learner['gradient_booster']['model']['trees'] for learner in learners]
+
+        # Nó 0: folha de valor zero, raiz das árvores de preenchimento dos
+        # boosters com menos árvores
+        left, right, feature, threshold, default_left, value = [[-1]], [[-1]], [[0]], [[0.0]], [[0]], [[0.0]]
+        n_trees = max(len(epi_trees) for epi_trees in trees)
+        self.roots = np.zeros((len(boosters), n_trees), dtype=np.int64)
+        offset = 1
+        for i, epi_trees in enumerate(trees):
+            for t, tree in enumerate(epi_trees):
+                children_left = np.asarray(tree['left_children'], dtype=np.int64)
+                is_leaf = children_left == -1
+                conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+
+                left.append(np.where(is_leaf, -1, children_left + offset))
+                right.append(np.where(is_leaf, -1, np.asarray(tree['right_children'], dtype=np.int64) + offset))
+                feature.append(np.where(is_leaf, 0, tree['split_indices']))
+                threshold.append(conditions)
+                default_left.append(tree['default_left'])
+                # Nas folhas, ``split_conditions`` guarda o valor da folha
+                value.append(np.where(is_leaf, conditions, 0.0))
+
+                self.roots[i, t] = offset
+                offset += len(children_left)
+
+        self.left = np.concatenate(left)
+        self.right = np.concatenate(right)
+        self.feature = np.concatenate(feature).astype(np.int64)
+        self.threshold = np.concatenate(threshold).astype(np.float32)
+        self.default_left = np.concatenate(default_left).astype(bool)
+        self.value = np.concatenate(value).astype(np.float64)
+        self.base_score = np.array([_base_score(learner) for learner in learners])
+
+    @staticmethod
+    def supports(boosters: List) -> bool:
+        """True se todos os boosters podem ser avaliados por esta classe."""
+        for booster in boosters:
+            learner = _learner(booster)
+            if learner['gradient_booster']['name'] != 'gbtree':
+                return False
+            if learner['objective']['name'] not in IDENTITY_OBJECTIVES:
+                return False
+            if int(learner['learner_model_param'].get('num_target', '1')) > 1:
+                return False
+            if any(any(tree['split_type']) for tree in learner['gradient_booster']['model']['trees']):
+                return False
+        return True
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """
+        Previsão da linha ``i`` de ``X`` com o booster ``i``.
+
+        Args:
+            X: Matriz ``[n_boosters, n_features]`` (NaN = valor ausente)
+
+        Returns:
+            Array ``[n_boosters]``
+        """
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(X))[:, None]
+        node = self.roots.copy()
+
+        while True:
+            internal = self.left[node] != -1
+            if not internal.any():
+                break
+            values = X[rows, self.feature[node]]
+            go_left = np.where(np.isnan(values), self.default_left[node], values < self.threshold[node])
+            node = np.where(internal, np.where(go_left, self.left[node], self.right[node]), node)
+
+        return self.base_score + self.value[node].sum(axis=1)
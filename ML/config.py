@@ -16,9 +16,25 @@ class ModelConfig:
     # Prophet
     prophet_params: Dict = None
     
+    # LightGBM (modelo global para todos os EPIs)
+    lightgbm_params: Dict = None
+    
     # Ensemble
     ensemble_weights: Dict = None
     
+    # Demanda intermitente (Croston/SBA/TSB)
+    use_intermittent_fast_path: bool = True
+    intermittent_method: str = 'sba'  # croston, sba, tsb
+    intermittent_alpha: float = 0.1
+    intermittent_beta: float = 0.1
+    
+    # Previsão por quantil (intervalos conformes com resíduos de validação)
+    quantiles: List[float] = None
+    quantile_origin_step: int = 7  # Dias entre as origens das previsões de validação
+    # Sem resíduos salvos pelo agendador, reajusta um Prophet de validação na
+    # previsão para calibrar os quantis (dobra o custo; padrão: intervalo do Prophet)
+    quantile_refit_residuals: bool = False
+    
     # Features
     lag_periods: List[int] = None
     rolling_windows: List[int] = None
@@ -50,12 +66,27 @@ class ModelConfig:
                 'changepoint_prior_scale': 0.05
             }
         
+        if self.lightgbm_params is None:
+            self.lightgbm_params = {
+                'n_estimators': 300,
+                'num_leaves': 31,
+                'learning_rate': 0.05,
+                'min_child_samples': 10,
+                'random_state': self.random_state,
+                'objective': 'regression',
+                'n_jobs': -1,
+                'verbose': -1
+            }
+        
         if self.ensemble_weights is None:
             self.ensemble_weights = {
                 'xgboost': 0.5,
                 'prophet': 0.5
             }
         
+        if self.quantiles is None:
+            self.quantiles = [0.1, 0.5, 0.9]
+        
         if self.lag_periods is None:
             self.lag_periods = [7, 14, 30]
         
@@ -80,7 +111,26 @@ class ForecastConfig:
     # Níveis de prioridade (dias de cobertura)
     priority_levels: Dict = None
     
+    # Simulação de estoque (Monte Carlo)
+    default_lead_time_days: int = 15  # Prazo entre o pedido e a entrega
+    n_simulations: int = 1000
+    service_levels: List[float] = None
+    prophet_interval_width: float = 0.8  # Cobertura de yhat_lower/yhat_upper
+    
+    # Otimização de compras (ponto de pedido / lote econômico)
+    target_service_level: float = 0.95
+    ordering_cost: float = 50.0  # Custo fixo por pedido (R$)
+    holding_cost_rate: float = 0.25  # Custo anual de manter estoque (fração do valor)
+    shelf_life_days: Dict = None  # Vida útil em estoque por palavra-chave do EPI
+    
     def __post_init__(self):
+        if self.shelf_life_days is None:
+            # Botinas: o solado degrada após 1 ano em estoque
+            self.shelf_life_days = {'botina': 365}
+        
+        if self.service_levels is None:
+            self.service_levels = [0.90, 0.95, 0.99]
+        
         if self.priority_levels is None:
             self.priority_levels = {
                 'CRÍTICA': 0,      # Sem estoque
@@ -109,6 +159,10 @@ class DataConfig:
     # Validação
     validate_dates: bool = True
     validate_quantities: bool = True
+    
+    # Feature store (features preparadas em Parquet, por EPI)
+    use_feature_store: bool = True
+    feature_store_max_parts: int = 20  # Arquivos por EPI antes de compactar
 
 
 @dataclass
@@ -143,6 +197,11 @@ class SchedulerConfig:
     retrain_all_epis: bool = True
     priority_epis: List[str] = None
     
+    # Retreinamento incremental
+    incremental_retrain: bool = True
+    incremental_boost_rounds: int = 20  # Árvores adicionadas por atualização
+    max_incremental_updates: int = 8  # Após N atualizações, retreino completo
+    
     # Armazenamento
     models_dir: str = 'ML/saved_models'
     keep_n_versions: int = 3  # Manter últimas N versões
@@ -156,6 +215,21 @@ class SchedulerConfig:
             self.priority_epis = []
 
 
+@dataclass
+class TuningConfig:
+    """Configurações da busca de hiperparâmetros"""
+    
+    # Orçamento e busca
+    time_budget: int = 300  # Segundos por EPI e por modelo
+    n_candidates: int = 27  # Configurações sorteadas no primeiro nível
+    halving_factor: int = 3  # Fração de candidatos mantida a cada nível (1/N)
+    cv_splits: int = 3  # Dobras da validação temporal (TimeSeriesSplit)
+    n_jobs: int = None  # Treinos em paralelo (padrão: config.max_workers)
+    
+    # Uso dos parâmetros ajustados no treino
+    use_tuned_params: bool = True
+
+
 @dataclass
 class SystemConfig:
     """Configuração geral do sistema"""
@@ -165,6 +239,7 @@ class SystemConfig:
     data: DataConfig = None
     performance: PerformanceConfig = None
     scheduler: SchedulerConfig = None
+    tuning: TuningConfig = None
     
     # Paths
     base_dir: str = os.path.dirname(os.path.abspath(__file__))
@@ -179,6 +254,10 @@ class SystemConfig:
     use_multiprocessing: bool = True
     max_workers: int = 4
     
+    # Tarefas em segundo plano: quantas manter em cache_dir/jobs (as mais
+    # antigas que já terminaram são apagadas)
+    max_jobs: int = 50
+    
     def __post_init__(self):
         if self.model is None:
             self.model = ModelConfig()
@@ -195,16 +274,18 @@ class SystemConfig:
         if self.scheduler is None:
             self.scheduler = SchedulerConfig()
         
+        if self.tuning is None:
+            self.tuning = TuningConfig()
+        
         if self.cache_dir is None:
             self.cache_dir = os.path.join(self.base_dir, 'cache')
         
         if self.logs_dir is None:
             self.logs_dir = os.path.join(self.base_dir, '../logs')
         
-        # Criar diretórios se não existirem
-        os.makedirs(self.cache_dir, exist_ok=True)
-        os.makedirs(self.logs_dir, exist_ok=True)
-        os.makedirs(self.scheduler.models_dir, exist_ok=True)
+        # Os diretórios não são criados na importação: cada componente
+        # (registro de modelos, tarefas, feature store) cria o seu no
+        # primeiro uso
 
 
 # Instância global de configuração
@@ -237,6 +318,24 @@ def get_scheduler_config() -> SchedulerConfig:
     return config.scheduler
 
 
+def get_tuning_config() -> TuningConfig:
+    """Retorna configurações da busca de hiperparâmetros"""
+    return config.tuning
+
+
+def apply_config(snapshot: SystemConfig):
+    """
+    Copia para a configuração global deste processo os valores de
+    ``snapshot``, no lugar (quem fez ``from ML.config import config`` vê os
+    novos valores).
+    
+    Usado como ``initializer`` dos pools ``spawn``: os processos novos
+    importam este módulo com os valores padrão e perderiam os ajustes feitos
+    em tempo de execução no processo principal.
+    """
+    config.__dict__.update(snapshot.__dict__)
+
+
 # Função para carregar configuração customizada
 def load_custom_config(config_file: str):
     """
@@ -276,6 +375,9 @@ def load_custom_config(config_file: str):
     if 'scheduler' in custom_config:
         config.scheduler = SchedulerConfig(**custom_config['scheduler'])
     
+    if 'tuning' in custom_config:
+        config.tuning = TuningConfig(**custom_config['tuning'])
+    
     return config
 
 
@@ -295,7 +397,8 @@ def save_config(output_file: str):
         'forecast': asdict(config.forecast),
         'data': asdict(config.data),
         'performance': asdict(config.performance),
-        'scheduler': asdict(config.scheduler)
+        'scheduler': asdict(config.scheduler),
+        'tuning': asdict(config.tuning)
     }
     
     _, ext = os.path.splitext(output_file)
@@ -0,0 +1,177 @@
+"""
+Previsões por quantil (P10/P50/P90) a partir de resíduos de validação
+"""
+import numpy as np
+import logging
+from typing import Dict, List, Optional
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# Mínimo de resíduos para calibrar um EPI com os próprios erros
+MIN_RESIDUALS = 10
+
+# Faixas de horizonte (último dia de cada uma) com resíduos calibrados
+# separadamente: 1-7, 8-30, 31-90 e 91+ dias à frente
+HORIZON_BANDS = [7, 30, 90]
+
+
+def quantile_column(q: float) -> str:
+    """Nome da coluna de um quantil (0.1 -> ``p10``)."""
+    return f"p{int(round(q * 100))}"
+
+
+def conformal_offsets(residuals: np.ndarray, quantiles: List[float]) -> np.ndarray:
+    """
+    Deslocamentos da previsão pontual para cada quantil (conformal split).
+    
+    Usa os quantis empíricos dos resíduos ``real - previsto`` de um período
+    de validação que o modelo não viu, com a correção de amostra finita
+    ``ceil((n + 1)·q) / n``, de modo que ``previsão + deslocamento`` cubra o
+    valor real com a frequência pedida.
+    
+    Args:
+        residuals: Resíduos de validação de um EPI
+        quantiles: Quantis desejados (ex.: ``[0.1, 0.5, 0.9]``)
+    
+    Returns:
+        Array com um deslocamento por quantil
+    """
+    residuals = np.asarray(residuals, dtype=float)
+    residuals = residuals[np.isfinite(residuals)]
+    n = len(residuals)
+    if n == 0:
+        return np.zeros(len(quantiles))
+    
+    def upper(values, q):
+        return np.quantile(values, min(np.ceil((n + 1) * q) / n, 1.0), method='higher')
+    
+    # Quantis inferiores: mesma correção aplicada à cauda espelhada
+    return np.array([upper(residuals, q) if q >= 0.5 else -upper(-residuals, 1 - q) for q in quantiles])
+
+
+def horizon_band(horizons) -> np.ndarray:
+    """Faixa de ``HORIZON_BANDS`` de cada horizonte (1 = dia seguinte)."""
+    return np.searchsorted(HORIZON_BANDS, np.asarray(horizons), side='left')
+
+
+def horizon_offsets(residuals: Dict[str, np.ndarray], quantiles: List[float], days_ahead: int) -> Optional[np.ndarray]:
+    """
+    Deslocamentos de cada quantil para cada dia do horizonte, com os
+    resíduos da faixa de horizonte correspondente.
+    
+    Faixas com menos de ``MIN_RESIDUALS`` resíduos usam a faixa medida mais
+    próxima (horizontes além do período de validação usam a mais longa).
+    
+    Args:
+        residuals: ``{'horizon': [...], 'residual': [...]}`` das previsões
+            de validação de um EPI
+        quantiles: Quantis desejados
+        days_ahead: Horizonte da previsão
+    
+    Returns:
+        Array ``[n_quantis, days_ahead]`` ou None se não houver resíduos suficientes
+    """
+    horizons = np.asarray(residuals['horizon'])
+    values = np.asarray(residuals['residual'], dtype=float)
+    if np.isfinite(values).sum() < MIN_RESIDUALS:
+        return None
+    
+    bands = horizon_band(horizons)
+    by_band = [None] * (len(HORIZON_BANDS) + 1)
+    for band in range(len(by_band)):
+        band_values = values[bands == band]
+        if np.isfinite(band_values).sum() >= MIN_RESIDUALS:
+            by_band[band] = conformal_offsets(band_values, quantiles)
+    
+    measured = [band for band, offsets in enumerate(by_band) if offsets is not None]
+    if not measured:
+        # Nenhuma faixa sozinha tem resíduos suficientes: todas juntas
+        offsets = conformal_offsets(values, quantiles)
+        return np.repeat(offsets[:, None], days_ahead, axis=1)
+    
+    for band in range(len(by_band)):
+        if by_band[band] is None:
+            nearest = min(measured, key=lambda m: (abs(m - band), -m))
+            by_band[band] = by_band[nearest]
+    
+    table = np.stack(by_band, axis=1)
+    return table[:, horizon_band(np.arange(1, days_ahead + 1))]
+
+
+def quantile_forecast(
+    point: np.ndarray,
+    residuals: List[Dict[str, np.ndarray]],
+    quantiles: List[float],
+    fallback_sigma: np.ndarray = None
+) -> Dict[str, np.ndarray]:
+    """
+    Quantis da previsão de vários EPIs de uma vez.
+    
+    Args:
+        point: Previsão pontual ``[n_epis, n_dias]``
+        residuals: Resíduos das previsões de validação de cada EPI, por
+            horizonte (ver ``horizon_offsets``); None se não houver
+        quantiles: Quantis desejados
+        fallback_sigma: Desvio ``[n_epis, n_dias]`` para EPIs sem resíduos
+            suficientes (quantis da normal)
+    
+    Returns:
+        Dict ``{'p10': [n_epis, n_dias], ...}``, sem valores negativos e
+        com os quantis em ordem crescente
+    """
+    from scipy.stats import norm
+    
+    n_epis, days_ahead = point.shape
+    offsets = np.zeros((n_epis, len(quantiles), days_ahead))
+    calibrated = np.zeros(n_epis, dtype=bool)
+    for i, epi_residuals in enumerate(residuals):
+        if epi_residuals is not None:
+            epi_offsets = horizon_offsets(epi_residuals, quantiles, days_ahead)
+            if epi_offsets is not None:
+                offsets[i] = epi_offsets
+                calibrated[i] = True
+    
+    z = norm.ppf(quantiles)
+    values = point[:, None, :] + offsets
+    if fallback_sigma is not None and (~calibrated).any():
+        values[~calibrated] = point[~calibrated, None, :] + z[None, :, None] * fallback_sigma[~calibrated, None, :]
+    
+    # Ordem monotônica entre os quantis e sem demanda negativa
+    values = np.maximum.accumulate(np.maximum(values, 0), axis=1)
+    return {quantile_column(q): values[:, j, :] for j, q in enumerate(quantiles)}
+
+
+def intermittent_quantiles(
+    rate: np.ndarray,
+    size: np.ndarray,
+    demand_sizes: List[np.ndarray],
+    quantiles: List[float]
+) -> Dict[str, np.ndarray]:
+    """
+    Quantis diários da demanda intermitente de cada EPI: sem retirada com
+    probabilidade ``1 - rate / size``; com retirada, o tamanho segue a
+    distribuição empírica das retiradas já observadas do EPI.
+    
+    Args:
+        rate: Demanda diária esperada de cada EPI
+        size: Tamanho médio (suavizado) de uma retirada de cada EPI
+        demand_sizes: Quantidades dos dias com retirada de cada EPI
+        quantiles: Quantis desejados
+    
+    Returns:
+        Dict ``{'p10': [n_epis], ...}``
+    """
+    prob = np.clip(rate / np.maximum(size, 1e-9), 0, 1)
+    values = np.zeros((len(rate), len(quantiles)))
+    for i, sizes in enumerate(demand_sizes):
+        sizes = np.asarray(sizes, dtype=float)
+        if len(sizes) == 0:
+            sizes = np.array([size[i]])
+        for j, q in enumerate(quantiles):
+            if prob[i] > 0 and q > 1 - prob[i]:
+                # Posição do quantil dentro da distribuição dos dias com retirada
+                level = (q - (1 - prob[i])) / prob[i]
+                values[i, j] = np.quantile(sizes, min(level, 1.0), method='inverted_cdf')
+    return {quantile_column(q): values[:, j] for j, q in enumerate(quantiles)}
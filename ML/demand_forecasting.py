@@ -2,27 +2,37 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import logging
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import warnings
 warnings.filterwarnings('ignore')
 
-# ML Libraries
-from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
-import xgboost as xgb
-import lightgbm as lgb
-from prophet import Prophet
+# As bibliotecas de ML (sklearn, xgboost, lightgbm, prophet) e o plotly são
+# importados dentro dos métodos que os usam: importar este módulo não custa
+# os segundos de carregamento delas
 
-# Plotting
-import plotly.graph_objects as go
-import plotly.express as px
-from plotly.subplots import make_subplots
+from ML.config import config
+from ML.recursive_forecaster import RecursiveForecaster
+from ML.booster_batch import BoosterBatch
+from ML.conformal import intermittent_quantiles, quantile_forecast
+from ML.feature_store import FeatureStore, add_features, aggregate_daily
+from ML.intermittent_demand import (
+    INTERMITTENT_CLASSES,
+    build_daily_matrix,
+    classify_demand,
+    intermittent_forecast
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+FEATURE_COLS = [
+    'year', 'month', 'day', 'dayofweek', 'quarter', 'weekofyear',
+    'is_weekend', 'lag_7', 'lag_14', 'lag_30',
+    'rolling_mean_7', 'rolling_mean_30', 'rolling_std_7'
+]
+
+
 class DemandForecasting:
     """
     Sistema avançado de previsão de demanda para EPIs usando múltiplos modelos de ML.
@@ -33,63 +43,75 @@ class DemandForecasting:
         self.scalers = {}
         self.feature_importance = {}
         self.predictions_cache = {}
+        self.tuned_params = {}
+        self.stored_residuals = {}
         
-    def prepare_data(self, df: pd.DataFrame) -> pd.DataFrame:
+    def prepare_data(self, df: pd.DataFrame, use_feature_store: bool = None) -> pd.DataFrame:
         """
         Prepara os dados para modelagem ML.
         
+        Com o feature store ativo (``config.data.use_feature_store``), as
+        features já calculadas são lidas do disco e só os dias novos são
+        processados (ver ``ML.feature_store``).
+        
         Args:
             df: DataFrame com histórico de transações
+            use_feature_store: Sobrescreve ``config.data.use_feature_store``
             
         Returns:
             DataFrame processado e enriquecido com features
         """
         logger.info("Preparando dados para modelagem...")
         
-        # Filtrar apenas saídas
-        df_saidas = df[df['transaction_type'].str.lower() == 'saída'].copy()
-        
-        # Converter datas
-        df_saidas['date'] = pd.to_datetime(df_saidas['date'], errors='coerce')
-        df_saidas['quantity'] = pd.to_numeric(df_saidas['quantity'], errors='coerce').fillna(0)
-        
-        # Remover linhas sem data
-        df_saidas = df_saidas.dropna(subset=['date'])
-        
-        # Agregar por dia e EPI
-        df_agg = df_saidas.groupby([
-            pd.Grouper(key='date', freq='D'),
-            'epi_name'
-        ])['quantity'].sum().reset_index()
-        
-        # Criar features temporais
-        df_agg['year'] = df_agg['date'].dt.year
-        df_agg['month'] = df_agg['date'].dt.month
-        df_agg['day'] = df_agg['date'].dt.day
-        df_agg['dayofweek'] = df_agg['date'].dt.dayofweek
-        df_agg['quarter'] = df_agg['date'].dt.quarter
-        df_agg['weekofyear'] = df_agg['date'].dt.isocalendar().week
-        df_agg['is_weekend'] = df_agg['dayofweek'].isin([5, 6]).astype(int)
-        
-        # Features de lag (valores anteriores)
-        for epi in df_agg['epi_name'].unique():
-            mask = df_agg['epi_name'] == epi
-            df_agg.loc[mask, 'lag_7'] = df_agg.loc[mask, 'quantity'].shift(7).fillna(0)
-            df_agg.loc[mask, 'lag_14'] = df_agg.loc[mask, 'quantity'].shift(14).fillna(0)
-            df_agg.loc[mask, 'lag_30'] = df_agg.loc[mask, 'quantity'].shift(30).fillna(0)
-            
-            # Médias móveis
-            df_agg.loc[mask, 'rolling_mean_7'] = df_agg.loc[mask, 'quantity'].rolling(7, min_periods=1).mean()
-            df_agg.loc[mask, 'rolling_mean_30'] = df_agg.loc[mask, 'quantity'].rolling(30, min_periods=1).mean()
-            df_agg.loc[mask, 'rolling_std_7'] = df_agg.loc[mask, 'quantity'].rolling(7, min_periods=1).std().fillna(0)
+        if use_feature_store is None:
+            use_feature_store = config.data.use_feature_store
+        
+        if use_feature_store:
+            try:
+                df_agg = FeatureStore().prepared(df)
+                logger.info(f"Dados preparados: {len(df_agg)} registros")
+                return df_agg
+            except Exception as e:
+                logger.warning(f"Feature store indisponível, recalculando as features: {e}")
+        
+        # Filtrar apenas saídas e agregar por dia e EPI
+        df_agg = add_features(aggregate_daily(df))
         
         logger.info(f"Dados preparados: {len(df_agg)} registros")
         return df_agg
     
+    def model_params(self, epi_name: str, model_name: str) -> Dict:
+        """
+        Parâmetros de um modelo para o EPI: os de ``config.model``,
+        sobrescritos pelos encontrados na busca de hiperparâmetros
+        (``ML.hyperparameter_tuning``) quando existirem no registro.
+        
+        Args:
+            epi_name: Nome do EPI
+            model_name: ``xgboost`` ou ``prophet``
+        """
+        params = dict(getattr(config.model, f"{model_name}_params"))
+        
+        if config.tuning.use_tuned_params:
+            if epi_name not in self.tuned_params:
+                from ML.model_registry import ModelRegistry
+                registry = ModelRegistry(config.scheduler.models_dir)
+                self.tuned_params[epi_name] = registry.load_tuned_params(epi_name)
+            params.update(self.tuned_params[epi_name].get(model_name, {}).get('params', {}))
+        
+        return params
+    
     def train_xgboost_model(self, df: pd.DataFrame, epi_name: str) -> Dict:
         """
         Treina modelo XGBoost para um EPI específico.
+        
+        Usa ``config.model.xgboost_params`` ou, se houver, os parâmetros
+        ajustados para o EPI (ver ``model_params``).
         """
+        import xgboost as xgb
+        from sklearn.model_selection import train_test_split
+        from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+        
         logger.info(f"Treinando XGBoost para {epi_name}...")
         
         # Filtrar dados do EPI
@@ -100,11 +122,7 @@ class DemandForecasting:
             return None
         
         # Preparar features e target
-        feature_cols = [
-            'year', 'month', 'day', 'dayofweek', 'quarter', 'weekofyear',
-            'is_weekend', 'lag_7', 'lag_14', 'lag_30', 
-            'rolling_mean_7', 'rolling_mean_30', 'rolling_std_7'
-        ]
+        feature_cols = FEATURE_COLS
         
         X = df_epi[feature_cols]
         y = df_epi['quantity']
@@ -115,13 +133,7 @@ class DemandForecasting:
         )
         
         # Treinar modelo
-        model = xgb.XGBRegressor(
-            n_estimators=100,
-            max_depth=5,
-            learning_rate=0.1,
-            random_state=42,
-            objective='reg:squarederror'
-        )
+        model = xgb.XGBRegressor(**self.model_params(epi_name, 'xgboost'))
         
         model.fit(X_train, y_train)
         
@@ -150,10 +162,95 @@ class DemandForecasting:
             'y_pred': y_pred
         }
     
-    def train_prophet_model(self, df: pd.DataFrame, epi_name: str) -> Dict:
+    def update_xgboost_model(
+        self,
+        df: pd.DataFrame,
+        epi_name: str,
+        previous_model,
+        since_date,
+        n_estimators: int = 20
+    ) -> Dict:
+        """
+        Continua o boosting de um modelo XGBoost já treinado usando apenas
+        os registros posteriores a ``since_date``.
+        
+        As árvores novas usam os hiperparâmetros de ``model_params`` (os
+        mesmos do treino completo), com ``n_estimators`` trocado.
+        
+        As métricas são calculadas com o modelo anterior sobre os dados novos,
+        antes da atualização (avaliação fora da amostra).
+        
+        Args:
+            df: DataFrame preparado por ``prepare_data``
+            epi_name: Nome do EPI
+            previous_model: ``XGBRegressor`` treinado anteriormente
+            since_date: Última data usada no treino anterior
+            n_estimators: Número de árvores a acrescentar
+        """
+        import xgboost as xgb
+        from sklearn.metrics import mean_absolute_error, mean_squared_error
+        
+        logger.info(f"Atualizando XGBoost para {epi_name} com dados após {since_date}...")
+        
+        df_new = df[(df['epi_name'] == epi_name) & (df['date'] > since_date)]
+        if df_new.empty:
+            return None
+        
+        X_new = df_new[FEATURE_COLS]
+        y_new = df_new['quantity']
+        
+        y_pred = previous_model.predict(X_new)
+        mae = mean_absolute_error(y_new, y_pred)
+        rmse = np.sqrt(mean_squared_error(y_new, y_pred))
+        
+        # Os parâmetros vêm da configuração/busca do EPI: um modelo carregado
+        # do registro só traz o booster (get_params() devolve None)
+        params = self.model_params(epi_name, 'xgboost')
+        params['n_estimators'] = n_estimators
+        model = xgb.XGBRegressor(**params)
+        model.fit(X_new, y_new, xgb_model=previous_model.get_booster())
+        
+        logger.info(f"XGBoost incremental - MAE (dados novos): {mae:.2f}, RMSE: {rmse:.2f}")
+        
+        return {
+            'model': model,
+            'metrics': {'mae': mae, 'rmse': rmse},
+            'new_rows': len(df_new)
+        }
+    
+    @staticmethod
+    def prophet_warm_start_params(model) -> Dict:
+        """
+        Extrai os parâmetros de um Prophet ajustado para inicializar o
+        próximo ajuste (warm start), conforme a documentação do Prophet.
+        """
+        params = {}
+        for name in ['k', 'm', 'sigma_obs']:
+            if model.mcmc_samples == 0:
+                params[name] = model.params[name][0][0]
+            else:
+                params[name] = np.mean(model.params[name])
+        for name in ['delta', 'beta']:
+            if model.mcmc_samples == 0:
+                params[name] = model.params[name][0]
+            else:
+                params[name] = np.mean(model.params[name], axis=0)
+        return params
+    
+    def train_prophet_model(self, df: pd.DataFrame, epi_name: str, warm_start_from=None) -> Dict:
         """
         Treina modelo Prophet (Facebook) para série temporal.
+        
+        Se ``warm_start_from`` (um Prophet já ajustado) for informado, a
+        otimização parte dos parâmetros dele, o que converge bem mais rápido
+        quando só alguns dias novos foram acrescentados.
+        
+        Os parâmetros vêm de ``config.model.prophet_params`` ou da busca de
+        hiperparâmetros do EPI (ver ``model_params``).
         """
+        from prophet import Prophet
+        from sklearn.metrics import mean_absolute_error, mean_squared_error
+        
         logger.info(f"Treinando Prophet para {epi_name}...")
         
         # Filtrar e preparar dados
@@ -165,14 +262,19 @@ class DemandForecasting:
             return None
         
         # Treinar modelo
-        model = Prophet(
-            yearly_seasonality=True,
-            weekly_seasonality=True,
-            daily_seasonality=False,
-            seasonality_mode='multiplicative'
-        )
+        model_kwargs = self.model_params(epi_name, 'prophet')
+        model = Prophet(**model_kwargs)
         
-        model.fit(df_epi)
+        if warm_start_from is not None:
+            try:
+                model.fit(df_epi, init=self.prophet_warm_start_params(warm_start_from))
+            except Exception as e:
+                # O número de changepoints pode mudar com o histórico
+                logger.warning(f"Warm start do Prophet falhou para {epi_name}, ajustando do zero: {e}")
+                model = Prophet(**model_kwargs)
+                model.fit(df_epi)
+        else:
+            model.fit(df_epi)
         
         # Fazer previsão no período de treino para avaliar
         forecast = model.predict(df_epi)
@@ -189,17 +291,268 @@ class DemandForecasting:
             'forecast': forecast
         }
     
-    def predict_future_demand(
-        self, 
-        df: pd.DataFrame, 
-        epi_name: str, 
+    def train_global_model(self, df: pd.DataFrame) -> Dict:
+        """
+        Treina um único modelo LightGBM para todos os EPIs.
+        
+        O EPI entra como feature categórica, de modo que itens com pouco
+        histórico aproveitam os padrões aprendidos nos demais. O modelo é
+        treinado uma única vez e fica guardado em ``self.models['global']``.
+        
+        Args:
+            df: DataFrame preparado por ``prepare_data``
+        
+        Returns:
+            Dict com modelo, métricas e categorias de EPI conhecidas
+        """
+        import lightgbm as lgb
+        from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+        
+        logger.info("Treinando modelo global LightGBM para todos os EPIs...")
+        
+        if df.empty:
+            logger.warning("Dados insuficientes para o modelo global")
+            return None
+        
+        categories = sorted(df['epi_name'].unique())
+        X = df[FEATURE_COLS].astype(float)
+        X['epi_name'] = pd.Categorical(df['epi_name'], categories=categories)
+        y = df['quantity'].astype(float)
+        
+        # Split temporal pela data, igual para todos os EPIs
+        cutoff = df['date'].quantile(1 - config.model.test_size)
+        train_mask = (df['date'] <= cutoff).values
+        
+        model = lgb.LGBMRegressor(**config.model.lightgbm_params)
+        model.fit(X[train_mask], y[train_mask], categorical_feature=['epi_name'])
+        
+        metrics = {}
+        residuals = {}
+        if (~train_mask).any():
+            y_test = y[~train_mask]
+            y_pred = model.predict(X[~train_mask])
+            metrics = {
+                'mae': mean_absolute_error(y_test, y_pred),
+                'rmse': np.sqrt(mean_squared_error(y_test, y_pred)),
+                'r2': r2_score(y_test, y_pred) if len(y_test) > 1 else np.nan
+            }
+            logger.info(f"LightGBM global - MAE: {metrics['mae']:.2f}, RMSE: {metrics['rmse']:.2f}")
+            
+            # Resíduos por EPI e horizonte, para os quantis: previsões
+            # recursivas a partir de origens no período de validação
+            residuals = self._global_validation_residuals(df, model, categories, cutoff)
+        
+        importance = pd.DataFrame({
+            'feature': FEATURE_COLS + ['epi_name'],
+            'importance': model.feature_importances_
+        }).sort_values('importance', ascending=False)
+        
+        result = {
+            'model': model,
+            'categories': categories,
+            'metrics': metrics,
+            'residuals': residuals,
+            'feature_importance': importance
+        }
+        self.models['global'] = result
+        return result
+    
+    @staticmethod
+    def _global_validation_residuals(df: pd.DataFrame, model, categories: List[str], cutoff) -> Dict:
+        """
+        Resíduos do modelo global em previsões recursivas fora da amostra
+        (origens a cada ``config.model.quantile_origin_step`` dias após
+        ``cutoff``), por EPI e horizonte. O Prophet de cada EPI não entra
+        nesses resíduos.
+        """
+        epis, series, dates, starts = [], [], [], []
+        for epi, df_epi in df.sort_values('date').groupby('epi_name', sort=False):
+            start = int((df_epi['date'] <= cutoff).sum())
+            if 0 < start < len(df_epi):
+                epis.append(epi)
+                series.append(df_epi['quantity'].values)
+                dates.append(df_epi['date'].values)
+                starts.append(start)
+        if not epis:
+            return {}
+        
+        validation = RecursiveForecaster(FEATURE_COLS).rolling_origin(
+            series, dates, starts, config.model.quantile_origin_step, model.predict,
+            extra_columns={'epi_name': pd.Categorical(epis, categories=categories).codes}
+        )
+        validation['residual'] = validation['actual'] - validation['prediction']
+        return {
+            epis[i]: {'horizon': group['horizon'].values, 'residual': group['residual'].values}
+            for i, group in validation.groupby('series')
+        }
+    
+    def _histories(self, df: pd.DataFrame, epis: List[str]):
+        """
+        Agrupa o DataFrame preparado uma única vez e devolve, para cada EPI,
+        a série de quantidades (ordenada por data) e a última data observada.
+        """
+        df_epis = df[df['epi_name'].isin(epis)].sort_values('date')
+        groups = {epi: g for epi, g in df_epis.groupby('epi_name', sort=False)}
+        epis = [epi for epi in epis if epi in groups]
+        
+        histories = [groups[epi]['quantity'].values for epi in epis]
+        last_dates = [groups[epi]['date'].iloc[-1] for epi in epis]
+        return epis, histories, last_dates
+    
+    def predict_global_model(
+        self,
+        df: pd.DataFrame,
+        epis: List[str] = None,
         days_ahead: int = 90
+    ) -> pd.DataFrame:
+        """
+        Prevê a demanda de vários EPIs com o modelo global.
+        
+        A previsão é recursiva: a cada dia do horizonte o modelo é chamado
+        uma única vez para todos os EPIs, e as previsões realimentam os lags.
+        
+        Args:
+            df: DataFrame preparado por ``prepare_data``
+            epis: EPIs a prever (todos, se None)
+            days_ahead: Horizonte em dias
+        
+        Returns:
+            DataFrame longo com ``date``, ``epi_name`` e ``lightgbm_prediction``
+        """
+        global_result = self.models.get('global') or self.train_global_model(df)
+        if not global_result:
+            return None
+        
+        if epis is None:
+            epis = sorted(df['epi_name'].unique())
+        
+        epis, histories, last_dates = self._histories(df, list(epis))
+        if not epis:
+            return None
+        
+        # Código categórico do EPI, na mesma ordem usada no treino
+        codes = pd.Categorical(epis, categories=global_result['categories']).codes
+        codes = np.where(codes < 0, np.nan, codes)
+        
+        engine = RecursiveForecaster(FEATURE_COLS)
+        result = engine.forecast(
+            histories,
+            last_dates,
+            days_ahead,
+            predict_fn=global_result['model'].predict,
+            extra_columns={'epi_name': codes}
+        )
+        
+        return engine.to_frame(result, epis, 'lightgbm_prediction')
+    
+    def classify_demand(self, df: pd.DataFrame, epis: List[str] = None) -> pd.DataFrame:
+        """
+        Classifica a demanda de cada EPI (suave, errática, intermitente ou
+        irregular) pelos critérios ADI/CV².
+        
+        Args:
+            df: DataFrame preparado por ``prepare_data``
+            epis: EPIs a classificar (todos, se None)
+            
+        Returns:
+            DataFrame com ``epi_name``, ``adi``, ``cv2``, ``n_demandas`` e ``categoria``
+        """
+        matrix = build_daily_matrix(df, epis, end_date=df['date'].max())
+        classes = classify_demand(matrix['values'], matrix['active'])
+        classes.insert(0, 'epi_name', matrix['epis'])
+        return classes
+    
+    def predict_intermittent(
+        self,
+        df: pd.DataFrame,
+        epis: List[str] = None,
+        days_ahead: int = 90,
+        method: str = None
+    ) -> pd.DataFrame:
+        """
+        Previsão rápida para EPIs de demanda esporádica (Croston/SBA/TSB).
+        
+        Todas as séries são ajustadas em uma única passada NumPy. A previsão
+        é a taxa diária esperada, constante no horizonte, a partir do dia
+        seguinte à última data do histórico.
+        
+        Returns:
+            DataFrame longo no mesmo formato de ``predict_future_demand``
+        """
+        method = method or config.model.intermittent_method
+        end_date = df['date'].max()
+        matrix = build_daily_matrix(df, epis, end_date=end_date)
+        if not matrix['epis']:
+            return None
+        
+        fitted = intermittent_forecast(
+            matrix['values'],
+            matrix['active'],
+            method=method,
+            alpha=config.model.intermittent_alpha,
+            beta=config.model.intermittent_beta
+        )
+        
+        n_epis = len(matrix['epis'])
+        future_dates = pd.date_range(
+            start=pd.Timestamp(end_date).normalize() + timedelta(days=1),
+            periods=days_ahead,
+            freq='D'
+        )
+        rate = np.repeat(fitted['forecast'], days_ahead)
+        # Em um dia com retirada espera-se o tamanho típico da demanda
+        size = np.maximum(np.repeat(fitted['size'], days_ahead), rate)
+        
+        # Quantis: tamanhos das retiradas já observadas de cada EPI
+        demand_sizes = [
+            values[(values > 0) & active]
+            for values, active in zip(matrix['values'], matrix['active'])
+        ]
+        quantiles = intermittent_quantiles(
+            fitted['forecast'], np.maximum(fitted['size'], fitted['forecast']),
+            demand_sizes, sorted(config.model.quantiles)
+        )
+        
+        return pd.DataFrame({
+            'date': np.tile(future_dates.values, n_epis),
+            'epi_name': np.repeat(np.asarray(matrix['epis'], dtype=object), days_ahead),
+            'intermittent_prediction': rate,
+            'ensemble_prediction': rate,
+            'lower_bound': 0.0,
+            'upper_bound': size,
+            **{name: np.repeat(values, days_ahead) for name, values in quantiles.items()}
+        })
+    
+    def predict_future_demand(
+        self,
+        df: pd.DataFrame,
+        epi_name: str,
+        days_ahead: int = 90,
+        use_global_model: bool = False
     ) -> pd.DataFrame:
         """
         Faz previsão de demanda futura combinando múltiplos modelos.
+        
+        Com ``use_global_model=True`` o componente de gradient boosting vem do
+        modelo global LightGBM para qualquer EPI, inclusive os intermitentes e
+        os com menos de 30 dias de histórico (nesse caso apenas o modelo
+        global é usado).
+        
+        Sem o modelo global, EPIs classificados como intermitentes ou
+        irregulares (ADI/CV²) seguem pelo caminho rápido de
+        ``predict_intermittent``, sem Prophet/XGBoost.
         """
         logger.info(f"Prevendo demanda para {epi_name} - {days_ahead} dias à frente")
         
+        if config.model.use_intermittent_fast_path and not use_global_model:
+            classes = self.classify_demand(df, [epi_name])
+            if not classes.empty and classes['categoria'].iloc[0] in INTERMITTENT_CLASSES:
+                logger.info(f"{epi_name}: demanda {classes['categoria'].iloc[0]}, usando previsão intermitente")
+                return self.predict_intermittent(df, [epi_name], days_ahead)
+        
+        if use_global_model:
+            return self._predict_with_global_model(df, epi_name, days_ahead)
+        
         # Treinar modelos
         xgb_result = self.train_xgboost_model(df, epi_name)
         prophet_result = self.train_prophet_model(df, epi_name)
@@ -207,65 +560,341 @@ class DemandForecasting:
         if not xgb_result or not prophet_result:
             return None
         
-        # Criar datas futuras
-        last_date = df[df['epi_name'] == epi_name]['date'].max()
-        future_dates = pd.date_range(
-            start=last_date + timedelta(days=1),
-            periods=days_ahead,
-            freq='D'
+        return self.forecast_with_models(df, epi_name, days_ahead, xgb_result, prophet_result)
+    
+    def predict_many(
+        self,
+        df: pd.DataFrame,
+        epis: List[str] = None,
+        days_ahead: int = 90,
+        use_global_model: bool = False
+    ) -> pd.DataFrame:
+        """
+        Prevê a demanda de vários EPIs de uma só vez.
+        
+        Equivale a chamar ``predict_future_demand`` para cada EPI, mas o
+        DataFrame é agrupado uma única vez e cada tipo de modelo roda em lote:
+        
+        - EPIs intermitentes: uma passada Croston/SBA/TSB para todos (só
+          sem o modelo global, que tem precedência)
+        - Modelo global: um ``predict`` por dia do horizonte para todos
+        - Modelos por EPI: o treino continua individual, mas a previsão
+          recursiva do XGBoost usa uma única matriz de features por passo
+          (calendário calculado uma vez) e o resultado sai em um só bloco
+        
+        Args:
+            df: DataFrame preparado por ``prepare_data``
+            epis: EPIs a prever (todos, se None)
+            days_ahead: Horizonte em dias
+            use_global_model: Usa o modelo global LightGBM no lugar do XGBoost
+                e do caminho intermitente, para todos os EPIs
+            
+        Returns:
+            DataFrame longo com as colunas de ``predict_future_demand``
+            (colunas de modelos não usados por um EPI ficam vazias)
+        """
+        if epis is None:
+            epis = sorted(df['epi_name'].unique())
+        
+        logger.info(f"Prevendo demanda para {len(epis)} EPIs - {days_ahead} dias à frente")
+        
+        groups = {
+            epi: df_epi.sort_values('date')
+            for epi, df_epi in df[df['epi_name'].isin(epis)].groupby('epi_name', sort=False)
+        }
+        remaining = [epi for epi in epis if epi in groups]
+        frames = []
+        
+        if config.model.use_intermittent_fast_path and remaining and not use_global_model:
+            classes = self.classify_demand(df, remaining)
+            sparse = classes.loc[classes['categoria'].isin(INTERMITTENT_CLASSES), 'epi_name'].tolist()
+            if sparse:
+                logger.info(f"{len(sparse)} EPIs com demanda esporádica, usando previsão intermitente")
+                frames.append(self.predict_intermittent(df, sparse, days_ahead))
+                sparse = set(sparse)
+                remaining = [epi for epi in remaining if epi not in sparse]
+        
+        if remaining and use_global_model:
+            global_pred = self.predict_global_model(df, remaining, days_ahead)
+            if global_pred is not None and not global_pred.empty:
+                prophet_models = {}
+                for epi in remaining:
+                    prophet_result = self.train_prophet_model(groups[epi], epi)
+                    prophet_models[epi] = prophet_result['model'] if prophet_result else None
+                frames.append(self._global_ensemble(global_pred, prophet_models))
+        
+        elif remaining:
+            trained_epis, xgb_models, prophet_models, residuals = [], [], [], []
+            for epi in remaining:
+                xgb_result = self.train_xgboost_model(groups[epi], epi)
+                prophet_result = self.train_prophet_model(groups[epi], epi)
+                if xgb_result and prophet_result:
+                    trained_epis.append(epi)
+                    xgb_models.append(xgb_result['model'])
+                    prophet_models.append(prophet_result['model'])
+                    residuals.append(self.calibration_residuals(groups[epi], epi, xgb_result))
+            
+            if trained_epis:
+                frames.append(self._ensemble_forecast(
+                    trained_epis,
+                    [groups[epi]['quantity'].values for epi in trained_epis],
+                    [groups[epi]['date'].iloc[-1] for epi in trained_epis],
+                    xgb_models,
+                    prophet_models,
+                    days_ahead,
+                    residuals
+                ))
+        
+        if not frames:
+            return None
+        
+        return pd.concat(frames, ignore_index=True)
+    
+    def forecast_with_models(
+        self,
+        df: pd.DataFrame,
+        epi_name: str,
+        days_ahead: int,
+        xgb_result: Dict,
+        prophet_result: Dict,
+        calibrate: bool = True
+    ) -> pd.DataFrame:
+        """
+        Gera a previsão do ensemble a partir de modelos já treinados, sem
+        retreinar (usado também pelo backtest).
+        
+        Com ``calibrate=False`` os quantis não usam os erros de validação
+        (ver ``calibration_residuals``) e vêm do intervalo do Prophet.
+        """
+        _, histories, last_dates = self._histories(df, [epi_name])
+        residuals = self.calibration_residuals(df, epi_name, xgb_result) if calibrate else None
+        return self._ensemble_forecast(
+            [epi_name], histories, last_dates,
+            [xgb_result['model']], [prophet_result['model']], days_ahead,
+            [residuals]
         )
+    
+    def calibration_residuals(self, df: pd.DataFrame, epi_name: str, xgb_result: Dict) -> Optional[Dict]:
+        """
+        Erros de validação para calibrar os quantis de um EPI, sem treino
+        extra: os salvos no registro pelo agendador junto com os modelos
+        (ver ``ensemble_residuals``).
         
-        # Prophet prediction
-        future_df = pd.DataFrame({'ds': future_dates})
-        prophet_forecast = prophet_result['model'].predict(future_df)
-        
-        # XGBoost prediction (precisa de features)
-        # Criar features para datas futuras
-        future_features = pd.DataFrame({
-            'date': future_dates,
-            'year': future_dates.year,
-            'month': future_dates.month,
-            'day': future_dates.day,
-            'dayofweek': future_dates.dayofweek,
-            'quarter': future_dates.quarter,
-            'weekofyear': future_dates.isocalendar().week,
-            'is_weekend': future_dates.dayofweek.isin([5, 6]).astype(int)
-        })
+        Sem resíduos salvos, devolve None (quantis pelo intervalo do
+        Prophet), a menos que ``config.model.quantile_refit_residuals`` esteja
+        ativo; nesse caso os resíduos são calculados na hora, com um ajuste
+        extra do Prophet.
+        """
+        if epi_name not in self.stored_residuals:
+            from ML.model_registry import ModelRegistry
+            self.stored_residuals[epi_name] = ModelRegistry(config.scheduler.models_dir).load_residuals(epi_name)
         
-        # Usar últimos valores conhecidos para lags
-        last_values = df[df['epi_name'] == epi_name].tail(30)['quantity'].values
-        future_features['lag_7'] = np.mean(last_values[-7:]) if len(last_values) >= 7 else 0
-        future_features['lag_14'] = np.mean(last_values[-14:]) if len(last_values) >= 14 else 0
-        future_features['lag_30'] = np.mean(last_values) if len(last_values) > 0 else 0
-        future_features['rolling_mean_7'] = np.mean(last_values[-7:]) if len(last_values) >= 7 else 0
-        future_features['rolling_mean_30'] = np.mean(last_values) if len(last_values) > 0 else 0
-        future_features['rolling_std_7'] = np.std(last_values[-7:]) if len(last_values) >= 7 else 0
-        
-        feature_cols = [
-            'year', 'month', 'day', 'dayofweek', 'quarter', 'weekofyear',
-            'is_weekend', 'lag_7', 'lag_14', 'lag_30',
-            'rolling_mean_7', 'rolling_mean_30', 'rolling_std_7'
-        ]
+        residuals = self.stored_residuals[epi_name]
+        if residuals is None and config.model.quantile_refit_residuals:
+            residuals = self.ensemble_residuals(df, epi_name, xgb_result)
+        return residuals
+    
+    def ensemble_residuals(self, df: pd.DataFrame, epi_name: str, xgb_result: Dict) -> Dict[str, np.ndarray]:
+        """
+        Resíduos do ensemble em previsões de validação fora da amostra, por
+        horizonte, usados para calibrar os quantis. Calculados no treino
+        (agendador) e salvos no registro, pois ajustam um Prophet extra.
+        
+        No período de teste do XGBoost (os últimos ``config.model.test_size``
+        do histórico, não vistos por ele), previsões recursivas partem de
+        uma origem a cada ``config.model.quantile_origin_step`` dias, como
+        em produção. A metade Prophet vem de um ajuste só com o período de
+        treino.
+        
+        Returns:
+            ``{'horizon': [...], 'residual': [...]}`` ou None se não houver
+            período de validação
+        """
+        n_test = len(xgb_result['y_test'])
+        series = df[df['epi_name'] == epi_name].sort_values('date')
+        n_train = len(series) - n_test
+        if n_test == 0 or n_train < 30:
+            return None
+        
+        prophet_result = self.train_prophet_model(series.iloc[:n_train], epi_name)
+        if not prophet_result:
+            return None
+        prophet_yhat = prophet_result['model'].predict(
+            pd.DataFrame({'ds': series['date'].iloc[n_train:]})
+        )['yhat'].values
+        
+        validation = RecursiveForecaster(FEATURE_COLS).rolling_origin(
+            [series['quantity'].values],
+            [series['date'].values],
+            [n_train],
+            config.model.quantile_origin_step,
+            xgb_result['model'].get_booster().inplace_predict
+        )
+        ensemble = np.maximum(
+            (validation['prediction'].values + prophet_yhat[validation['position'].values - n_train]) / 2, 0
+        )
+        return {
+            'horizon': validation['horizon'].values,
+            'residual': validation['actual'].values - ensemble
+        }
+    
+    @staticmethod
+    def _prophet_sigma(lower: np.ndarray, upper: np.ndarray) -> np.ndarray:
+        """Desvio padrão implícito no intervalo ``yhat_lower``/``yhat_upper`` do Prophet."""
+        from scipy.stats import norm
+        
+        width = config.forecast.prophet_interval_width
+        return np.maximum(upper - lower, 0) / (2 * norm.ppf(0.5 + width / 2))
+    
+    @staticmethod
+    def _quantile_columns(point: np.ndarray, residuals: List[np.ndarray], sigma: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Colunas ``p10``/``p50``/``p90`` (conforme ``config.model.quantiles``)
+        achatadas para o DataFrame longo. EPIs sem resíduos suficientes usam
+        quantis da normal com desvio ``sigma``.
+        """
+        quantiles = quantile_forecast(point, residuals, sorted(config.model.quantiles), fallback_sigma=sigma)
+        return {name: values.reshape(-1) for name, values in quantiles.items()}
+    
+    def _ensemble_forecast(
+        self,
+        epis: List[str],
+        histories: List[np.ndarray],
+        last_dates: List,
+        xgb_models: List,
+        prophet_models: List,
+        days_ahead: int,
+        residuals: List[np.ndarray] = None
+    ) -> pd.DataFrame:
+        """
+        Ensemble XGBoost + Prophet para um ou mais EPIs, cada um com seus
+        próprios modelos, montado em um único DataFrame.
+        
+        Os quantis (``p10``/``p50``/``p90``) saem dos resíduos de validação
+        de cada EPI (ver ``ensemble_residuals``), sem treinar modelos extras.
+        """
+        # XGBoost prediction: recursiva, com os lags realimentados pelas
+        # próprias previsões a cada dia do horizonte. Todos os EPIs avançam
+        # juntos; cada linha da matriz de features vai para o seu booster,
+        # com as árvores de todos avaliadas em uma só passada por dia.
+        boosters = [model.get_booster() for model in xgb_models]
+        if len(boosters) == 1:
+            predict_fn = boosters[0].inplace_predict
+        elif BoosterBatch.supports(boosters):
+            predict_fn = BoosterBatch(boosters).predict
+        else:
+            def predict_fn(X):
+                return np.concatenate([
+                    booster.inplace_predict(X[i:i + 1]) for i, booster in enumerate(boosters)
+                ])
+        
+        engine = RecursiveForecaster(FEATURE_COLS)
+        xgb_forecast = engine.forecast(histories, last_dates, days_ahead, predict_fn=predict_fn)
+        xgb_predictions = xgb_forecast['predictions']
+        future_dates = xgb_forecast['dates']
         
-        xgb_predictions = xgb_result['model'].predict(future_features[feature_cols])
+        # Prophet prediction nas mesmas datas
+        prophet_yhat = np.zeros_like(xgb_predictions)
+        prophet_lower = np.zeros_like(xgb_predictions)
+        prophet_upper = np.zeros_like(xgb_predictions)
+        for i, model in enumerate(prophet_models):
+            prophet_forecast = model.predict(pd.DataFrame({'ds': future_dates[i]}))
+            prophet_yhat[i] = prophet_forecast['yhat'].values
+            prophet_lower[i] = prophet_forecast['yhat_lower'].values
+            prophet_upper[i] = prophet_forecast['yhat_upper'].values
         
         # Combinar previsões (ensemble)
-        combined_predictions = (prophet_forecast['yhat'].values + xgb_predictions) / 2
+        combined_predictions = (prophet_yhat + xgb_predictions) / 2
         combined_predictions = np.maximum(combined_predictions, 0)  # Não permitir negativos
         
         # Criar DataFrame com resultados
         results = pd.DataFrame({
-            'date': future_dates,
-            'epi_name': epi_name,
-            'prophet_prediction': prophet_forecast['yhat'].values,
-            'xgboost_prediction': xgb_predictions,
-            'ensemble_prediction': combined_predictions,
-            'lower_bound': prophet_forecast['yhat_lower'].values,
-            'upper_bound': prophet_forecast['yhat_upper'].values
+            'date': future_dates.reshape(-1),
+            'epi_name': np.repeat(np.asarray(epis, dtype=object), days_ahead),
+            'prophet_prediction': prophet_yhat.reshape(-1),
+            'xgboost_prediction': xgb_predictions.reshape(-1),
+            'ensemble_prediction': combined_predictions.reshape(-1),
+            'lower_bound': prophet_lower.reshape(-1),
+            'upper_bound': prophet_upper.reshape(-1),
+            **self._quantile_columns(
+                combined_predictions,
+                residuals or [None] * len(epis),
+                self._prophet_sigma(prophet_lower, prophet_upper)
+            )
         })
         
         return results
     
+    def _predict_with_global_model(
+        self,
+        df: pd.DataFrame,
+        epi_name: str,
+        days_ahead: int
+    ) -> pd.DataFrame:
+        """
+        Previsão usando o modelo global LightGBM, combinado com Prophet
+        quando o EPI tem histórico suficiente.
+        """
+        global_pred = self.predict_global_model(df, [epi_name], days_ahead)
+        if global_pred is None or global_pred.empty:
+            return None
+        
+        prophet_result = self.train_prophet_model(df, epi_name)
+        return self._global_ensemble(
+            global_pred, {epi_name: prophet_result['model'] if prophet_result else None}
+        )
+    
+    def _global_ensemble(self, global_pred: pd.DataFrame, prophet_models: Dict) -> pd.DataFrame:
+        """
+        Combina a previsão do modelo global com o Prophet de cada EPI (quando
+        existir); sem Prophet o intervalo vem do erro do modelo global.
+        
+        Os quantis usam os resíduos de validação do modelo global no EPI.
+        """
+        rmse = self.models['global']['metrics'].get('rmse', 0)
+        global_residuals = self.models['global'].get('residuals', {})
+        frames = []
+        
+        for epi_name, epi_pred in global_pred.groupby('epi_name', sort=False):
+            lgb_predictions = epi_pred['lightgbm_prediction'].values
+            
+            results = pd.DataFrame({
+                'date': epi_pred['date'].values,
+                'epi_name': epi_name,
+                'lightgbm_prediction': lgb_predictions
+            })
+            
+            prophet_model = prophet_models.get(epi_name)
+            if prophet_model is not None:
+                prophet_forecast = prophet_model.predict(
+                    pd.DataFrame({'ds': results['date']})
+                )
+                results['prophet_prediction'] = prophet_forecast['yhat'].values
+                results['ensemble_prediction'] = np.maximum(
+                    (prophet_forecast['yhat'].values + lgb_predictions) / 2, 0
+                )
+                results['lower_bound'] = prophet_forecast['yhat_lower'].values
+                results['upper_bound'] = prophet_forecast['yhat_upper'].values
+                sigma = self._prophet_sigma(results['lower_bound'].values, results['upper_bound'].values)
+            else:
+                # Sem Prophet: intervalo aproximado pelo erro do modelo global
+                results['ensemble_prediction'] = lgb_predictions
+                results['lower_bound'] = np.maximum(lgb_predictions - 1.96 * rmse, 0)
+                results['upper_bound'] = lgb_predictions + 1.96 * rmse
+                sigma = np.full(len(results), rmse)
+            
+            quantiles = self._quantile_columns(
+                results['ensemble_prediction'].values[None, :],
+                [global_residuals.get(epi_name)],
+                sigma[None, :]
+            )
+            for name, values in quantiles.items():
+                results[name] = values
+            
+            frames.append(results)
+        
+        return pd.concat(frames, ignore_index=True)
+    
     def generate_purchase_recommendations(
         self,
         predictions_df: pd.DataFrame,
@@ -320,6 +949,8 @@ class DemandForecasting:
         """
         Cria visualização interativa da previsão.
         """
+        import plotly.graph_objects as go
+        
         # Filtrar dados históricos
         hist = historical_df[historical_df['epi_name'] == epi_name].copy()
         
@@ -380,6 +1011,9 @@ class DemandForecasting:
         """
         Analisa padrões sazonais na demanda.
         """
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+        
         df_epi = df[df['epi_name'] == epi_name].copy()
         
         # Análise mensal
@@ -0,0 +1,341 @@
+"""
+Feature store das séries diárias preparadas para os modelos de ML
+"""
+import os
+import json
+import uuid
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# Incrementar sempre que o cálculo das features mudar: invalida o que está
+# gravado e força a reconstrução de todas as partições
+FEATURE_VERSION = 2
+
+MANIFEST_FILE = 'manifest.json'
+
+# Registros anteriores necessários para calcular as features de um dia novo
+# (maior lag/janela usada em ``add_features``, mais o deslocamento de um dia
+# das médias móveis)
+CONTEXT_ROWS = 31
+
+_lock = threading.Lock()
+
+# Partições já lidas neste processo: (raiz, diretório) -> (arquivos, DataFrame)
+_memory = {}
+
+
+def aggregate_daily(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Saídas da planilha agregadas por dia e EPI (colunas ``date``,
+    ``epi_name`` e ``quantity``), ordenadas por data.
+    
+    A série de cada EPI é diária e contínua, da primeira retirada até a
+    última data da planilha: dias sem retirada entram com quantidade zero.
+    Assim um registro é sempre um dia, como no passo da previsão recursiva
+    (``ML.recursive_forecaster``).
+    """
+    df_saidas = df[df['transaction_type'].str.lower() == 'saída'].copy()
+    
+    df_saidas['date'] = pd.to_datetime(df_saidas['date'], errors='coerce')
+    df_saidas['quantity'] = pd.to_numeric(df_saidas['quantity'], errors='coerce').fillna(0)
+    df_saidas = df_saidas.dropna(subset=['date'])
+    
+    daily = df_saidas.groupby([
+        pd.Grouper(key='date', freq='D'),
+        'epi_name'
+    ])['quantity'].sum().reset_index()
+    if daily.empty:
+        return daily
+    
+    # Calendário completo de cada EPI: primeira retirada até o último dia
+    first = daily.groupby('epi_name')['date'].min()
+    spans = (daily['date'].max() - first).dt.days.values + 1
+    offsets = np.arange(spans.sum()) - np.repeat(np.cumsum(spans) - spans, spans)
+    calendar = pd.DataFrame({
+        'date': np.repeat(first.values, spans) + pd.to_timedelta(offsets, unit='D'),
+        'epi_name': np.repeat(first.index.values, spans)
+    })
+    
+    daily = calendar.merge(daily, on=['date', 'epi_name'], how='left')
+    daily['quantity'] = daily['quantity'].fillna(0.0)
+    return daily.sort_values(['date', 'epi_name'], kind='stable').reset_index(drop=True)
+
+
+def add_features(df_agg: pd.DataFrame) -> pd.DataFrame:
+    """
+    Acrescenta as features de calendário, lags e médias móveis (por EPI,
+    contadas em dias) à série diária de ``aggregate_daily``.
+    
+    Lags e médias móveis usam apenas os dias anteriores ao do registro (o
+    alvo não entra nas próprias features), exatamente como na previsão
+    recursiva, em que o dia previsto ainda não é conhecido.
+    """
+    df_agg = df_agg.copy()
+    
+    # Features temporais
+    df_agg['year'] = df_agg['date'].dt.year
+    df_agg['month'] = df_agg['date'].dt.month
+    df_agg['day'] = df_agg['date'].dt.day
+    df_agg['dayofweek'] = df_agg['date'].dt.dayofweek
+    df_agg['quarter'] = df_agg['date'].dt.quarter
+    df_agg['weekofyear'] = df_agg['date'].dt.isocalendar().week
+    df_agg['is_weekend'] = df_agg['dayofweek'].isin([5, 6]).astype(int)
+    
+    # Lags e médias móveis, calculados para todos os EPIs de uma vez
+    quantity = df_agg.groupby('epi_name', sort=False)['quantity']
+    for lag in (7, 14, 30):
+        df_agg[f'lag_{lag}'] = quantity.shift(lag).fillna(0)
+    
+    previous = quantity.shift(1)
+    previous_by_epi = previous.groupby(df_agg['epi_name'], sort=False)
+    df_agg['rolling_mean_7'] = previous_by_epi.transform(lambda s: s.rolling(7, min_periods=1).mean()).fillna(0)
+    df_agg['rolling_mean_30'] = previous_by_epi.transform(lambda s: s.rolling(30, min_periods=1).mean()).fillna(0)
+    df_agg['rolling_std_7'] = previous_by_epi.transform(lambda s: s.rolling(7, min_periods=1).std()).fillna(0)
+    
+    return df_agg
+
+
+def _row_hashes(df_agg: pd.DataFrame) -> np.ndarray:
+    """Hash de cada registro agregado (data + quantidade)."""
+    return pd.util.hash_pandas_object(df_agg[['date', 'quantity']], index=False).values
+
+
+def _lineage_hash(row_hashes: np.ndarray) -> str:
+    """Linhagem de uma partição: versão das features + registros de origem."""
+    digest = hashlib.sha256(f"v{FEATURE_VERSION}".encode())
+    digest.update(np.ascontiguousarray(row_hashes).tobytes())
+    return digest.hexdigest()
+
+
+class FeatureStore:
+    """
+    Guarda as features preparadas em Parquet, uma partição por EPI.
+    
+    Cada partição registra no manifesto a linhagem (hash dos registros de
+    origem e versão das features) e a última data gravada. Em ``sync``:
+    
+    - EPI sem alteração: nada é recalculado
+    - Só dias novos após a última data: calcula as features apenas desses
+      dias (com ``CONTEXT_ROWS`` registros anteriores de contexto) e grava
+      um novo arquivo na partição
+    - Histórico alterado (edição/exclusão na planilha) ou versão diferente:
+      a partição é reconstruída
+    
+    ``load`` devolve recortes por EPI e período lendo só as partições
+    necessárias, no mesmo formato de ``DemandForecasting.prepare_data``.
+    """
+    
+    def __init__(self, root: str = None):
+        from ML.config import config
+        
+        self.root = root or os.path.join(config.cache_dir, 'feature_store')
+        self.max_parts = config.data.feature_store_max_parts
+        os.makedirs(self.root, exist_ok=True)
+    
+    # ------------------------------------------------------------------
+    # Manifesto
+    # ------------------------------------------------------------------
+    
+    def _manifest_path(self) -> str:
+        return os.path.join(self.root, MANIFEST_FILE)
+    
+    def read_manifest(self) -> Dict:
+        """Partições gravadas: ``{epi: {dir, parts, last_date, rows, hash, version}}``."""
+        try:
+            with open(self._manifest_path(), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+    
+    def _write_manifest(self, manifest: Dict):
+        tmp_path = f"{self._manifest_path()}.tmp{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self._manifest_path())
+    
+    @staticmethod
+    def _partition_dir(epi_name: str) -> str:
+        # Nomes de EPI têm espaços, acentos e barras: o diretório usa um hash
+        return f"epi={hashlib.sha1(epi_name.encode('utf-8')).hexdigest()[:16]}"
+    
+    def _write_part(self, partition: str, frame: pd.DataFrame) -> str:
+        directory = os.path.join(self.root, partition)
+        os.makedirs(directory, exist_ok=True)
+        
+        name = f"part-{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+        tmp_path = os.path.join(directory, f".{name}.tmp")
+        frame.to_parquet(tmp_path, engine='pyarrow', index=False)
+        os.replace(tmp_path, os.path.join(directory, name))
+        return name
+    
+    def _remove_parts(self, partition: str, parts: List[str]):
+        for name in parts:
+            path = os.path.join(self.root, partition, name)
+            if os.path.exists(path):
+                os.remove(path)
+    
+    # ------------------------------------------------------------------
+    # Escrita
+    # ------------------------------------------------------------------
+    
+    def sync(self, df: pd.DataFrame) -> Dict[str, int]:
+        """
+        Atualiza as partições a partir das transações da planilha.
+        
+        Args:
+            df: Transações (mesma entrada de ``prepare_data``)
+        
+        Returns:
+            Contagem de EPIs ``inalterados``, ``incrementais``,
+            ``reconstruidos`` e ``removidos``
+        """
+        df_agg = aggregate_daily(df)
+        row_hashes = _row_hashes(df_agg)
+        stats = {'inalterados': 0, 'incrementais': 0, 'reconstruidos': 0, 'removidos': 0}
+        
+        with _lock:
+            manifest = self.read_manifest()
+            
+            for epi_name, index in df_agg.groupby('epi_name', sort=False).indices.items():
+                hashes = row_hashes[index]
+                entry = manifest.get(epi_name)
+                
+                if entry is not None and entry.get('version') == FEATURE_VERSION:
+                    n_stored = entry['rows']
+                    if len(index) == n_stored and _lineage_hash(hashes) == entry['hash']:
+                        stats['inalterados'] += 1
+                        continue
+                    
+                    if len(index) > n_stored and _lineage_hash(hashes[:n_stored]) == entry['hash']:
+                        series = df_agg.iloc[index].reset_index(drop=True)
+                        manifest[epi_name] = self._append(entry, series, hashes)
+                        stats['incrementais'] += 1
+                        continue
+                
+                series = df_agg.iloc[index].reset_index(drop=True)
+                manifest[epi_name] = self._rebuild(epi_name, entry, series, hashes)
+                stats['reconstruidos'] += 1
+            
+            # EPIs que não existem mais na planilha
+            for epi_name in set(manifest) - set(df_agg['epi_name']):
+                entry = manifest.pop(epi_name)
+                self._remove_parts(entry['dir'], entry['parts'])
+                _memory.pop((self.root, entry['dir']), None)
+                stats['removidos'] += 1
+            
+            self._write_manifest(manifest)
+        
+        logger.info(f"Feature store sincronizado: {stats}")
+        return stats
+    
+    def _rebuild(self, epi_name: str, entry: Optional[Dict], series: pd.DataFrame, hashes: np.ndarray) -> Dict:
+        partition = self._partition_dir(epi_name)
+        name = self._write_part(partition, add_features(series))
+        if entry is not None:
+            self._remove_parts(entry['dir'], entry['parts'])
+        
+        return {
+            'dir': partition,
+            'parts': [name],
+            'last_date': series['date'].iloc[-1].isoformat(),
+            'rows': len(series),
+            'hash': _lineage_hash(hashes),
+            'version': FEATURE_VERSION
+        }
+    
+    def _append(self, entry: Dict, series: pd.DataFrame, hashes: np.ndarray) -> Dict:
+        n_stored = entry['rows']
+        context_start = max(0, n_stored - CONTEXT_ROWS)
+        new_rows = add_features(series.iloc[context_start:]).iloc[n_stored - context_start:]
+        
+        parts = entry['parts'] + [self._write_part(entry['dir'], new_rows)]
+        if len(parts) > self.max_parts:
+            parts = self._compact(entry['dir'], parts)
+        
+        return {
+            **entry,
+            'parts': parts,
+            'last_date': series['date'].iloc[-1].isoformat(),
+            'rows': len(series),
+            'hash': _lineage_hash(hashes)
+        }
+    
+    def _compact(self, partition: str, parts: List[str]) -> List[str]:
+        """Junta os arquivos de uma partição em um só."""
+        frame = pd.concat(
+            [pd.read_parquet(os.path.join(self.root, partition, name)) for name in parts],
+            ignore_index=True
+        )
+        name = self._write_part(partition, frame)
+        self._remove_parts(partition, parts)
+        return [name]
+    
+    # ------------------------------------------------------------------
+    # Leitura
+    # ------------------------------------------------------------------
+    
+    def load(self, epis: List[str] = None, start_date=None, end_date=None) -> pd.DataFrame:
+        """
+        Lê as features gravadas.
+        
+        Args:
+            epis: EPIs a ler (todos, se None)
+            start_date: Primeira data incluída (opcional)
+            end_date: Última data incluída (opcional)
+        
+        Returns:
+            DataFrame no formato de ``prepare_data`` (ordenado por data e EPI)
+        """
+        import pyarrow.dataset as ds
+        
+        manifest = self.read_manifest()
+        if epis is not None:
+            manifest = {epi: manifest[epi] for epi in epis if epi in manifest}
+        
+        if not manifest:
+            return add_features(pd.DataFrame({
+                'date': pd.Series(dtype='datetime64[ns]'),
+                'epi_name': pd.Series(dtype=object),
+                'quantity': pd.Series(dtype=float)
+            }))
+        
+        # Os arquivos de uma partição nunca são alterados depois de gravados
+        # (só novos arquivos entram), então a partição lida fica em memória
+        # enquanto a lista de arquivos do manifesto for a mesma
+        missing = {
+            epi_name: entry for epi_name, entry in manifest.items()
+            if _memory.get((self.root, entry['dir']), (None,))[0] != tuple(entry['parts'])
+        }
+        if missing:
+            paths = [
+                os.path.join(self.root, entry['dir'], name)
+                for entry in missing.values()
+                for name in entry['parts']
+            ]
+            table = ds.dataset(paths, format='parquet').to_table().to_pandas()
+            for epi_name, frame in table.groupby('epi_name', sort=False):
+                entry = missing[epi_name]
+                _memory[(self.root, entry['dir'])] = (tuple(entry['parts']), frame)
+        
+        df = pd.concat([_memory[(self.root, entry['dir'])][1] for entry in manifest.values()], ignore_index=True)
+        if start_date is not None:
+            df = df[df['date'] >= pd.Timestamp(start_date)]
+        if end_date is not None:
+            df = df[df['date'] <= pd.Timestamp(end_date)]
+        
+        return df.sort_values(['date', 'epi_name'], kind='stable').reset_index(drop=True)
+    
+    def prepared(self, df: pd.DataFrame, epis: List[str] = None, start_date=None, end_date=None) -> pd.DataFrame:
+        """Sincroniza com as transações e devolve as features (ver ``load``)."""
+        self.sync(df)
+        return self.load(epis, start_date, end_date)
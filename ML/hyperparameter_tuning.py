@@ -0,0 +1,332 @@
+"""
+Busca de hiperparâmetros por EPI com orçamento de tempo (successive halving)
+"""
+import time
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.model_selection import TimeSeriesSplit
+from sklearn.metrics import mean_absolute_error
+
+from ML.config import config, get_tuning_config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# Espaços de busca: cada entrada sorteia um valor a partir do gerador
+XGBOOST_SEARCH_SPACE = {
+    'max_depth': lambda rng: int(rng.integers(3, 9)),
+    'learning_rate': lambda rng: float(10 ** rng.uniform(-2, -0.5)),
+    'subsample': lambda rng: float(rng.uniform(0.6, 1.0)),
+    'colsample_bytree': lambda rng: float(rng.uniform(0.6, 1.0)),
+    'min_child_weight': lambda rng: float(10 ** rng.uniform(0, 1)),
+    'reg_lambda': lambda rng: float(10 ** rng.uniform(-1, 1))
+}
+
+PROPHET_SEARCH_SPACE = {
+    'changepoint_prior_scale': lambda rng: float(10 ** rng.uniform(-3, -0.3)),
+    'seasonality_prior_scale': lambda rng: float(10 ** rng.uniform(-2, 1)),
+    'seasonality_mode': lambda rng: str(rng.choice(['additive', 'multiplicative']))
+}
+
+# Nível máximo de recurso do XGBoost (número de árvores) na busca
+XGBOOST_MAX_ESTIMATORS = 400
+
+
+def sample_candidates(space: Dict[str, Callable], n_candidates: int, random_state: int = 42) -> List[Dict]:
+    """Sorteia ``n_candidates`` configurações do espaço de busca."""
+    rng = np.random.default_rng(random_state)
+    return [{name: sampler(rng) for name, sampler in space.items()} for _ in range(n_candidates)]
+
+
+def successive_halving(
+    candidates: List[Dict],
+    evaluate: Callable[[Dict, int, float], float],
+    resources: Sequence[int],
+    time_budget: float,
+    n_jobs: int = 1,
+    halving_factor: int = 3
+) -> Dict:
+    """
+    Successive halving: todos os candidatos são avaliados com pouco recurso
+    e apenas a melhor fração ``1/halving_factor`` segue para o nível seguinte,
+    com mais recurso.
+    
+    O orçamento é um prazo absoluto repassado a ``evaluate``; avaliações que
+    começam depois do prazo devolvem ``inf`` sem treinar, e nenhum nível novo
+    é iniciado após o prazo.
+    
+    Args:
+        candidates: Configurações a testar
+        evaluate: ``evaluate(params, resource, deadline) -> erro`` (menor é melhor)
+        resources: Recurso de cada nível, crescente
+        time_budget: Segundos disponíveis
+        n_jobs: Avaliações em paralelo
+        halving_factor: Fator de redução por nível
+    
+    Returns:
+        Dict com ``params``, ``score`` e ``resource`` do melhor candidato no
+        último nível concluído, além de ``n_trials`` e ``elapsed``
+    """
+    start = time.time()
+    deadline = start + time_budget
+    survivors = list(candidates)
+    best = None
+    n_trials = 0
+    
+    for resource in resources:
+        if best is not None and time.time() >= deadline:
+            break
+        
+        scores = Parallel(n_jobs=n_jobs)(
+            delayed(evaluate)(params, resource, deadline) for params in survivors
+        )
+        n_trials += len(survivors)
+        
+        order = np.argsort(scores)
+        if not np.isfinite(scores[order[0]]):
+            break
+        
+        best = {'params': survivors[order[0]], 'score': float(scores[order[0]]), 'resource': resource}
+        
+        n_keep = max(1, len(survivors) // halving_factor)
+        survivors = [survivors[i] for i in order[:n_keep] if np.isfinite(scores[i])]
+    
+    return {**(best or {}), 'n_trials': n_trials, 'elapsed': time.time() - start}
+
+
+def _evaluate_xgboost(X: np.ndarray, y: np.ndarray, splits: List, params: Dict,
+                      n_estimators: int, deadline: float) -> float:
+    """MAE médio das dobras temporais para uma configuração do XGBoost."""
+    import xgboost as xgb
+    
+    if time.time() >= deadline:
+        return np.inf
+    
+    errors = []
+    for train_idx, test_idx in splits:
+        model = xgb.XGBRegressor(**{**params, 'n_estimators': n_estimators, 'n_jobs': 1})
+        model.fit(X[train_idx], y[train_idx])
+        errors.append(mean_absolute_error(y[test_idx], model.predict(X[test_idx])))
+    return float(np.mean(errors))
+
+
+def _evaluate_prophet(series: pd.DataFrame, splits: List, params: Dict,
+                      n_folds: int, deadline: float) -> float:
+    """MAE médio das ``n_folds`` últimas dobras temporais para o Prophet."""
+    from prophet import Prophet
+    
+    if time.time() >= deadline:
+        return np.inf
+    
+    errors = []
+    for train_idx, test_idx in splits[-n_folds:]:
+        model = Prophet(**params)
+        model.fit(series.iloc[train_idx])
+        forecast = model.predict(series.iloc[test_idx][['ds']])
+        errors.append(mean_absolute_error(series['y'].values[test_idx], forecast['yhat'].values))
+    return float(np.mean(errors))
+
+
+class HyperparameterTuner:
+    """
+    Ajusta XGBoost e Prophet por EPI, offline.
+    
+    A validação usa ``TimeSeriesSplit`` (treino sempre anterior ao teste) e a
+    busca é um successive halving com orçamento de tempo: no XGBoost o
+    recurso é o número de árvores, no Prophet o número de dobras avaliadas.
+    A configuração padrão (``config.model``) também participa, então o
+    resultado nunca é pior que ela na validação. Os melhores parâmetros vão
+    para o registro de modelos e são usados pelos próximos treinos.
+    """
+    
+    def __init__(self, time_budget: int = None, n_candidates: int = None,
+                 cv_splits: int = None, n_jobs: int = None):
+        tuning_config = get_tuning_config()
+        self.time_budget = time_budget or tuning_config.time_budget
+        self.n_candidates = n_candidates or tuning_config.n_candidates
+        self.cv_splits = cv_splits or tuning_config.cv_splits
+        self.n_jobs = n_jobs or tuning_config.n_jobs or config.max_workers
+        self.halving_factor = tuning_config.halving_factor
+    
+    def _resources(self, max_resource: int) -> List[int]:
+        """Níveis de recurso, do maior para o menor dividido pelo fator."""
+        levels = [max_resource]
+        while len(levels) < 4 and levels[-1] // self.halving_factor >= 10:
+            levels.append(levels[-1] // self.halving_factor)
+        return levels[::-1]
+    
+    def tune_xgboost(self, df: pd.DataFrame, epi_name: str) -> Dict:
+        """
+        Busca os hiperparâmetros do XGBoost de um EPI.
+        
+        Returns:
+            Dict com ``params`` (já com ``n_estimators``), ``score`` (MAE de
+            validação), ``baseline_score``, ``n_trials`` e ``elapsed``
+        """
+        from ML.demand_forecasting import FEATURE_COLS
+        
+        df_epi = df[df['epi_name'] == epi_name].sort_values('date')
+        if len(df_epi) < max(30, 10 * (self.cv_splits + 1)):
+            logger.warning(f"Dados insuficientes para ajustar o XGBoost de {epi_name}")
+            return None
+        
+        X = df_epi[FEATURE_COLS].values.astype(float)
+        y = df_epi['quantity'].values.astype(float)
+        splits = list(TimeSeriesSplit(n_splits=self.cv_splits).split(X))
+        
+        base = {k: v for k, v in config.model.xgboost_params.items() if k != 'n_estimators'}
+        candidates = [base] + [
+            {**base, **params} for params in sample_candidates(
+                XGBOOST_SEARCH_SPACE, self.n_candidates - 1, config.model.random_state
+            )
+        ]
+        
+        baseline_estimators = config.model.xgboost_params.get('n_estimators', 100)
+        baseline_score = _evaluate_xgboost(X, y, splits, base, baseline_estimators, np.inf)
+        
+        search = successive_halving(
+            candidates,
+            lambda params, resource, deadline: _evaluate_xgboost(X, y, splits, params, resource, deadline),
+            self._resources(XGBOOST_MAX_ESTIMATORS),
+            self.time_budget,
+            self.n_jobs,
+            self.halving_factor
+        )
+        
+        if not search.get('params') or search['score'] >= baseline_score:
+            params, score = {**base, 'n_estimators': baseline_estimators}, baseline_score
+        else:
+            params, score = {**search['params'], 'n_estimators': search['resource']}, search['score']
+        
+        logger.info(
+            f"XGBoost {epi_name}: MAE {score:.3f} (padrão {baseline_score:.3f}) "
+            f"em {search['n_trials']} avaliações, {search['elapsed']:.0f}s"
+        )
+        
+        return {
+            'params': params,
+            'score': score,
+            'baseline_score': baseline_score,
+            'n_trials': search['n_trials'],
+            'elapsed': search['elapsed']
+        }
+    
+    def tune_prophet(self, df: pd.DataFrame, epi_name: str) -> Dict:
+        """
+        Busca os hiperparâmetros do Prophet de um EPI.
+        
+        Returns:
+            Dict no mesmo formato de ``tune_xgboost``
+        """
+        df_epi = df[df['epi_name'] == epi_name].sort_values('date')
+        if len(df_epi) < max(30, 10 * (self.cv_splits + 1)):
+            logger.warning(f"Dados insuficientes para ajustar o Prophet de {epi_name}")
+            return None
+        
+        series = df_epi[['date', 'quantity']].rename(columns={'date': 'ds', 'quantity': 'y'}).reset_index(drop=True)
+        splits = list(TimeSeriesSplit(n_splits=self.cv_splits).split(series))
+        
+        base = dict(config.model.prophet_params)
+        candidates = [base] + [
+            {**base, **params} for params in sample_candidates(
+                PROPHET_SEARCH_SPACE, max(self.n_candidates // self.halving_factor, 2),
+                config.model.random_state
+            )
+        ]
+        
+        # Nível 1: só a última dobra; nível final: todas
+        resources = sorted({1, max(1, self.cv_splits // 2), self.cv_splits})
+        
+        baseline_score = _evaluate_prophet(series, splits, base, self.cv_splits, np.inf)
+        search = successive_halving(
+            candidates,
+            lambda params, resource, deadline: _evaluate_prophet(series, splits, params, resource, deadline),
+            resources,
+            self.time_budget,
+            self.n_jobs,
+            self.halving_factor
+        )
+        
+        # Só vale o resultado avaliado em todas as dobras, comparável ao padrão
+        if (not search.get('params') or search['resource'] != self.cv_splits
+                or search['score'] >= baseline_score):
+            params, score = base, baseline_score
+        else:
+            params, score = search['params'], search['score']
+        
+        logger.info(
+            f"Prophet {epi_name}: MAE {score:.3f} (padrão {baseline_score:.3f}) "
+            f"em {search['n_trials']} avaliações, {search['elapsed']:.0f}s"
+        )
+        
+        return {
+            'params': params,
+            'score': score,
+            'baseline_score': baseline_score,
+            'n_trials': search['n_trials'],
+            'elapsed': search['elapsed']
+        }
+    
+    def tune_epi(self, df: pd.DataFrame, epi_name: str, registry=None) -> Dict:
+        """
+        Ajusta os dois modelos de um EPI e, se ``registry`` for informado,
+        grava o resultado nele.
+        
+        Returns:
+            Dict ``{'xgboost': ..., 'prophet': ...}`` ou None
+        """
+        tuned = {}
+        for name, tune in (('xgboost', self.tune_xgboost), ('prophet', self.tune_prophet)):
+            try:
+                result = tune(df, epi_name)
+            except Exception as e:
+                logger.error(f"Erro ao ajustar {name} de {epi_name}: {e}")
+                result = None
+            if result:
+                tuned[name] = result
+        
+        if not tuned:
+            return None
+        
+        if registry is not None:
+            registry.save_tuned_params(epi_name, tuned)
+        
+        return tuned
+    
+    def tune_all(self, df: pd.DataFrame, epis: List[str] = None, registry=None) -> Dict[str, Dict]:
+        """Ajusta todos os EPIs (ou os informados), um de cada vez."""
+        if epis is None:
+            epis = sorted(df['epi_name'].unique())
+        
+        logger.info(f"Iniciando busca de hiperparâmetros para {len(epis)} EPIs em {datetime.now()}")
+        
+        results = {}
+        for epi in epis:
+            tuned = self.tune_epi(df, epi, registry)
+            if tuned:
+                results[epi] = tuned
+        
+        logger.info(f"Busca concluída: {len(results)} de {len(epis)} EPIs ajustados")
+        return results
+
+
+# Script para execução offline
+if __name__ == "__main__":
+    from End.Operations import SheetOperations
+    from ML.demand_forecasting import DemandForecasting
+    from ML.model_registry import ModelRegistry
+    
+    data = SheetOperations().carregar_dados()
+    if not data or len(data) <= 1:
+        logger.error("Não foi possível carregar dados")
+    else:
+        df_prepared = DemandForecasting().prepare_data(pd.DataFrame(data[1:], columns=data[0]))
+        HyperparameterTuner().tune_all(
+            df_prepared, registry=ModelRegistry(config.scheduler.models_dir)
+        )
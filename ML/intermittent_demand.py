@@ -0,0 +1,174 @@
+"""
+Previsão de demanda intermitente (Croston, SBA e TSB) vetorizada
+"""
+import numpy as np
+import pandas as pd
+import logging
+from typing import Dict, List
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# Limites de Syntetos & Boylan para classificação da demanda
+ADI_CUTOFF = 1.32
+CV2_CUTOFF = 0.49
+
+INTERMITTENT_CLASSES = ('intermitente', 'irregular')
+
+
+def build_daily_matrix(df: pd.DataFrame, epis: List[str] = None, end_date=None) -> Dict:
+    """
+    Converte o DataFrame preparado em uma matriz diária densa ``[n_epis, n_dias]``.
+
+    Dias sem retirada viram zero. Os dias anteriores à primeira retirada de
+    cada EPI ficam fora da máscara ``active`` e não entram nos cálculos.
+
+    Args:
+        df: DataFrame com ``date``, ``epi_name`` e ``quantity``
+        epis: EPIs a incluir (todos, se None)
+        end_date: Último dia da matriz (padrão: última data do DataFrame)
+
+    Returns:
+        Dict com ``epis``, ``dates``, ``values`` e ``active``
+    """
+    if epis is None:
+        epis = sorted(df['epi_name'].unique())
+
+    df_epis = df[df['epi_name'].isin(epis)]
+    epis = [epi for epi in epis if epi in set(df_epis['epi_name'])]
+
+    if not epis:
+        return {'epis': [], 'dates': pd.DatetimeIndex([]),
+                'values': np.zeros((0, 0)), 'active': np.zeros((0, 0), dtype=bool)}
+
+    dates_norm = pd.to_datetime(df_epis['date']).dt.normalize()
+    start = dates_norm.min()
+    end = pd.Timestamp(end_date).normalize() if end_date is not None else dates_norm.max()
+    dates = pd.date_range(start, end, freq='D')
+
+    row_idx = pd.Categorical(df_epis['epi_name'], categories=epis).codes
+    col_idx = (dates_norm - start).dt.days.values
+    keep = col_idx < len(dates)
+
+    values = np.zeros((len(epis), len(dates)))
+    np.add.at(values, (row_idx[keep], col_idx[keep]), df_epis['quantity'].values[keep].astype(float))
+
+    first_idx = np.full(len(epis), len(dates))
+    np.minimum.at(first_idx, row_idx[keep], col_idx[keep])
+    active = np.arange(len(dates))[None, :] >= first_idx[:, None]
+
+    return {'epis': epis, 'dates': dates, 'values': values, 'active': active}
+
+
+def classify_demand(values: np.ndarray, active: np.ndarray) -> pd.DataFrame:
+    """
+    Classifica cada série pela matriz ADI/CV² (Syntetos & Boylan).
+
+    - ADI: intervalo médio entre demandas (dias ativos / dias com demanda)
+    - CV²: quadrado do coeficiente de variação dos tamanhos de demanda
+
+    Returns:
+        DataFrame com ``adi``, ``cv2`` e ``categoria`` (suave, errática,
+        intermitente ou irregular) por série
+    """
+    nonzero = (values > 0) & active
+    n_active = active.sum(axis=1)
+    n_demand = nonzero.sum(axis=1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        adi = np.where(n_demand > 0, n_active / np.maximum(n_demand, 1), np.inf)
+        sizes = np.where(nonzero, values, 0.0)
+        mean_size = sizes.sum(axis=1) / np.maximum(n_demand, 1)
+        var_size = np.where(nonzero, (values - mean_size[:, None]) ** 2, 0.0).sum(axis=1) / np.maximum(n_demand, 1)
+        cv2 = np.where(mean_size > 0, var_size / mean_size ** 2, 0.0)
+
+    categoria = np.select(
+        [
+            (adi < ADI_CUTOFF) & (cv2 < CV2_CUTOFF),
+            (adi < ADI_CUTOFF) & (cv2 >= CV2_CUTOFF),
+            (adi >= ADI_CUTOFF) & (cv2 < CV2_CUTOFF)
+        ],
+        ['suave', 'errática', 'intermitente'],
+        default='irregular'
+    )
+
+    return pd.DataFrame({
+        'adi': adi,
+        'cv2': cv2,
+        'n_demandas': n_demand,
+        'categoria': categoria
+    })
+
+
+def intermittent_forecast(
+    values: np.ndarray,
+    active: np.ndarray = None,
+    method: str = 'sba',
+    alpha: float = 0.1,
+    beta: float = 0.1
+) -> Dict[str, np.ndarray]:
+    """
+    Ajusta Croston, SBA ou TSB para todas as séries de uma só vez.
+
+    O loop percorre apenas o eixo do tempo; cada passo atualiza todas as
+    séries com operações vetorizadas, então milhares de EPIs custam
+    praticamente o mesmo que um.
+
+    Args:
+        values: Matriz ``[n_series, n_dias]`` de demanda diária
+        active: Máscara de dias válidos por série (padrão: todos)
+        method: ``croston``, ``sba`` ou ``tsb``
+        alpha: Suavização do tamanho da demanda (e do intervalo no Croston/SBA)
+        beta: Suavização da probabilidade de demanda (TSB)
+
+    Returns:
+        Dict com ``forecast`` (demanda diária esperada), ``size`` (tamanho
+        suavizado da demanda) e ``interval``/``probability`` conforme o método
+    """
+    method = method.lower()
+    if method not in ('croston', 'sba', 'tsb'):
+        raise ValueError(f"Método intermitente desconhecido: {method}")
+
+    values = np.asarray(values, dtype=float)
+    n_series, n_days = values.shape
+    if active is None:
+        active = np.ones_like(values, dtype=bool)
+
+    nonzero = (values > 0) & active
+    has_demand = nonzero.any(axis=1)
+
+    # Inicialização: primeira demanda observada e taxa de ocorrência média
+    first_demand = np.argmax(nonzero, axis=1)
+    first_active = np.argmax(active, axis=1)
+    size = np.where(has_demand, values[np.arange(n_series), first_demand], 0.0)
+    interval = np.where(has_demand, first_demand - first_active + 1, 1).astype(float)
+    probability = nonzero.sum(axis=1) / np.maximum(active.sum(axis=1), 1)
+    since_last = np.ones(n_series)
+
+    for t in range(n_days):
+        demand = values[:, t]
+        occurred = nonzero[:, t]
+        is_active = active[:, t]
+
+        size = np.where(occurred, size + alpha * (demand - size), size)
+
+        if method == 'tsb':
+            probability = np.where(
+                is_active, probability + beta * (occurred.astype(float) - probability), probability
+            )
+        else:
+            interval = np.where(occurred, interval + alpha * (since_last - interval), interval)
+            since_last = np.where(occurred, 1.0, np.where(is_active, since_last + 1, since_last))
+
+    if method == 'tsb':
+        forecast = probability * size
+        extra = {'probability': probability}
+    else:
+        forecast = size / np.maximum(interval, 1.0)
+        if method == 'sba':
+            forecast = forecast * (1 - alpha / 2)
+        extra = {'interval': interval}
+
+    forecast = np.where(has_demand, forecast, 0.0)
+    return {'forecast': forecast, 'size': size, **extra}
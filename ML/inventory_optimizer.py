@@ -0,0 +1,252 @@
+"""
+Ponto de pedido, nível máximo e lote econômico para todo o catálogo de EPIs
+"""
+import unicodedata
+import numpy as np
+import pandas as pd
+import logging
+from datetime import datetime
+from typing import Dict, List, Union
+
+from ML.config import get_forecast_config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize('NFKD', str(text))
+    return ''.join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def parse_value(value) -> float:
+    """
+    Converte o ``value`` em float. Aceita o texto cru da planilha (formato
+    brasileiro, ex.: ``R$ 1.234,56``) ou o valor já tratado pelo ``DataLoader``.
+    """
+    if isinstance(value, (int, float, np.number)):
+        return 0.0 if pd.isna(value) else abs(float(value))
+    
+    text = str(value).replace('R$', '').strip()
+    if ',' in text:
+        text = text.replace('.', '').replace(',', '.')
+    try:
+        return abs(float(text))
+    except ValueError:
+        return 0.0
+
+
+def unit_costs_from_transactions(df: pd.DataFrame, months: int = 12) -> Dict[str, float]:
+    """
+    Custo unitário de cada EPI a partir das entradas da planilha.
+    
+    Usa a média ponderada pela quantidade das compras dos últimos ``months``
+    meses; EPIs sem compras recentes ficam com a média de todo o histórico.
+    """
+    df = df[df['transaction_type'].str.lower().str.strip() == 'entrada'].copy()
+    if df.empty:
+        return {}
+    
+    df['date'] = pd.to_datetime(df['date'], errors='coerce')
+    df['quantity'] = pd.to_numeric(df['quantity'], errors='coerce').fillna(0)
+    df['value'] = df['value'].apply(parse_value)
+    df = df[(df['value'] > 0) & (df['quantity'] > 0)]
+    df['valor_total'] = df['value'] * df['quantity']
+    
+    def weighted(frame):
+        totals = frame.groupby('epi_name')[['valor_total', 'quantity']].sum()
+        return totals['valor_total'] / totals['quantity']
+    
+    costs = weighted(df)
+    recent = df[df['date'] >= df['date'].max() - pd.DateOffset(months=months)]
+    costs.update(weighted(recent))
+    return costs.to_dict()
+
+
+def remaining_budget(df: pd.DataFrame, budget_rows: List[List], year: int = None):
+    """
+    Orçamento ainda disponível no ano: valor da aba ``budget`` menos o gasto
+    com entradas já registradas.
+    
+    Args:
+        df: Transações da planilha (com ``value``)
+        budget_rows: Saída de ``SheetOperations.carregar_dados_budget()``
+        year: Ano de referência (padrão: ano atual)
+    
+    Returns:
+        Valor disponível ou None se não houver orçamento para o ano
+    """
+    year = year or datetime.now().year
+    if not budget_rows or len(budget_rows) <= 1:
+        return None
+    
+    budget = pd.DataFrame(budget_rows[1:], columns=budget_rows[0])
+    budget['ano'] = pd.to_numeric(budget['ano'], errors='coerce')
+    budget['valor'] = pd.to_numeric(budget['valor'], errors='coerce')
+    budget_year = budget.loc[budget['ano'] == year, 'valor']
+    if budget_year.empty or budget_year.isna().all():
+        return None
+    
+    entries = df[df['transaction_type'].str.lower().str.strip() == 'entrada']
+    dates = pd.to_datetime(entries['date'], errors='coerce')
+    entries = entries[dates.dt.year == year]
+    spent = (pd.to_numeric(entries['quantity'], errors='coerce').fillna(0)
+             * entries['value'].apply(parse_value)).sum()
+    
+    return max(float(budget_year.sum()) - float(spent), 0.0)
+
+
+def shelf_life_days(epis: List[str], rules: Dict[str, int] = None) -> np.ndarray:
+    """Vida útil em estoque (dias) por EPI, pelas palavras-chave configuradas; inf se não houver limite."""
+    rules = rules if rules is not None else get_forecast_config().shelf_life_days
+    normalized = [_normalize(epi) for epi in epis]
+    limits = np.full(len(epis), np.inf)
+    for keyword, days in rules.items():
+        keyword = _normalize(keyword)
+        hits = np.array([keyword in name for name in normalized], dtype=bool)
+        limits = np.where(hits, np.minimum(limits, days), limits)
+    return limits
+
+
+class InventoryOptimizer:
+    """
+    Política (s, S) para todos os EPIs de uma vez, com arrays NumPy.
+    
+    - Ponto de pedido ``s``: quantil da demanda no prazo de reposição no
+      nível de serviço alvo (da simulação de Monte Carlo)
+    - Lote econômico (EOQ): ``sqrt(2·D·K / (h·c))``, limitado pela vida útil
+      em estoque (o lote precisa ser consumido antes de vencer)
+    - Nível máximo ``S = s + lote``; pede-se ``S - estoque`` quando o
+      estoque está em ``s`` ou abaixo
+    - Orçamento: se o custo total dos pedidos excede o disponível, primeiro
+      se recompõe o ponto de pedido dos EPIs de maior risco de ruptura e o
+      saldo é rateado proporcionalmente no restante
+    """
+    
+    def __init__(self, service_level: float = None, ordering_cost: float = None,
+                 holding_cost_rate: float = None):
+        forecast_config = get_forecast_config()
+        self.service_level = service_level or forecast_config.target_service_level
+        self.ordering_cost = ordering_cost if ordering_cost is not None else forecast_config.ordering_cost
+        self.holding_cost_rate = holding_cost_rate or forecast_config.holding_cost_rate
+    
+    def optimize(
+        self,
+        predictions_df: pd.DataFrame,
+        current_stock: Dict[str, float],
+        unit_costs: Dict[str, float] = None,
+        lead_time_days: Union[int, Dict[str, int]] = None,
+        budget: float = None,
+        risk: pd.DataFrame = None
+    ) -> pd.DataFrame:
+        """
+        Calcula ponto de pedido, nível máximo e quantidade a comprar.
+        
+        Args:
+            predictions_df: Previsão longa de todos os EPIs (``predict_many``)
+            current_stock: Estoque atual por EPI
+            unit_costs: Custo unitário por EPI (ver ``unit_costs_from_transactions``)
+            lead_time_days: Prazo de reposição (único ou por EPI)
+            budget: Valor disponível para compras (ver ``remaining_budget``)
+            risk: Resultado de ``InventorySimulator.simulate``; simulado aqui se None
+        
+        Returns:
+            DataFrame por EPI ordenado pelo risco de ruptura no prazo de reposição
+        """
+        from ML.inventory_simulation import InventorySimulator
+        
+        level_key = f"{int(round(self.service_level * 100))}"
+        if risk is None or f'ponto_pedido_{level_key}' not in risk.columns:
+            risk = InventorySimulator().simulate(
+                predictions_df, current_stock, lead_time_days, service_levels=[self.service_level]
+            )
+        if risk.empty:
+            return pd.DataFrame()
+        
+        unit_costs = unit_costs or {}
+        epis = risk['epi'].tolist()
+        stock = risk['estoque_atual'].values.astype(float)
+        cost = np.array([float(unit_costs.get(epi, 0) or 0) for epi in epis])
+        
+        daily = predictions_df.groupby('epi_name')['ensemble_prediction'].mean().reindex(epis).fillna(0).values
+        annual_demand = daily * 365
+        reorder_point = np.ceil(risk[f'ponto_pedido_{level_key}'].values)
+        safety_stock = risk[f'estoque_seguranca_{level_key}'].values
+        
+        # Lote econômico; sem custo conhecido, cobre o prazo de reposição
+        with np.errstate(divide='ignore', invalid='ignore'):
+            eoq = np.sqrt(2 * annual_demand * self.ordering_cost / (self.holding_cost_rate * cost))
+        eoq = np.where(cost > 0, eoq, risk['demanda_lead_time_media'].values)
+        
+        # Vida útil: o que se compra (mais o estoque de segurança) precisa
+        # ser consumido antes de vencer
+        shelf_life = shelf_life_days(epis)
+        shelf_cap = np.maximum(daily * shelf_life - safety_stock, 0)
+        lot = np.ceil(np.minimum(eoq, shelf_cap))
+        order_up_to = reorder_point + lot
+        
+        order_qty = np.where(stock <= reorder_point, np.maximum(order_up_to - stock, 0), 0)
+        order_qty = np.where(daily > 0, order_qty, 0)
+        
+        plan = pd.DataFrame({
+            'epi': epis,
+            'estoque_atual': stock,
+            'custo_unitario': cost,
+            'demanda_media_diaria': daily,
+            'demanda_anual': annual_demand,
+            'lead_time_dias': risk['lead_time_dias'].values,
+            'vida_util_dias': shelf_life,
+            'estoque_seguranca': np.ceil(safety_stock),
+            'ponto_pedido': reorder_point,
+            'lote_economico': np.ceil(eoq),
+            'lote_limitado_validade': shelf_cap < eoq,
+            'nivel_maximo': order_up_to,
+            'quantidade_pedido': order_qty,
+            'custo_pedido': order_qty * cost,
+            'prob_ruptura_lead_time': risk['prob_ruptura_lead_time'].values
+        })
+        
+        plan['quantidade_orcamento'] = self._apply_budget(plan, budget)
+        plan['custo_orcamento'] = plan['quantidade_orcamento'] * cost
+        
+        logger.info(
+            f"Plano de compras: {int((order_qty > 0).sum())} de {len(epis)} EPIs, "
+            f"custo R$ {plan['custo_pedido'].sum():,.2f}"
+            + (f" (orçamento R$ {budget:,.2f})" if budget is not None else "")
+        )
+        
+        return plan.sort_values(
+            ['prob_ruptura_lead_time', 'custo_pedido'], ascending=[False, False]
+        ).reset_index(drop=True)
+    
+    @staticmethod
+    def _apply_budget(plan: pd.DataFrame, budget: float = None) -> np.ndarray:
+        """Quantidades que cabem no orçamento (ver docstring da classe)."""
+        qty = plan['quantidade_pedido'].values
+        cost = plan['custo_unitario'].values
+        if budget is None or (qty * cost).sum() <= budget:
+            return qty
+        
+        # 1) Recompor o ponto de pedido, do maior para o menor risco
+        essential = np.minimum(np.maximum(plan['ponto_pedido'].values - plan['estoque_atual'].values, 0), qty)
+        order = np.argsort(-plan['prob_ruptura_lead_time'].values, kind='stable')
+        essential_cost = (essential * cost)[order]
+        spent_before = np.concatenate([[0], np.cumsum(essential_cost)[:-1]])
+        affordable = np.clip(budget - spent_before, 0, None)
+        
+        allocated = np.zeros_like(qty, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            allocated[order] = np.where(
+                cost[order] > 0,
+                np.minimum(essential[order], np.floor(affordable / cost[order])),
+                essential[order]
+            )
+        
+        # 2) Saldo rateado proporcionalmente ao custo do restante do lote
+        left = budget - (allocated * cost).sum()
+        extra = qty - allocated
+        extra_cost = (extra * cost).sum()
+        if left > 0 and extra_cost > 0:
+            allocated += np.floor(extra * min(1.0, left / extra_cost))
+        
+        return allocated
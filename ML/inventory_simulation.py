@@ -0,0 +1,283 @@
+"""
+Simulação de Monte Carlo do estoque para todos os EPIs de uma vez
+"""
+import numpy as np
+import pandas as pd
+import logging
+import warnings
+from typing import Dict, List, Union
+
+from ML.config import get_forecast_config, get_model_config
+from ML.conformal import quantile_column
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def forecast_arrays(predictions_df: pd.DataFrame, epis: List[str] = None) -> Dict:
+    """
+    Converte a previsão longa (``predict_many``/``predict_future_demand``)
+    em matrizes ``[n_epis, n_dias]``.
+    
+    Returns:
+        Dict com ``epis``, ``mean``, ``lower``, ``upper``, ``intermittent``
+        (True para EPIs previstos pelo caminho Croston/SBA/TSB) e, se a
+        previsão tiver quantis, ``q_low``/``q_mid``/``q_high`` (menor, mediano
+        e maior quantil de ``config.model.quantiles``) com ``has_quantiles``
+    """
+    if epis is None:
+        epis = list(dict.fromkeys(predictions_df['epi_name']))
+    
+    df = predictions_df[predictions_df['epi_name'].isin(epis)].sort_values(['epi_name', 'date'])
+    rows = pd.Categorical(df['epi_name'], categories=epis).codes
+    cols = df.groupby('epi_name', sort=False).cumcount().values
+    horizon = int(cols.max()) + 1 if len(cols) else 0
+    
+    arrays = {}
+    columns = [('mean', 'ensemble_prediction'), ('lower', 'lower_bound'), ('upper', 'upper_bound')]
+    
+    quantiles = sorted(get_model_config().quantiles)
+    quantile_columns = [quantile_column(q) for q in (quantiles[0], 0.5, quantiles[-1])]
+    if all(col in df.columns for col in quantile_columns):
+        columns += list(zip(('q_low', 'q_mid', 'q_high'), quantile_columns))
+        complete = df[quantile_columns].notna().all(axis=1).groupby(df['epi_name'].values).all()
+        arrays['has_quantiles'] = complete.reindex(epis, fill_value=False).values.astype(bool)
+    
+    for name, col in columns:
+        matrix = np.zeros((len(epis), horizon))
+        matrix[rows, cols] = df[col].fillna(0).values
+        arrays[name] = np.maximum(matrix, 0)
+    
+    intermittent = np.zeros(len(epis), dtype=bool)
+    if 'intermittent_prediction' in df.columns:
+        flagged = df.loc[df['intermittent_prediction'].notna(), 'epi_name'].unique()
+        intermittent = np.isin(np.asarray(epis, dtype=object), flagged)
+    
+    return {'epis': list(epis), 'intermittent': intermittent, **arrays}
+
+
+def history_residuals(df: pd.DataFrame, epis: List[str] = None, window: int = 30) -> Dict[str, np.ndarray]:
+    """
+    Resíduos históricos por EPI para o bootstrap: quantidade observada menos
+    a média móvel dos ``window`` registros anteriores (erro de um passo à
+    frente de um nível simples, sem precisar retreinar os modelos).
+    """
+    if epis is not None:
+        df = df[df['epi_name'].isin(epis)]
+    df = df.sort_values('date')
+    
+    level = df.groupby('epi_name')['quantity'].transform(
+        lambda s: s.shift(1).rolling(window, min_periods=1).mean()
+    )
+    residuals = (df['quantity'] - level).dropna()
+    return {epi: values.values for epi, values in residuals.groupby(df.loc[residuals.index, 'epi_name'])}
+
+
+class InventorySimulator:
+    """
+    Simula trajetórias de demanda para todos os EPIs em arrays NumPy
+    ``[n_epis, n_simulacoes, n_dias]`` e mede o risco de ruptura do estoque.
+    
+    A demanda diária é sorteada a partir da distribuição da previsão:
+    
+    - ``interval``: normal com centro e desvio dados pelos quantis da
+      previsão (``p50``/``p90``) ou, sem eles, média
+      ``ensemble_prediction`` e desvio derivado de ``lower_bound``/``upper_bound``
+      (intervalo do Prophet); EPIs intermitentes usam
+      Bernoulli(taxa / tamanho) × tamanho
+    - ``bootstrap``: média prevista mais resíduos históricos reamostrados
+    
+    Os EPIs são processados em blocos para limitar a memória.
+    """
+    
+    def __init__(self, n_simulations: int = None, random_state: int = 42, max_block_size: int = 5_000_000):
+        """
+        Args:
+            n_simulations: Trajetórias por EPI (padrão: ``config.forecast.n_simulations``)
+            random_state: Semente do gerador
+            max_block_size: Máximo de elementos ``epis × simulações × dias`` por bloco
+        """
+        forecast_config = get_forecast_config()
+        self.n_simulations = n_simulations or forecast_config.n_simulations
+        self.random_state = random_state
+        self.max_block_size = max_block_size
+    
+    def sample_demand(
+        self,
+        arrays: Dict,
+        method: str = 'interval',
+        residuals: List[np.ndarray] = None,
+        rng: np.random.Generator = None
+    ) -> np.ndarray:
+        """
+        Sorteia as trajetórias de demanda diária.
+        
+        Args:
+            arrays: Saída de ``forecast_arrays`` (ou um recorte dela)
+            method: ``interval`` ou ``bootstrap``
+            residuals: Resíduos de cada EPI, na ordem de ``arrays['epis']``
+                (obrigatório no bootstrap)
+            rng: Gerador de números aleatórios
+        
+        Returns:
+            Array ``[n_epis, n_simulacoes, n_dias]`` (float32, sem negativos)
+        """
+        from scipy.stats import norm
+        
+        rng = rng or np.random.default_rng(self.random_state)
+        mean = arrays['mean'][:, None, :]
+        n_epis, _, horizon = mean.shape
+        shape = (n_epis, self.n_simulations, horizon)
+        
+        if method == 'bootstrap':
+            if residuals is None:
+                raise ValueError("O bootstrap precisa dos resíduos históricos de cada EPI")
+            
+            # Resíduos em uma matriz retangular; cada EPI sorteia só dentro
+            # do seu próprio comprimento
+            lengths = np.array([max(len(r), 1) for r in residuals])
+            padded = np.zeros((n_epis, lengths.max()))
+            for i, r in enumerate(residuals):
+                padded[i, :len(r)] = r
+            idx = (rng.random(shape) * lengths[:, None, None]).astype(np.int64)
+            noise = np.take_along_axis(padded[:, None, :], idx.reshape(n_epis, 1, -1), axis=2).reshape(shape)
+            demand = mean + noise
+        
+        elif method == 'interval':
+            width = get_forecast_config().prophet_interval_width
+            z = norm.ppf(0.5 + width / 2)
+            sigma = (arrays['upper'] - arrays['lower']) / (2 * z)
+            center = arrays['mean']
+            
+            # Quantis conformes da previsão, quando houver: centro na mediana
+            # e desvio pela cauda superior (a que causa ruptura; a inferior
+            # é cortada em zero)
+            if 'has_quantiles' in arrays and arrays['has_quantiles'].any():
+                z_high = norm.ppf(max(get_model_config().quantiles))
+                calibrated = arrays['has_quantiles'][:, None]
+                sigma = np.where(calibrated, (arrays['q_high'] - arrays['q_mid']) / z_high, sigma)
+                center = np.where(calibrated, arrays['q_mid'], center)
+            
+            demand = center[:, None, :] + sigma[:, None, :] * rng.standard_normal(shape)
+            
+            # Demanda esporádica: ou não há retirada, ou sai o tamanho típico
+            intermittent = arrays['intermittent']
+            if intermittent.any():
+                size = np.maximum(arrays['upper'][intermittent], 1e-9)[:, None, :]
+                prob = np.clip(arrays['mean'][intermittent][:, None, :] / size, 0, 1)
+                occurs = rng.random((intermittent.sum(), self.n_simulations, horizon)) < prob
+                demand[intermittent] = occurs * size
+        else:
+            raise ValueError(f"Método de simulação desconhecido: {method}")
+        
+        return np.maximum(demand, 0).astype(np.float32)
+    
+    def simulate(
+        self,
+        predictions_df: pd.DataFrame,
+        current_stock: Dict[str, float],
+        lead_time_days: Union[int, Dict[str, int]] = None,
+        service_levels: List[float] = None,
+        method: str = 'interval',
+        residuals: Dict[str, np.ndarray] = None
+    ) -> pd.DataFrame:
+        """
+        Simula o consumo do estoque atual ao longo do horizonte previsto.
+        
+        Args:
+            predictions_df: Previsão longa de um ou mais EPIs
+            current_stock: Estoque atual por EPI
+            lead_time_days: Prazo de reposição (único ou por EPI); padrão
+                ``config.forecast.default_lead_time_days``
+            service_levels: Níveis de serviço do ponto de pedido
+                (padrão ``config.forecast.service_levels``)
+            method: ``interval`` ou ``bootstrap``
+            residuals: Resíduos por EPI para o bootstrap (ver ``history_residuals``)
+        
+        Returns:
+            DataFrame por EPI com probabilidade de ruptura no horizonte e no
+            prazo de reposição, falta esperada, dias até a ruptura, demanda
+            no prazo de reposição e ponto de pedido / estoque de segurança
+            por nível de serviço
+        """
+        forecast_config = get_forecast_config()
+        service_levels = service_levels or forecast_config.service_levels
+        if lead_time_days is None:
+            lead_time_days = forecast_config.default_lead_time_days
+        
+        arrays = forecast_arrays(predictions_df)
+        epis = arrays['epis']
+        if not epis:
+            return pd.DataFrame()
+        
+        n_epis, horizon = arrays['mean'].shape
+        stock = np.array([float(current_stock.get(epi, 0)) for epi in epis])
+        if isinstance(lead_time_days, dict):
+            default_lead = forecast_config.default_lead_time_days
+            lead = np.array([lead_time_days.get(epi, default_lead) for epi in epis])
+        else:
+            lead = np.full(n_epis, lead_time_days)
+        lead = np.clip(lead.astype(int), 1, horizon)
+        
+        residual_list = None
+        if method == 'bootstrap':
+            residuals = residuals or {}
+            residual_list = [np.asarray(residuals.get(epi, [0.0]), dtype=float) for epi in epis]
+        
+        rng = np.random.default_rng(self.random_state)
+        block = max(1, self.max_block_size // (self.n_simulations * horizon))
+        results = []
+        
+        for start in range(0, n_epis, block):
+            sl = slice(start, start + block)
+            chunk = {key: value[sl] for key, value in arrays.items()}
+            paths = self.sample_demand(
+                chunk, method, residual_list[sl] if residual_list is not None else None, rng
+            )
+            results.append(self._risk_metrics(paths, stock[sl], lead[sl], service_levels))
+        
+        metrics = {key: np.concatenate([r[key] for r in results]) for key in results[0]}
+        report = pd.DataFrame({'epi': epis, 'estoque_atual': stock, 'lead_time_dias': lead, **metrics})
+        
+        logger.info(
+            f"Simulação concluída: {n_epis} EPIs × {self.n_simulations} trajetórias × {horizon} dias"
+        )
+        return report
+    
+    @staticmethod
+    def _risk_metrics(paths: np.ndarray, stock: np.ndarray, lead: np.ndarray,
+                      service_levels: List[float]) -> Dict[str, np.ndarray]:
+        """Métricas de risco de um bloco de trajetórias ``[n_epis, n_sims, n_dias]``."""
+        cumulative = np.cumsum(paths, axis=2)
+        total = cumulative[:, :, -1]
+        
+        # Como a demanda nunca é negativa, a ruptura acontece se e somente
+        # se a demanda acumulada ultrapassa o estoque em algum dia
+        stockout = total > stock[:, None]
+        first_day = np.where(stockout, np.argmax(cumulative > stock[:, None, None], axis=2) + 1, np.nan)
+        
+        lead_demand = np.take_along_axis(
+            cumulative, np.broadcast_to((lead - 1)[:, None, None], (len(lead), cumulative.shape[1], 1)), axis=2
+        )[:, :, 0]
+        lead_mean = lead_demand.mean(axis=1)
+        
+        # EPIs sem nenhuma ruptura simulada ficam com NaN em dias_ate_ruptura
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            metrics = {
+                'prob_ruptura': stockout.mean(axis=1),
+                'prob_ruptura_lead_time': (lead_demand > stock[:, None]).mean(axis=1),
+                'falta_esperada': np.maximum(total - stock[:, None], 0).mean(axis=1),
+                'dias_ate_ruptura_p50': np.nanmedian(first_day, axis=1),
+                'demanda_horizonte_media': total.mean(axis=1),
+                'demanda_lead_time_media': lead_mean,
+                'demanda_lead_time_desvio': lead_demand.std(axis=1)
+            }
+        
+        for level in service_levels:
+            rop = np.quantile(lead_demand, level, axis=1)
+            suffix = f"{int(round(level * 100))}"
+            metrics[f'ponto_pedido_{suffix}'] = rop
+            metrics[f'estoque_seguranca_{suffix}'] = np.maximum(rop - lead_mean, 0)
+        
+        return metrics
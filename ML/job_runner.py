@@ -0,0 +1,393 @@
+"""
+Execução de tarefas pesadas de ML em segundo plano
+"""
+import os
+import json
+import uuid
+import hashlib
+import logging
+import threading
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import joblib
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# Estados possíveis de uma tarefa
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+INTERRUPTED = 'interrupted'
+
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+STATUS_LABELS = {
+    QUEUED: '⏳ Na fila',
+    RUNNING: '⚙️ Em execução',
+    DONE: '✅ Concluída',
+    FAILED: '❌ Falhou',
+    CANCELLED: '⏹️ Cancelada',
+    INTERRUPTED: '⚠️ Interrompida'
+}
+
+
+# ---------------------------------------------------------------------------
+# Tarefas disponíveis (funções de módulo, executadas nos processos do pool)
+# ---------------------------------------------------------------------------
+
+def forecast_task(df: pd.DataFrame, epi: str, days_ahead: int = 90, use_global_model: bool = False):
+    """Previsão de demanda de um EPI."""
+    from ML.demand_forecasting import DemandForecasting
+    return DemandForecasting().predict_future_demand(
+        df, epi, days_ahead, use_global_model=use_global_model
+    )
+
+
+def recommendations_task(df: pd.DataFrame, current_stock: Dict[str, float], safety_days: int = 30,
+                         use_global_model: bool = False, days_ahead: int = 90,
+                         unit_costs: Dict[str, float] = None, budget: float = None):
+    """
+    Previsão de todos os EPIs (em lote) seguida das recomendações de compra,
+    da simulação de risco de ruptura e do plano de compras (ponto de pedido
+    e lote econômico, limitado ao orçamento).
+    """
+    from ML.demand_forecasting import DemandForecasting
+    from ML.inventory_simulation import InventorySimulator
+    from ML.inventory_optimizer import InventoryOptimizer
+    forecaster = DemandForecasting()
+    
+    all_predictions_df = forecaster.predict_many(df, days_ahead=days_ahead, use_global_model=use_global_model)
+    if all_predictions_df is None:
+        return None
+    
+    risk = InventorySimulator().simulate(all_predictions_df, current_stock)
+    
+    return {
+        'predictions': all_predictions_df,
+        'recommendations': forecaster.generate_purchase_recommendations(
+            all_predictions_df, current_stock, safety_days
+        ),
+        'risk': risk,
+        'purchase_plan': InventoryOptimizer().optimize(
+            all_predictions_df, current_stock, unit_costs, budget=budget, risk=risk
+        ),
+        'budget': budget
+    }
+
+
+def backtest_task(df: pd.DataFrame, epi: str, train_size: int = 180, test_size: int = 30):
+    """Backtest de um EPI."""
+    from ML.performance_analyzer import PerformanceAnalyzer
+    return PerformanceAnalyzer().backtest_model(df, epi, train_size, test_size)
+
+
+def compare_task(df: pd.DataFrame, epi: str):
+    """Comparação entre ML e métodos tradicionais para um EPI."""
+    from ML.performance_analyzer import PerformanceAnalyzer
+    return PerformanceAnalyzer().compare_forecast_methods(df, epi)
+
+
+TASKS = {
+    'forecast': forecast_task,
+    'recommendations': recommendations_task,
+    'backtest': backtest_task,
+    'compare': compare_task
+}
+
+
+# ---------------------------------------------------------------------------
+# Persistência do estado
+# ---------------------------------------------------------------------------
+
+def _write_json(path: str, data: Dict):
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False, default=str)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str) -> Optional[Dict]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def _update_status(jobs_dir: str, job_id: str, **fields) -> Dict:
+    path = os.path.join(jobs_dir, f"{job_id}.json")
+    status = _read_json(path) or {'job_id': job_id}
+    status.update(fields)
+    _write_json(path, status)
+    return status
+
+
+def _run_job(jobs_dir: str, job_id: str, kind: str, params: Dict):
+    """
+    Ponto de entrada no processo de trabalho: executa a tarefa e grava o
+    resultado em disco. O estado é sempre atualizado pelo próprio processo,
+    então sobrevive a reruns e reinícios da página.
+    """
+    status = _read_json(os.path.join(jobs_dir, f"{job_id}.json")) or {}
+    if status.get('status') == CANCELLED:
+        return
+    
+    _update_status(jobs_dir, job_id, status=RUNNING, pid=os.getpid(),
+                   started_at=datetime.now().isoformat())
+    try:
+        result = TASKS[kind](**params)
+        
+        result_path = os.path.join(jobs_dir, f"{job_id}.joblib")
+        tmp_path = f"{result_path}.tmp"
+        joblib.dump(result, tmp_path)
+        os.replace(tmp_path, result_path)
+        
+        _update_status(jobs_dir, job_id, status=DONE, finished_at=datetime.now().isoformat(),
+                       has_result=result is not None)
+    except Exception as e:
+        logger.error(f"Erro na tarefa {job_id} ({kind}): {e}")
+        _update_status(jobs_dir, job_id, status=FAILED, finished_at=datetime.now().isoformat(),
+                       error=f"{type(e).__name__}: {e}")
+
+
+def _params_key(kind: str, params: Dict) -> str:
+    """Identifica a combinação tarefa + parâmetros (DataFrames pelo conteúdo)."""
+    digest = hashlib.sha256(kind.encode())
+    for name in sorted(params):
+        value = params[name]
+        digest.update(name.encode())
+        if isinstance(value, pd.DataFrame):
+            digest.update(pd.util.hash_pandas_object(value, index=False).values.tobytes())
+            digest.update(','.join(map(str, value.columns)).encode())
+        else:
+            digest.update(json.dumps(value, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def _process_alive(pid) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Executor
+# ---------------------------------------------------------------------------
+
+class JobRunner:
+    """
+    Fila local de tarefas executadas em processos de trabalho.
+    
+    Cada tarefa recebe um ID e tem seu estado (``<id>.json``) e resultado
+    (``<id>.joblib``) gravados em ``config.cache_dir/jobs``. A página apenas
+    envia a tarefa e consulta o estado; o cálculo continua mesmo que o
+    usuário navegue para outra página, e o resultado pode ser recuperado
+    depois pelo ID. Reenviar a mesma tarefa com os mesmos dados devolve a
+    tarefa existente em vez de recalcular. Apenas as ``max_jobs`` tarefas
+    mais recentes são mantidas em disco.
+    """
+    
+    def __init__(self, jobs_dir: str = None, max_workers: int = None, max_jobs: int = None):
+        from ML.config import config
+        
+        self.jobs_dir = jobs_dir or os.path.join(config.cache_dir, 'jobs')
+        self.max_workers = max_workers or config.max_workers
+        self.max_jobs = max_jobs or config.max_jobs
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        
+        self._executor = None
+        self._futures = {}
+        # Reentrante: ``submit`` consulta ``status`` com o lock já adquirido
+        self._lock = threading.RLock()
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # ``spawn`` evita herdar as threads do servidor Streamlit no fork
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+    
+    def submit(self, kind: str, description: str = '', **params) -> str:
+        """
+        Enfileira uma tarefa.
+        
+        Args:
+            kind: Tipo da tarefa (chave de ``TASKS``)
+            description: Texto exibido na lista de tarefas
+            **params: Argumentos da tarefa (precisam ser serializáveis)
+        
+        Returns:
+            ID da tarefa (de uma tarefa idêntica já existente, se houver)
+        """
+        if kind not in TASKS:
+            raise ValueError(f"Tipo de tarefa desconhecido: {kind}")
+        
+        params_key = _params_key(kind, params)
+        
+        with self._lock:
+            for job in self.list_jobs(kind):
+                if job.get('params_key') == params_key and job['status'] in ACTIVE_STATES + (DONE,):
+                    logger.info(f"Reutilizando tarefa {job['job_id']} ({kind})")
+                    return job['job_id']
+            
+            # O estado QUEUED e o future são registrados juntos, sob o lock,
+            # para ``status`` nunca ver a tarefa sem o future (órfã)
+            job_id = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}"
+            _write_json(os.path.join(self.jobs_dir, f"{job_id}.json"), {
+                'job_id': job_id,
+                'kind': kind,
+                'description': description,
+                'params_key': params_key,
+                'status': QUEUED,
+                'created_at': datetime.now().isoformat()
+            })
+            
+            future = self._get_executor().submit(_run_job, self.jobs_dir, job_id, kind, params)
+            self._futures[job_id] = future
+            future.add_done_callback(lambda f, job_id=job_id: self._on_done(job_id, f))
+        
+        logger.info(f"Tarefa {job_id} ({kind}) enviada para execução")
+        return job_id
+    
+    def _on_done(self, job_id: str, future):
+        if future.cancelled():
+            with self._lock:
+                self._futures.pop(job_id, None)
+            return
+        error = future.exception()
+        with self._lock:
+            if error is not None:
+                # O processo morreu antes de gravar o próprio estado
+                _update_status(self.jobs_dir, job_id, status=FAILED,
+                               finished_at=datetime.now().isoformat(), error=str(error))
+            self._futures.pop(job_id, None)
+    
+    def status(self, job_id: str) -> Optional[Dict]:
+        """
+        Estado atual da tarefa. Tarefas ativas cujo processo não existe mais
+        (servidor reiniciado) são marcadas como interrompidas.
+        """
+        with self._lock:
+            status = _read_json(os.path.join(self.jobs_dir, f"{job_id}.json"))
+            if status is None:
+                return None
+            
+            orphan = job_id not in self._futures and (
+                status['status'] == QUEUED
+                or (status['status'] == RUNNING and not _process_alive(status.get('pid')))
+            )
+            if orphan:
+                status = _update_status(self.jobs_dir, job_id, status=INTERRUPTED)
+        
+        return status
+    
+    def result(self, job_id: str):
+        """Carrega o resultado de uma tarefa concluída (None se não houver)."""
+        status = self.status(job_id)
+        if not status or status['status'] != DONE:
+            return None
+        
+        result_path = os.path.join(self.jobs_dir, f"{job_id}.joblib")
+        if not os.path.exists(result_path):
+            return None
+        return joblib.load(result_path)
+    
+    def cancel(self, job_id: str) -> bool:
+        """Cancela uma tarefa que ainda está na fila."""
+        with self._lock:
+            future = self._futures.get(job_id)
+            if future is not None and future.cancel():
+                _update_status(self.jobs_dir, job_id, status=CANCELLED,
+                               finished_at=datetime.now().isoformat())
+                return True
+        return False
+    
+    def list_jobs(self, kind: str = None, limit: int = None) -> List[Dict]:
+        """
+        Tarefas registradas, das mais recentes para as mais antigas. Aplica
+        a retenção: tarefas já terminadas além das ``max_jobs`` mais
+        recentes têm os arquivos apagados.
+        """
+        jobs = []
+        for entry in os.scandir(self.jobs_dir):
+            if not entry.name.endswith('.json'):
+                continue
+            status = self.status(entry.name[:-len('.json')])
+            if status:
+                jobs.append(status)
+        
+        jobs.sort(key=lambda job: job.get('created_at', ''), reverse=True)
+        jobs = self._prune(jobs)
+        
+        if kind is not None:
+            jobs = [job for job in jobs if job.get('kind') == kind]
+        return jobs[:limit] if limit else jobs
+    
+    def _prune(self, jobs: List[Dict]) -> List[Dict]:
+        """
+        Apaga as tarefas terminadas além das ``max_jobs`` mais recentes e os
+        resultados sem arquivo de estado. Devolve as tarefas mantidas.
+        """
+        kept, removed = [], 0
+        for job in jobs:
+            if len(kept) >= self.max_jobs and job['status'] not in ACTIVE_STATES:
+                self._remove_files(job['job_id'])
+                removed += 1
+            else:
+                kept.append(job)
+        
+        known = {job['job_id'] for job in kept}
+        for entry in os.scandir(self.jobs_dir):
+            if entry.name.endswith('.joblib') and entry.name[:-len('.joblib')] not in known:
+                try:
+                    os.remove(entry.path)
+                    removed += 1
+                except OSError:
+                    pass
+        
+        if removed:
+            logger.info(f"{removed} arquivo(s) de tarefas antigas removido(s) de {self.jobs_dir}")
+        return kept
+    
+    def _remove_files(self, job_id: str):
+        for ext in ('.json', '.joblib'):
+            path = os.path.join(self.jobs_dir, f"{job_id}{ext}")
+            if os.path.exists(path):
+                os.remove(path)
+    
+    def delete(self, job_id: str):
+        """
+        Remove estado e resultado de uma tarefa que não está em execução e
+        aplica a retenção às demais (ver ``list_jobs``).
+        """
+        with self._lock:
+            status = self.status(job_id)
+            if status and status['status'] in ACTIVE_STATES:
+                raise RuntimeError(f"Tarefa {job_id} ainda está em execução")
+            self._remove_files(job_id)
+        self.list_jobs()
+
+
+_runner = None
+
+
+def get_job_runner() -> JobRunner:
+    """Executor único do processo, compartilhado entre sessões e reruns."""
+    global _runner
+    if _runner is None:
+        _runner = JobRunner()
+    return _runner
@@ -0,0 +1,300 @@
+"""
+Armazenamento dos modelos treinados em formatos nativos e portáveis
+"""
+import os
+import json
+import logging
+import tempfile
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ML.config import config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+MANIFEST_FILE = 'manifest.json'
+XGBOOST_FILE = 'xgboost_model.ubj'
+PROPHET_FILE = 'prophet_model.json'
+TUNED_PARAMS_FILE = 'tuned_params.json'
+RESIDUALS_FILE = 'residuals.json'
+MANIFEST_VERSION = 1
+
+
+def _atomic_write(path: str, data, mode: str = 'w'):
+    """Escreve em arquivo temporário e renomeia, para nunca deixar artefato pela metade."""
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp_')
+    try:
+        with os.fdopen(fd, mode, **({'encoding': 'utf-8'} if 'b' not in mode else {})) as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _json_params(params: Dict) -> Dict:
+    """Parâmetros serializáveis em JSON (descarta callbacks e objetos)."""
+    safe = {}
+    for name, value in params.items():
+        if callable(value):
+            continue
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError):
+            continue
+        safe[name] = value
+    return safe
+
+
+def _library_versions() -> Dict[str, str]:
+    versions = {}
+    for name in ('xgboost', 'prophet'):
+        try:
+            module = __import__(name)
+            versions[name] = getattr(module, '__version__', 'desconhecida')
+        except ImportError:
+            pass
+    return versions
+
+
+class ModelArtifacts:
+    """
+    Modelos de um EPI carregados sob demanda.
+
+    Abrir o registro lê apenas o manifesto (JSON pequeno); o booster do
+    XGBoost e o Prophet só são desserializados no primeiro acesso. Mantém a
+    interface de dicionário usada antes (``artifacts['xgboost']``).
+    """
+
+    def __init__(self, model_path: str, manifest: Dict):
+        self.model_path = model_path
+        self.manifest = manifest
+        self._cache = {}
+
+    @property
+    def metrics(self) -> Dict:
+        return self.manifest.get('metrics', {})
+
+    @property
+    def xgboost(self):
+        if 'xgboost' not in self._cache:
+            import xgboost as xgb
+            model = xgb.XGBRegressor()
+            # O loader nativo lê direto do arquivo, sem passar pelo pickle
+            model.load_model(os.path.join(self.model_path, self.manifest['files']['xgboost']))
+            # O UBJ guarda só o booster: os hiperparâmetros do sklearn vêm do manifesto
+            if self.manifest.get('xgboost_params'):
+                model.set_params(**self.manifest['xgboost_params'])
+            self._cache['xgboost'] = model
+        return self._cache['xgboost']
+
+    @property
+    def prophet(self):
+        if 'prophet' not in self._cache:
+            from prophet.serialize import model_from_json
+            with open(os.path.join(self.model_path, self.manifest['files']['prophet']), 'r', encoding='utf-8') as f:
+                self._cache['prophet'] = model_from_json(f.read())
+        return self._cache['prophet']
+
+    def __getitem__(self, key):
+        if key in ('xgboost', 'prophet', 'metrics'):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+class ModelRegistry:
+    """
+    Registro em disco dos modelos por EPI.
+
+    Layout de cada EPI::
+
+        <models_dir>/<EPI>/manifest.json        metadados, métricas, versões e parâmetros
+        <models_dir>/<EPI>/xgboost_model.ubj    booster nativo (UBJSON)
+        <models_dir>/<EPI>/prophet_model.json   serializador JSON do Prophet
+        <models_dir>/<EPI>/tuned_params.json    melhores hiperparâmetros da busca
+        <models_dir>/<EPI>/residuals.json       erros de validação, por horizonte
+
+    Diretórios antigos com ``*.pkl`` (joblib) continuam legíveis e são
+    convertidos no próximo ``save``.
+
+    ``models_dir`` relativo (o padrão é ``config.scheduler.models_dir``) é
+    resolvido a partir da raiz do projeto, não do diretório de trabalho.
+    Abrir o registro não toca o disco: os diretórios só são criados ao
+    salvar.
+    """
+
+    def __init__(self, models_dir: str = None):
+        models_dir = models_dir or config.scheduler.models_dir
+        if not os.path.isabs(models_dir):
+            models_dir = os.path.join(os.path.dirname(config.base_dir), models_dir)
+        self.models_dir = models_dir
+
+    def model_path(self, epi_name: str) -> str:
+        return os.path.join(self.models_dir, f"{epi_name.replace(' ', '_')}")
+
+    def save(self, epi_name: str, xgb_model, prophet_model, metrics: Dict, extra: Dict = None,
+             residuals: Dict = None) -> Dict:
+        """
+        Salva os modelos de um EPI e escreve o manifesto por último, de modo
+        que um manifesto sempre aponta para artefatos completos.
+
+        ``residuals`` (``{'horizon': [...], 'residual': [...]}``) são os erros
+        das previsões de validação do ensemble, usados para calibrar os
+        quantis sem reajustar modelos na previsão.
+        """
+        from prophet.serialize import model_to_json
+
+        model_path = self.model_path(epi_name)
+        os.makedirs(model_path, exist_ok=True)
+
+        xgb_tmp = os.path.join(model_path, f".tmp_{XGBOOST_FILE}")
+        xgb_model.save_model(xgb_tmp)
+        os.replace(xgb_tmp, os.path.join(model_path, XGBOOST_FILE))
+
+        _atomic_write(os.path.join(model_path, PROPHET_FILE), model_to_json(prophet_model))
+
+        files = {'xgboost': XGBOOST_FILE, 'prophet': PROPHET_FILE}
+        residuals_path = os.path.join(model_path, RESIDUALS_FILE)
+        if residuals is not None:
+            _atomic_write(residuals_path, json.dumps({
+                'horizon': [int(h) for h in residuals['horizon']],
+                'residual': [float(r) for r in residuals['residual']]
+            }))
+            files['residuals'] = RESIDUALS_FILE
+        elif os.path.exists(residuals_path):
+            # Erros de outro modelo não valem para este
+            os.remove(residuals_path)
+
+        manifest = {
+            'manifest_version': MANIFEST_VERSION,
+            'epi_name': epi_name,
+            'saved_at': datetime.now().isoformat(),
+            'files': files,
+            'library_versions': _library_versions(),
+            'metrics': metrics,
+            'xgboost_params': _json_params(xgb_model.get_params()),
+            **(extra or {})
+        }
+        _atomic_write(
+            os.path.join(model_path, MANIFEST_FILE),
+            json.dumps(manifest, indent=2, ensure_ascii=False, default=str)
+        )
+
+        # Remover pickles legados após a conversão
+        for legacy in ('xgboost_model.pkl', 'prophet_model.pkl', 'metrics.pkl'):
+            legacy_path = os.path.join(model_path, legacy)
+            if os.path.exists(legacy_path):
+                os.remove(legacy_path)
+
+        return manifest
+
+    def load_manifest(self, epi_name: str) -> Optional[Dict]:
+        """Lê apenas o manifesto de um EPI (ou as métricas legadas em pickle)."""
+        model_path = self.model_path(epi_name)
+        manifest_path = os.path.join(model_path, MANIFEST_FILE)
+
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+        legacy_metrics = os.path.join(model_path, 'metrics.pkl')
+        if os.path.exists(legacy_metrics):
+            import joblib
+            metrics = joblib.load(legacy_metrics)
+            return {
+                'manifest_version': 0,
+                'epi_name': epi_name,
+                'files': {'xgboost': 'xgboost_model.pkl', 'prophet': 'prophet_model.pkl'},
+                'metrics': {k: metrics.get(k) for k in ('xgboost', 'prophet')},
+                **{k: v for k, v in metrics.items() if k not in ('xgboost', 'prophet')}
+            }
+
+        return None
+
+    def load(self, epi_name: str) -> Optional[ModelArtifacts]:
+        """Abre os modelos de um EPI; a desserialização acontece no primeiro acesso."""
+        manifest = self.load_manifest(epi_name)
+        if manifest is None:
+            return None
+
+        model_path = self.model_path(epi_name)
+        artifacts = ModelArtifacts(model_path, manifest)
+
+        if manifest.get('manifest_version') == 0:
+            import joblib
+            artifacts._cache['xgboost'] = joblib.load(os.path.join(model_path, 'xgboost_model.pkl'))
+            artifacts._cache['prophet'] = joblib.load(os.path.join(model_path, 'prophet_model.pkl'))
+
+        return artifacts
+
+    def save_tuned_params(self, epi_name: str, tuned: Dict) -> Dict:
+        """
+        Grava os hiperparâmetros ajustados de um EPI.
+
+        Ficam em arquivo separado do manifesto porque a busca roda fora do
+        ciclo de treino; o próximo treino completo passa a usá-los.
+        """
+        model_path = self.model_path(epi_name)
+        os.makedirs(model_path, exist_ok=True)
+
+        data = {'epi_name': epi_name, 'tuned_at': datetime.now().isoformat(), **tuned}
+        _atomic_write(
+            os.path.join(model_path, TUNED_PARAMS_FILE),
+            json.dumps(data, indent=2, ensure_ascii=False, default=str)
+        )
+        return data
+
+    def load_tuned_params(self, epi_name: str) -> Dict:
+        """Hiperparâmetros ajustados de um EPI (vazio se nunca foi ajustado)."""
+        path = os.path.join(self.model_path(epi_name), TUNED_PARAMS_FILE)
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Hiperparâmetros inválidos para {epi_name}: {e}")
+            return {}
+
+    def load_residuals(self, epi_name: str) -> Optional[Dict]:
+        """Erros de validação salvos com os modelos de um EPI (None se não houver)."""
+        path = os.path.join(self.model_path(epi_name), RESIDUALS_FILE)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Resíduos inválidos para {epi_name}: {e}")
+            return None
+        return {'horizon': np.asarray(data['horizon'], dtype=int), 'residual': np.asarray(data['residual'], dtype=float)}
+
+    def list_manifests(self) -> List[Dict]:
+        """Manifestos de todos os EPIs salvos, sem carregar nenhum modelo."""
+        manifests = []
+        if not os.path.isdir(self.models_dir):
+            return manifests
+
+        for entry in sorted(os.scandir(self.models_dir), key=lambda e: e.name):
+            if not entry.is_dir():
+                continue
+            manifest_path = os.path.join(entry.path, MANIFEST_FILE)
+            if os.path.exists(manifest_path):
+                try:
+                    with open(manifest_path, 'r', encoding='utf-8') as f:
+                        manifests.append(json.load(f))
+                except (OSError, json.JSONDecodeError) as e:
+                    logger.warning(f"Manifesto inválido em {entry.path}: {e}")
+        return manifests
@@ -2,10 +2,11 @@ import schedule
 import time
 import logging
 from datetime import datetime
-import joblib
-import os
+import hashlib
 from End.Operations import SheetOperations
 from ML.demand_forecasting import DemandForecasting
+from ML.config import get_scheduler_config
+from ML.model_registry import ModelRegistry
 import pandas as pd
 
 logging.basicConfig(level=logging.INFO)
@@ -17,13 +18,11 @@ class ModelScheduler:
     Agendador para retreinamento automático dos modelos de ML.
     """
     
-    def __init__(self, models_dir='ML/saved_models'):
-        self.models_dir = models_dir
+    def __init__(self, models_dir=None):
         self.sheet_ops = SheetOperations()
         self.forecaster = DemandForecasting()
-        
-        # Criar diretório se não existir
-        os.makedirs(self.models_dir, exist_ok=True)
+        self.registry = ModelRegistry(models_dir)
+        self.models_dir = self.registry.models_dir
     
     def retrain_all_models(self):
         """
@@ -53,50 +52,19 @@ class ModelScheduler:
             
             success_count = 0
             fail_count = 0
+            skipped_count = 0
+            incremental_count = 0
             
             for epi in epis:
                 try:
-                    logger.info(f"Treinando modelo para: {epi}")
-                    
-                    # Treinar modelos
-                    xgb_result = self.forecaster.train_xgboost_model(df_prepared, epi)
-                    prophet_result = self.forecaster.train_prophet_model(df_prepared, epi)
+                    status = self._retrain_epi(df_prepared, epi)
                     
-                    if xgb_result and prophet_result:
-                        # Salvar modelos
-                        model_path = os.path.join(self.models_dir, f"{epi.replace(' ', '_')}")
-                        os.makedirs(model_path, exist_ok=True)
-                        
-                        # Salvar XGBoost
-                        joblib.dump(
-                            xgb_result['model'],
-                            os.path.join(model_path, 'xgboost_model.pkl')
-                        )
-                        
-                        # Salvar Prophet
-                        joblib.dump(
-                            prophet_result['model'],
-                            os.path.join(model_path, 'prophet_model.pkl')
-                        )
-                        
-                        # Salvar métricas
-                        metrics = {
-                            'xgboost': xgb_result['metrics'],
-                            'prophet': prophet_result['metrics'],
-                            'trained_at': datetime.now().isoformat(),
-                            'data_points': len(df_prepared[df_prepared['epi_name'] == epi])
-                        }
-                        
-                        joblib.dump(
-                            metrics,
-                            os.path.join(model_path, 'metrics.pkl')
-                        )
-                        
-                        logger.info(f"✓ Modelo salvo para {epi}")
-                        logger.info(f"  - XGBoost MAE: {xgb_result['metrics']['mae']:.2f}")
-                        logger.info(f"  - Prophet MAE: {prophet_result['metrics']['mae']:.2f}")
-                        
+                    if status == 'skipped':
+                        skipped_count += 1
+                    elif status in ('incremental', 'full'):
                         success_count += 1
+                        if status == 'incremental':
+                            incremental_count += 1
                     else:
                         logger.warning(f"✗ Falha ao treinar {epi}")
                         fail_count += 1
@@ -107,31 +75,133 @@ class ModelScheduler:
             
             logger.info("=" * 50)
             logger.info(f"Retreinamento concluído!")
-            logger.info(f"Sucesso: {success_count} | Falhas: {fail_count}")
+            logger.info(f"Sucesso: {success_count} (incrementais: {incremental_count}) | "
+                        f"Sem alteração: {skipped_count} | Falhas: {fail_count}")
             logger.info("=" * 50)
             
         except Exception as e:
             logger.error(f"Erro geral no retreinamento: {str(e)}")
     
+    @staticmethod
+    def _history_hash(df_epi: pd.DataFrame) -> str:
+        """
+        Hash estável do histórico (data e quantidade) de um EPI.
+        
+        Só entram os dias com retirada: a série diária é completada com
+        zeros até a última data de todos os EPIs, e uma retirada nova de
+        outro EPI não deve mudar o hash deste.
+        """
+        withdrawals = df_epi.loc[df_epi['quantity'] > 0, ['date', 'quantity']]
+        values = pd.util.hash_pandas_object(
+            withdrawals.sort_values('date'), index=False
+        ).values
+        return hashlib.sha256(values.tobytes()).hexdigest()
+    
+    def _retrain_epi(self, df_prepared: pd.DataFrame, epi: str):
+        """
+        Retreina os modelos de um EPI apenas no que mudou.
+        
+        - Histórico idêntico ao do último treino: nada é feito
+        - Apenas dias novos acrescentados: o XGBoost continua o boosting só
+          com os dados novos e o Prophet parte dos parâmetros anteriores
+        - Histórico antigo alterado (edição/exclusão), muitas atualizações
+          acumuladas ou novos hiperparâmetros ajustados: retreino completo
+        
+        Returns:
+            'skipped', 'incremental', 'full' ou None em caso de falha
+        """
+        scheduler_config = get_scheduler_config()
+        df_epi = df_prepared[df_prepared['epi_name'] == epi]
+        history_hash = self._history_hash(df_epi)
+        last_date = df_epi['date'].max()
+        
+        tuned_at = self.registry.load_tuned_params(epi).get('tuned_at')
+        
+        previous = self.get_model_info(epi) if scheduler_config.incremental_retrain else None
+        if previous and previous.get('tuned_at') != tuned_at:
+            logger.info(f"{epi}: hiperparâmetros ajustados mudaram, retreino completo")
+            previous = None
+        
+        if previous and previous.get('history_hash') == history_hash:
+            logger.info(f"= {epi}: histórico inalterado, retreino ignorado")
+            return 'skipped'
+        
+        incremental = False
+        if previous and previous.get('last_date') is not None:
+            prev_last_date = pd.Timestamp(previous['last_date'])
+            old_part_hash = self._history_hash(df_epi[df_epi['date'] <= prev_last_date])
+            incremental = (
+                old_part_hash == previous.get('history_hash')
+                and previous.get('incremental_updates', 0) < scheduler_config.max_incremental_updates
+            )
+        
+        previous_models = self.load_model(epi) if incremental else None
+        
+        if previous_models:
+            logger.info(f"Atualizando incrementalmente o modelo de: {epi}")
+            xgb_result = self.forecaster.update_xgboost_model(
+                df_prepared, epi, previous_models['xgboost'], prev_last_date,
+                n_estimators=scheduler_config.incremental_boost_rounds
+            )
+            prophet_result = self.forecaster.train_prophet_model(
+                df_prepared, epi, warm_start_from=previous_models['prophet']
+            )
+            incremental_updates = previous.get('incremental_updates', 0) + 1
+            # Sem período de teste nos dados novos: os erros de validação do
+            # último treino completo continuam valendo para os quantis
+            residuals = self.registry.load_residuals(epi)
+            status = 'incremental'
+        else:
+            logger.info(f"Treinando modelo para: {epi}")
+            xgb_result = self.forecaster.train_xgboost_model(df_prepared, epi)
+            prophet_result = self.forecaster.train_prophet_model(df_prepared, epi)
+            incremental_updates = 0
+            status = 'full'
+        
+        if not xgb_result or not prophet_result:
+            return None
+        
+        if status == 'full':
+            # Erros das previsões de validação, para os quantis da previsão
+            # (calculados uma vez aqui, não a cada previsão)
+            residuals = self.forecaster.ensemble_residuals(df_epi, epi, xgb_result)
+        
+        # Salvar modelos (booster nativo, Prophet em JSON e manifesto)
+        self.registry.save(
+            epi,
+            xgb_result['model'],
+            prophet_result['model'],
+            metrics={
+                'xgboost': xgb_result['metrics'],
+                'prophet': prophet_result['metrics']
+            },
+            extra={
+                'trained_at': datetime.now().isoformat(),
+                'data_points': len(df_epi),
+                'history_hash': history_hash,
+                'last_date': last_date.isoformat(),
+                'training_mode': status,
+                'incremental_updates': incremental_updates,
+                'tuned_at': tuned_at
+            },
+            residuals=residuals
+        )
+        
+        logger.info(f"✓ Modelo salvo para {epi} ({status})")
+        logger.info(f"  - XGBoost MAE: {xgb_result['metrics']['mae']:.2f}")
+        logger.info(f"  - Prophet MAE: {prophet_result['metrics']['mae']:.2f}")
+        
+        return status
+    
     def load_model(self, epi_name: str):
         """
-        Carrega um modelo salvo.
+        Abre os modelos salvos de um EPI.
+        
+        Apenas o manifesto é lido aqui; XGBoost e Prophet são carregados no
+        primeiro acesso a ``['xgboost']``/``['prophet']``.
         """
         try:
-            model_path = os.path.join(self.models_dir, f"{epi_name.replace(' ', '_')}")
-            
-            if not os.path.exists(model_path):
-                return None
-            
-            xgb_model = joblib.load(os.path.join(model_path, 'xgboost_model.pkl'))
-            prophet_model = joblib.load(os.path.join(model_path, 'prophet_model.pkl'))
-            metrics = joblib.load(os.path.join(model_path, 'metrics.pkl'))
-            
-            return {
-                'xgboost': xgb_model,
-                'prophet': prophet_model,
-                'metrics': metrics
-            }
+            return self.registry.load(epi_name)
             
         except Exception as e:
             logger.error(f"Erro ao carregar modelo para {epi_name}: {str(e)}")
@@ -139,16 +209,10 @@ class ModelScheduler:
     
     def get_model_info(self, epi_name: str):
         """
-        Retorna informações sobre um modelo salvo.
+        Retorna informações sobre um modelo salvo (manifesto).
         """
         try:
-            model_path = os.path.join(self.models_dir, f"{epi_name.replace(' ', '_')}")
-            
-            if not os.path.exists(model_path):
-                return None
-            
-            metrics = joblib.load(os.path.join(model_path, 'metrics.pkl'))
-            return metrics
+            return self.registry.load_manifest(epi_name)
             
         except Exception as e:
             logger.error(f"Erro ao obter informações do modelo: {str(e)}")
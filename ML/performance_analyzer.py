@@ -2,14 +2,51 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import logging
-from typing import Dict, List
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+from typing import Callable, Dict, List
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def error_metrics(actual: np.ndarray, predicted: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Calcula MAE, RMSE e MAPE de forma vetorizada sobre o último eixo.
+    
+    Aceita matrizes ``[n_janelas, n_pontos]`` (posições NaN são ignoradas),
+    devolvendo uma métrica por linha.
+    """
+    actual = np.asarray(actual, dtype=float)
+    predicted = np.asarray(predicted, dtype=float)
+    errors = actual - predicted
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {
+            'mae': np.nanmean(np.abs(errors), axis=-1),
+            'rmse': np.sqrt(np.nanmean(errors ** 2, axis=-1)),
+            'mape': np.nanmean(np.abs(errors / (actual + 1e-10)), axis=-1) * 100
+        }
+
+
+def _backtest_summary(df_epi: pd.DataFrame, epi_name: str):
+    """
+    Backtest de um EPI reduzido às métricas do relatório.
+    
+    Função de módulo para poder ser executada em outro processo.
+    """
+    backtest_result = PerformanceAnalyzer().backtest_model(df_epi, epi_name)
+    if not backtest_result:
+        return None
+    
+    return {
+        'avg_mae': float(backtest_result['avg_mae']),
+        'avg_rmse': float(backtest_result['avg_rmse']),
+        'avg_mape': float(backtest_result['avg_mape']),
+        'num_tests': int(backtest_result['num_backtests'])
+    }
+
+
 class PerformanceAnalyzer:
     """
     Analisa a performance dos modelos de ML ao longo do tempo.
@@ -18,11 +55,68 @@ class PerformanceAnalyzer:
     def __init__(self):
         self.performance_history = []
     
+    @staticmethod
+    def _rolling_windows(n_rows: int, train_size: int, test_size: int, max_iterations: int):
+        """
+        Define as janelas do backtest (origem móvel) por índice de linha.
+        
+        Returns:
+            Lista de tuplas ``(inicio_treino, inicio_teste, fim_teste)``; as
+            janelas de teste são consecutivas e terminam no último registro.
+        """
+        num_iterations = min(max_iterations, (n_rows - train_size) // test_size)
+        windows = []
+        for i in range(num_iterations):
+            test_end = n_rows - (num_iterations - i - 1) * test_size
+            test_start = test_end - test_size
+            windows.append((max(0, test_start - train_size), test_start, test_end))
+        return windows
+    
+    @staticmethod
+    def _forecast_window(forecaster, df_train: pd.DataFrame, epi_name: str, horizon: int):
+        """
+        Treina cada modelo uma única vez na janela e devolve a previsão
+        (``date`` e ``ensemble_prediction``) para os próximos ``horizon`` dias.
+        
+        Segue a mesma escolha de modelo de ``predict_future_demand``: EPIs de
+        demanda intermitente usam o caminho Croston/SBA/TSB.
+        """
+        from ML.config import config
+        from ML.intermittent_demand import INTERMITTENT_CLASSES
+        
+        if config.model.use_intermittent_fast_path:
+            classes = forecaster.classify_demand(df_train, [epi_name])
+            if not classes.empty and classes['categoria'].iloc[0] in INTERMITTENT_CLASSES:
+                return forecaster.predict_intermittent(df_train, [epi_name], horizon)
+        
+        xgb_result = forecaster.train_xgboost_model(df_train, epi_name)
+        prophet_result = forecaster.train_prophet_model(df_train, epi_name)
+        if not xgb_result or not prophet_result:
+            return None
+        
+        return forecaster.forecast_with_models(
+            df_train, epi_name, horizon, xgb_result, prophet_result, calibrate=False
+        )
+    
+    @staticmethod
+    def _align_predictions(predictions: pd.DataFrame, dates: np.ndarray) -> np.ndarray:
+        """Busca as previsões nas datas observadas do período de teste."""
+        series = pd.Series(
+            predictions['ensemble_prediction'].values,
+            index=pd.DatetimeIndex(predictions['date']).normalize()
+        )
+        return series.reindex(pd.DatetimeIndex(dates).normalize()).values
+    
     def backtest_model(self, df: pd.DataFrame, epi_name: str, 
                        train_size: int = 180, test_size: int = 30):
         """
         Realiza backtest do modelo simulando previsões no passado.
         
+        As features já calculadas em ``df`` (saída de ``prepare_data``) são
+        reaproveitadas: cada janela é apenas um recorte por índice, cada
+        modelo é treinado uma vez por janela e as métricas de todas as
+        janelas são calculadas de uma só vez.
+        
         Args:
             df: DataFrame com dados históricos
             epi_name: Nome do EPI
@@ -33,86 +127,62 @@ class PerformanceAnalyzer:
             Dict com métricas de performance
         """
         from ML.demand_forecasting import DemandForecasting
+        from ML.config import get_performance_config
         
         logger.info(f"Iniciando backtest para {epi_name}")
         
         # Filtrar dados do EPI
-        df_epi = df[df['epi_name'] == epi_name].copy()
-        df_epi = df_epi.sort_values('date')
+        df_epi = df[df['epi_name'] == epi_name].sort_values('date').reset_index(drop=True)
         
         if len(df_epi) < train_size + test_size:
             logger.warning(f"Dados insuficientes para backtest de {epi_name}")
             return None
         
-        # Criar janelas deslizantes
-        results = []
+        windows = self._rolling_windows(
+            len(df_epi), train_size, test_size,
+            get_performance_config().max_backtest_iterations
+        )
+        
         forecaster = DemandForecasting()
+        dates = df_epi['date'].values
+        quantities = df_epi['quantity'].values.astype(float)
         
-        # Número de iterações (mover a janela de teste)
-        num_iterations = min(10, len(df_epi) - train_size - test_size)
+        actual = np.full((len(windows), test_size), np.nan)
+        predicted = np.full((len(windows), test_size), np.nan)
+        valid = np.zeros(len(windows), dtype=bool)
         
-        for i in range(num_iterations):
-            # Definir período de treino e teste
-            train_end_idx = -(test_size + (num_iterations - i - 1) * test_size)
-            if train_end_idx == 0:
-                train_end_idx = len(df_epi)
-                
-            train_start_idx = max(0, train_end_idx - train_size)
+        for k, (train_start, test_start, test_end) in enumerate(windows):
+            df_train = df_epi.iloc[train_start:test_start]
+            horizon = int((dates[test_end - 1] - dates[test_start - 1]) / np.timedelta64(1, 'D'))
             
-            df_train = df_epi.iloc[train_start_idx:train_end_idx]
-            df_test = df_epi.iloc[train_end_idx:train_end_idx + test_size]
-            
-            if len(df_test) == 0:
+            predictions = self._forecast_window(forecaster, df_train, epi_name, horizon)
+            if predictions is None:
                 continue
             
-            # Preparar dados de treino
-            df_train_prep = forecaster.prepare_data(
-                pd.DataFrame([{'transaction_type': 'saída', 'epi_name': epi_name, 
-                              'date': row['date'], 'quantity': row['quantity']} 
-                             for _, row in df_train.iterrows()])
-            )
-            
-            # Treinar modelo
-            xgb_result = forecaster.train_xgboost_model(df_train_prep, epi_name)
+            actual[k] = quantities[test_start:test_end]
+            predicted[k] = self._align_predictions(predictions, dates[test_start:test_end])
+            valid[k] = True
+        
+        if valid.any():
+            metrics = error_metrics(actual[valid], predicted[valid])
+            windows_arr = np.asarray(windows)[valid]
             
-            if xgb_result:
-                # Fazer previsões
-                predictions = forecaster.predict_future_demand(
-                    df_train_prep, 
-                    epi_name, 
-                    len(df_test)
-                )
-                
-                if predictions is not None:
-                    # Comparar com valores reais
-                    actual_values = df_test['quantity'].values
-                    predicted_values = predictions['ensemble_prediction'].values[:len(actual_values)]
-                    
-                    # Calcular métricas
-                    mae = np.mean(np.abs(actual_values - predicted_values))
-                    rmse = np.sqrt(np.mean((actual_values - predicted_values) ** 2))
-                    mape = np.mean(np.abs((actual_values - predicted_values) / 
-                                         (actual_values + 1e-10))) * 100
-                    
-                    results.append({
-                        'iteration': i + 1,
-                        'train_start': df_train.iloc[0]['date'],
-                        'train_end': df_train.iloc[-1]['date'],
-                        'test_start': df_test.iloc[0]['date'],
-                        'test_end': df_test.iloc[-1]['date'],
-                        'mae': mae,
-                        'rmse': rmse,
-                        'mape': mape,
-                        'actual_mean': np.mean(actual_values),
-                        'predicted_mean': np.mean(predicted_values)
-                    })
-        
-        if results:
-            results_df = pd.DataFrame(results)
+            results_df = pd.DataFrame({
+                'iteration': np.flatnonzero(valid) + 1,
+                'train_start': dates[windows_arr[:, 0]],
+                'train_end': dates[windows_arr[:, 1] - 1],
+                'test_start': dates[windows_arr[:, 1]],
+                'test_end': dates[windows_arr[:, 2] - 1],
+                'mae': metrics['mae'],
+                'rmse': metrics['rmse'],
+                'mape': metrics['mape'],
+                'actual_mean': np.nanmean(actual[valid], axis=1),
+                'predicted_mean': np.nanmean(predicted[valid], axis=1)
+            })
             
             summary = {
                 'epi_name': epi_name,
-                'num_backtests': len(results),
+                'num_backtests': len(results_df),
                 'avg_mae': results_df['mae'].mean(),
                 'avg_rmse': results_df['rmse'].mean(),
                 'avg_mape': results_df['mape'].mean(),
@@ -139,41 +209,25 @@ class PerformanceAnalyzer:
         
         logger.info(f"Comparando métodos de previsão para {epi_name}")
         
-        df_epi = df[df['epi_name'] == epi_name].copy()
-        df_epi = df_epi.sort_values('date')
+        df_epi = df[df['epi_name'] == epi_name].sort_values('date').reset_index(drop=True)
         
         if len(df_epi) < 90:
             return None
         
-        # Dividir em treino e teste
+        # Dividir em treino e teste (as features de ``df`` já estão prontas)
         train_size = int(len(df_epi) * 0.8)
         df_train = df_epi.iloc[:train_size]
         df_test = df_epi.iloc[train_size:]
+        actual = df_test['quantity'].values.astype(float)
+        n_test = len(df_test)
         
-        forecaster = DemandForecasting()
-        df_train_prep = forecaster.prepare_data(
-            pd.DataFrame([{'transaction_type': 'saída', 'epi_name': epi_name,
-                          'date': row['date'], 'quantity': row['quantity']}
-                         for _, row in df_train.iterrows()])
-        )
-        
-        results = {}
+        predictions = {}
         
         # 1. Método Naive (última observação)
-        naive_pred = np.full(len(df_test), df_train.iloc[-1]['quantity'])
-        results['Naive'] = {
-            'predictions': naive_pred,
-            'mae': np.mean(np.abs(df_test['quantity'].values - naive_pred)),
-            'rmse': np.sqrt(np.mean((df_test['quantity'].values - naive_pred) ** 2))
-        }
+        predictions['Naive'] = np.full(n_test, df_train['quantity'].iloc[-1], dtype=float)
         
         # 2. Média Móvel (últimos 7 dias)
-        ma_pred = np.full(len(df_test), df_train.tail(7)['quantity'].mean())
-        results['Moving Average'] = {
-            'predictions': ma_pred,
-            'mae': np.mean(np.abs(df_test['quantity'].values - ma_pred)),
-            'rmse': np.sqrt(np.mean((df_test['quantity'].values - ma_pred) ** 2))
-        }
+        predictions['Moving Average'] = np.full(n_test, df_train['quantity'].tail(7).mean())
         
         # 3. Exponential Smoothing
         try:
@@ -183,35 +237,38 @@ class PerformanceAnalyzer:
                 seasonal=None
             )
             fitted_es = model_es.fit()
-            es_pred = fitted_es.forecast(len(df_test))
-            results['Exponential Smoothing'] = {
-                'predictions': es_pred.values,
-                'mae': np.mean(np.abs(df_test['quantity'].values - es_pred.values)),
-                'rmse': np.sqrt(np.mean((df_test['quantity'].values - es_pred.values) ** 2))
-            }
+            predictions['Exponential Smoothing'] = np.asarray(fitted_es.forecast(n_test), dtype=float)
         except:
             logger.warning("Exponential Smoothing falhou")
         
-        # 4. XGBoost + Prophet (Ensemble)
-        predictions = forecaster.predict_future_demand(
-            df_train_prep,
-            epi_name,
-            len(df_test)
+        # 4. XGBoost + Prophet (Ensemble), cada modelo treinado uma única vez
+        horizon = int((df_test['date'].iloc[-1] - df_train['date'].iloc[-1]).days)
+        ensemble = self._forecast_window(DemandForecasting(), df_train, epi_name, horizon)
+        
+        if ensemble is not None:
+            predictions['ML Ensemble'] = self._align_predictions(ensemble, df_test['date'].values)
+        
+        # Métricas de todos os métodos em uma única operação
+        methods = list(predictions.keys())
+        metrics = error_metrics(
+            np.broadcast_to(actual, (len(methods), n_test)),
+            np.vstack([predictions[m] for m in methods])
         )
         
-        if predictions is not None:
-            ensemble_pred = predictions['ensemble_prediction'].values[:len(df_test)]
-            results['ML Ensemble'] = {
-                'predictions': ensemble_pred,
-                'mae': np.mean(np.abs(df_test['quantity'].values - ensemble_pred)),
-                'rmse': np.sqrt(np.mean((df_test['quantity'].values - ensemble_pred) ** 2))
+        results = {
+            method: {
+                'predictions': predictions[method],
+                'mae': metrics['mae'][i],
+                'rmse': metrics['rmse'][i]
             }
+            for i, method in enumerate(methods)
+        }
         
         # Criar DataFrame comparativo
-        comparison = pd.DataFrame({
-            method: {'MAE': data['mae'], 'RMSE': data['rmse']}
-            for method, data in results.items()
-        }).T
+        comparison = pd.DataFrame(
+            {'MAE': metrics['mae'], 'RMSE': metrics['rmse']},
+            index=methods
+        )
         
         comparison['Rank'] = comparison['MAE'].rank()
         comparison = comparison.sort_values('Rank')
@@ -219,7 +276,7 @@ class PerformanceAnalyzer:
         return {
             'comparison_table': comparison,
             'results': results,
-            'actual_values': df_test['quantity'].values,
+            'actual_values': actual,
             'test_dates': df_test['date'].values
         }
     
@@ -227,6 +284,9 @@ class PerformanceAnalyzer:
         """
         Visualiza os resultados do backtest.
         """
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+        
         if not backtest_result or 'results' not in backtest_result:
             return None
         
@@ -327,6 +387,9 @@ class PerformanceAnalyzer:
         """
         Visualiza comparação entre métodos de previsão.
         """
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+        
         if not comparison_result:
             return None
         
@@ -408,55 +471,127 @@ class PerformanceAnalyzer:
         
         return fig
     
-    def generate_performance_report(self, df: pd.DataFrame, epi_list: List[str]):
-        """
-        Gera relatório completo de performance para múltiplos EPIs.
+    def iter_performance_report(self, df: pd.DataFrame, epi_list: List[str],
+                                max_workers: int = None, should_cancel: Callable[[], bool] = None):
         """
-        logger.info("Gerando relatório de performance...")
+        Executa o backtest de cada EPI e entrega os resultados à medida que
+        ficam prontos.
+        
+        Com ``config.use_multiprocessing`` ativo os backtests rodam em um pool
+        de processos (``config.max_workers``); cada processo recebe só o
+        recorte do seu EPI e uma cópia da configuração atual (inclusive
+        ajustes feitos em tempo de execução), para dar o mesmo resultado da
+        execução sequencial. Interromper a iteração (``should_cancel``
+        retornando True, ``close()`` no gerador ou exceção no consumidor)
+        cancela os backtests que ainda não começaram.
         
+        Args:
+            df: DataFrame preparado com todos os EPIs
+            epi_list: EPIs a analisar
+            max_workers: Número de processos (padrão: ``config.max_workers``)
+            should_cancel: Função consultada entre resultados; True interrompe
+            
+        Yields:
+            Dict com ``epi``, ``result`` (métricas resumidas ou None),
+            ``completed`` e ``total``
+        """
+        from ML.config import apply_config, config
+        
+        groups = {epi: df_epi for epi, df_epi in df[df['epi_name'].isin(epi_list)].groupby('epi_name')}
+        epis = [epi for epi in epi_list if epi in groups]
+        total = len(epis)
+        workers = min(max_workers or config.max_workers, total)
+        
+        if not config.use_multiprocessing or workers <= 1:
+            for completed, epi in enumerate(epis, start=1):
+                if should_cancel and should_cancel():
+                    logger.info("Relatório de performance cancelado")
+                    return
+                logger.info(f"Analisando {epi}...")
+                yield {'epi': epi, 'result': _backtest_summary(groups[epi], epi),
+                       'completed': completed, 'total': total}
+            return
+        
+        # ``spawn`` evita herdar as threads do servidor Streamlit no fork
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=apply_config,
+            initargs=(config,)
+        )
+        try:
+            futures = {executor.submit(_backtest_summary, groups[epi], epi): epi for epi in epis}
+            for completed, future in enumerate(as_completed(futures), start=1):
+                epi = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Erro no backtest de {epi}: {e}")
+                    result = None
+                
+                yield {'epi': epi, 'result': result, 'completed': completed, 'total': total}
+                
+                if should_cancel and should_cancel():
+                    logger.info("Relatório de performance cancelado")
+                    return
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    @staticmethod
+    def summarize_report(individual_results: Dict[str, Dict], epis_analyzed: int = None) -> Dict:
+        """
+        Monta o relatório a partir dos resultados individuais (completos ou
+        parciais) de ``iter_performance_report``.
+        """
         report = {
             'generated_at': datetime.now().isoformat(),
-            'epis_analyzed': len(epi_list),
-            'individual_results': {},
+            'epis_analyzed': epis_analyzed if epis_analyzed is not None else len(individual_results),
+            'individual_results': dict(individual_results),
             'summary_statistics': {}
         }
         
-        all_maes = []
-        all_rmses = []
-        all_mapes = []
-        
-        for epi in epi_list:
-            logger.info(f"Analisando {epi}...")
-            
-            backtest_result = self.backtest_model(df, epi)
-            
-            if backtest_result:
-                report['individual_results'][epi] = {
-                    'avg_mae': backtest_result['avg_mae'],
-                    'avg_rmse': backtest_result['avg_rmse'],
-                    'avg_mape': backtest_result['avg_mape'],
-                    'num_tests': backtest_result['num_backtests']
-                }
-                
-                all_maes.append(backtest_result['avg_mae'])
-                all_rmses.append(backtest_result['avg_rmse'])
-                all_mapes.append(backtest_result['avg_mape'])
-        
-        # Estatísticas gerais
-        if all_maes:
+        if individual_results:
+            metrics = pd.DataFrame(individual_results).T.astype(float)
             report['summary_statistics'] = {
-                'overall_mae': np.mean(all_maes),
-                'overall_rmse': np.mean(all_rmses),
-                'overall_mape': np.mean(all_mapes),
-                'mae_std': np.std(all_maes),
-                'rmse_std': np.std(all_rmses),
-                'mape_std': np.std(all_mapes),
-                'best_epi': min(report['individual_results'].items(), 
-                              key=lambda x: x[1]['avg_mae'])[0],
-                'worst_epi': max(report['individual_results'].items(), 
-                               key=lambda x: x[1]['avg_mae'])[0]
+                'overall_mae': metrics['avg_mae'].mean(),
+                'overall_rmse': metrics['avg_rmse'].mean(),
+                'overall_mape': metrics['avg_mape'].mean(),
+                'mae_std': metrics['avg_mae'].std(ddof=0),
+                'rmse_std': metrics['avg_rmse'].std(ddof=0),
+                'mape_std': metrics['avg_mape'].std(ddof=0),
+                'best_epi': metrics['avg_mae'].idxmin(),
+                'worst_epi': metrics['avg_mae'].idxmax()
             }
         
+        return report
+    
+    def generate_performance_report(self, df: pd.DataFrame, epi_list: List[str],
+                                    progress_callback: Callable[[Dict], None] = None,
+                                    should_cancel: Callable[[], bool] = None,
+                                    max_workers: int = None):
+        """
+        Gera relatório completo de performance para múltiplos EPIs.
+        
+        Args:
+            df: DataFrame preparado
+            epi_list: EPIs a analisar
+            progress_callback: Chamado a cada EPI concluído com o item de
+                ``iter_performance_report``
+            should_cancel: Função que, ao retornar True, encerra a análise
+                e devolve o relatório parcial
+            max_workers: Número de processos (padrão: ``config.max_workers``)
+        """
+        logger.info("Gerando relatório de performance...")
+        
+        individual_results = {}
+        for item in self.iter_performance_report(df, epi_list, max_workers, should_cancel):
+            if item['result']:
+                individual_results[item['epi']] = item['result']
+            if progress_callback:
+                progress_callback(item)
+        
+        report = self.summarize_report(individual_results, len(epi_list))
+        
         logger.info("Relatório de performance gerado com sucesso")
         
         return report
@@ -465,6 +600,9 @@ class PerformanceAnalyzer:
         """
         Visualiza resumo de performance de todos os EPIs.
         """
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+        
         if not report or 'individual_results' not in report:
             return None
         
@@ -0,0 +1,240 @@
+"""
+Previsão recursiva multi-passo com propagação real dos lags
+"""
+import re
+import numpy as np
+import pandas as pd
+import logging
+from typing import Callable, Dict, List, Sequence
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+CALENDAR_FEATURES = [
+    'year', 'month', 'day', 'dayofweek', 'quarter', 'weekofyear', 'is_weekend'
+]
+
+_LAG_RE = re.compile(r'^lag_(\d+)$')
+_ROLLING_RE = re.compile(r'^rolling_(mean|std)_(\d+)$')
+
+
+class RecursiveForecaster:
+    """
+    Motor de previsão recursiva para vários EPIs ao mesmo tempo.
+
+    A cada passo do horizonte as previsões do passo anterior alimentam um
+    buffer circular (uma linha por EPI), de onde saem os lags e as médias
+    móveis do passo seguinte. Nenhum DataFrame é reconstruído no loop: as
+    features de calendário são calculadas uma única vez e o modelo recebe
+    uma matriz NumPy ``[n_epis, n_features]`` por passo.
+    """
+
+    def __init__(self, feature_cols: Sequence[str]):
+        """
+        Args:
+            feature_cols: Colunas de entrada do modelo, na ordem de treino.
+                Aceita features de calendário, ``lag_N``, ``rolling_mean_N``
+                e ``rolling_std_N``.
+        """
+        self.feature_cols = list(feature_cols)
+        self._lags = {}
+        self._rolling = {}
+
+        for col in self.feature_cols:
+            lag_match = _LAG_RE.match(col)
+            rolling_match = _ROLLING_RE.match(col)
+            if lag_match:
+                self._lags[col] = int(lag_match.group(1))
+            elif rolling_match:
+                self._rolling[col] = (rolling_match.group(1), int(rolling_match.group(2)))
+            elif col not in CALENDAR_FEATURES:
+                raise ValueError(f"Feature não suportada pelo motor recursivo: {col}")
+
+        sizes = list(self._lags.values()) + [w for _, w in self._rolling.values()]
+        self.buffer_size = max(sizes) if sizes else 1
+
+    def calendar_features(self, last_dates: Sequence, days_ahead: int) -> Dict[str, np.ndarray]:
+        """
+        Calcula as features de calendário de todo o horizonte.
+
+        Returns:
+            Dict ``feature -> array [n_epis, days_ahead]``
+        """
+        last_dates = pd.DatetimeIndex(last_dates).normalize()
+        n = len(last_dates)
+        offsets = np.tile(np.arange(1, days_ahead + 1), n)
+        dates = pd.DatetimeIndex(np.repeat(last_dates.values, days_ahead)) + pd.to_timedelta(offsets, unit='D')
+
+        dayofweek = dates.dayofweek.values
+        features = {
+            'year': dates.year.values,
+            'month': dates.month.values,
+            'day': dates.day.values,
+            'dayofweek': dayofweek,
+            'quarter': dates.quarter.values,
+            'weekofyear': dates.isocalendar().week.values.astype(int),
+            'is_weekend': np.isin(dayofweek, [5, 6]).astype(int)
+        }
+        features = {k: np.asarray(v, dtype=float).reshape(n, days_ahead) for k, v in features.items()}
+        features['date'] = dates.values.reshape(n, days_ahead)
+        return features
+
+    def _init_buffer(self, histories: List[np.ndarray]) -> np.ndarray:
+        """Preenche o buffer circular com os últimos valores observados (NaN onde falta histórico)."""
+        buffer = np.full((len(histories), self.buffer_size), np.nan)
+        for i, values in enumerate(histories):
+            values = np.asarray(values, dtype=float)[-self.buffer_size:]
+            if len(values):
+                buffer[i, -len(values):] = values
+        return buffer
+
+    def forecast(
+        self,
+        histories: List[np.ndarray],
+        last_dates: Sequence,
+        days_ahead: int,
+        predict_fn: Callable[[np.ndarray], np.ndarray],
+        extra_columns: Dict[str, np.ndarray] = None,
+        clip_negative: bool = True
+    ) -> Dict[str, np.ndarray]:
+        """
+        Executa a previsão recursiva para todos os EPIs de uma vez.
+
+        Args:
+            histories: Série diária de cada EPI (``aggregate_daily``, dias sem
+                retirada com zero)
+            last_dates: Última data observada de cada EPI
+            days_ahead: Horizonte em dias
+            predict_fn: Recebe a matriz de features do passo e devolve um
+                valor previsto por EPI
+            extra_columns: Colunas constantes acrescentadas ao fim da matriz
+                (ex.: código categórico do EPI no modelo global)
+            clip_negative: Trunca previsões negativas em zero
+
+        Returns:
+            Dict com ``predictions`` e ``dates``, ambos ``[n_epis, days_ahead]``
+        """
+        n = len(histories)
+        calendar = self.calendar_features(last_dates, days_ahead)
+        buffer = self._init_buffer(histories)
+        size = self.buffer_size
+        predictions = np.zeros((n, days_ahead))
+
+        extra = [np.asarray(v, dtype=float) for v in (extra_columns or {}).values()]
+        X = np.zeros((n, len(self.feature_cols) + len(extra)))
+        for j, values in enumerate(extra):
+            X[:, len(self.feature_cols) + j] = values
+
+        # Índices relativos (no buffer) de cada lag e janela móvel
+        lag_offsets = {col: lag for col, lag in self._lags.items()}
+        window_offsets = {col: np.arange(1, w + 1) for col, (_, w) in self._rolling.items()}
+
+        # ``pos`` aponta para a próxima posição a ser escrita; o valor mais
+        # recente fica em ``pos - 1``
+        pos = 0
+        for step in range(days_ahead):
+            for j, col in enumerate(self.feature_cols):
+                if col in calendar:
+                    X[:, j] = calendar[col][:, step]
+                elif col in lag_offsets:
+                    X[:, j] = np.nan_to_num(buffer[:, (pos - lag_offsets[col]) % size])
+                else:
+                    stat, _ = self._rolling[col]
+                    window = buffer[:, (pos - window_offsets[col]) % size]
+                    counts = np.sum(~np.isnan(window), axis=1)
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        if stat == 'mean':
+                            values = np.nansum(window, axis=1) / np.maximum(counts, 1)
+                        else:
+                            means = np.nansum(window, axis=1) / np.maximum(counts, 1)
+                            sq = np.nansum((window - means[:, None]) ** 2, axis=1)
+                            values = np.where(counts > 1, np.sqrt(sq / np.maximum(counts - 1, 1)), 0.0)
+                    X[:, j] = values
+
+            step_pred = np.asarray(predict_fn(X), dtype=float).reshape(-1)
+            if clip_negative:
+                step_pred = np.maximum(step_pred, 0)
+
+            predictions[:, step] = step_pred
+            buffer[:, pos % size] = step_pred
+            pos = (pos + 1) % size
+
+        return {'predictions': predictions, 'dates': calendar['date']}
+
+    def rolling_origin(
+        self,
+        series: List[np.ndarray],
+        dates: List[np.ndarray],
+        starts: List[int],
+        step: int,
+        predict_fn: Callable[[np.ndarray], np.ndarray],
+        extra_columns: Dict[str, np.ndarray] = None
+    ) -> pd.DataFrame:
+        """
+        Previsões recursivas de validação a partir de várias origens.
+
+        Para cada série, a partir de ``starts[i]`` e a cada ``step`` dias, a
+        previsão parte só do histórico anterior à origem e avança até o fim
+        da série, como faria em produção. Todas as origens de todas as
+        séries rodam juntas em uma única chamada a ``forecast``.
+
+        Args:
+            series: Série diária completa de cada EPI
+            dates: Datas de cada série
+            starts: Primeira origem (posição na série) de cada EPI; em geral
+                o início do período que o modelo não viu no treino
+            step: Dias entre origens consecutivas
+            predict_fn: Mesmo contrato de ``forecast``
+            extra_columns: Colunas constantes por série (ver ``forecast``)
+
+        Returns:
+            DataFrame com ``series`` (índice do EPI), ``horizon`` (1 = dia
+            seguinte à origem), ``position`` (posição do dia previsto na
+            série), ``prediction`` e ``actual``
+        """
+        lengths = np.array([len(values) for values in series])
+        row_series, row_origin = [], []
+        for i, start in enumerate(starts):
+            origins = np.arange(max(int(start), 1), lengths[i], step)
+            row_series.append(np.full(len(origins), i))
+            row_origin.append(origins)
+        row_series = np.concatenate(row_series) if row_series else np.zeros(0, dtype=int)
+        row_origin = np.concatenate(row_origin) if row_origin else np.zeros(0, dtype=int)
+
+        if len(row_series) == 0:
+            return pd.DataFrame(columns=['series', 'horizon', 'position', 'prediction', 'actual'])
+
+        days_ahead = int((lengths[row_series] - row_origin).max())
+        result = self.forecast(
+            [series[i][:o] for i, o in zip(row_series, row_origin)],
+            [dates[i][o - 1] for i, o in zip(row_series, row_origin)],
+            days_ahead,
+            predict_fn,
+            extra_columns={
+                name: np.asarray(values)[row_series] for name, values in (extra_columns or {}).items()
+            }
+        )
+
+        horizons = np.arange(1, days_ahead + 1)
+        positions = row_origin[:, None] + horizons[None, :] - 1
+        rows, cols = np.nonzero(positions < lengths[row_series][:, None])
+
+        offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        actual = np.concatenate([np.asarray(values, dtype=float) for values in series])
+        return pd.DataFrame({
+            'series': row_series[rows],
+            'horizon': horizons[cols],
+            'position': positions[rows, cols],
+            'prediction': result['predictions'][rows, cols],
+            'actual': actual[offsets[row_series[rows]] + positions[rows, cols]]
+        })
+
+    def to_frame(self, result: Dict[str, np.ndarray], epis: Sequence[str], value_col: str) -> pd.DataFrame:
+        """Converte o resultado de ``forecast`` em um DataFrame longo."""
+        n, days_ahead = result['predictions'].shape
+        return pd.DataFrame({
+            'date': result['dates'].reshape(-1),
+            'epi_name': np.repeat(np.asarray(epis, dtype=object), days_ahead),
+            value_col: result['predictions'].reshape(-1)
+        })
@@ -0,0 +1,294 @@
+"""
+Tabela materializada de alertas de troca, atualizada de forma incremental
+"""
+import os
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from Utils.alert_system import ReplacementAlerts, replacement_schedule, SCHEDULE_DTYPES
+from Utils.epi_rules import get_rule_matcher
+
+logger = logging.getLogger(__name__)
+
+
+# Dias de atraso a partir dos quais o alerta entra em cada nível
+# (nível 0 = troca ainda não vencida)
+ESCALATION_DAYS = [0, 30, 90]
+
+LEVEL_LABELS = {0: 'Em dia', 1: 'Vencido', 2: 'Vencido há 30+ dias', 3: 'Vencido há 90+ dias'}
+
+# Colunas das transações que definem os alertas (usadas na linhagem)
+SOURCE_COLUMNS = ['requester', 'epi_name', 'transaction_type', 'date']
+
+# Colunas de cada par funcionário/EPI recalculadas quando há nova saída
+VALUE_COLUMNS = ['last_withdrawal', 'replacement_days', 'due_date']
+
+# Mudanças guardadas no histórico (as mais recentes)
+MAX_CHANGE_LOG = 5000
+
+CHANGE_COLUMNS = [
+    'detected_at', 'requester', 'epi_name', 'change',
+    'level_before', 'level_after', 'due_date', 'days_overdue'
+]
+
+
+def alert_level(days_overdue) -> np.ndarray:
+    """Nível de cada alerta a partir dos dias de atraso (ver ``ESCALATION_DAYS``)."""
+    return np.searchsorted(ESCALATION_DAYS, np.asarray(days_overdue), side='right')
+
+
+def _row_hashes(df_stock: pd.DataFrame) -> np.ndarray:
+    """Hash de cada transação nas colunas que definem os alertas."""
+    columns = [c for c in SOURCE_COLUMNS if c in df_stock.columns]
+    return pd.util.hash_pandas_object(df_stock[columns], index=False).values
+
+
+def _lineage_hash(row_hashes: np.ndarray) -> str:
+    """Linhagem das transações processadas (edições e exclusões mudam o hash)."""
+    return hashlib.sha256(np.ascontiguousarray(row_hashes).tobytes()).hexdigest()
+
+
+class AlertStore:
+    """
+    Alertas de troca materializados: um registro por par funcionário/EPI com
+    a última retirada, a data de troca e o nível do alerta na última data
+    avaliada.
+    
+    Em ``update``:
+    
+    - Só as linhas novas da planilha (após as já processadas) são lidas; os
+      pares com novas saídas têm a data de troca recalculada
+    - Na virada do dia, só os pares cuja data de troca cruzou um limite de
+      ``ESCALATION_DAYS`` desde a última avaliação mudam de nível
+    - Se o histórico já processado mudou (edição/exclusão) ou as regras de
+      troca mudaram, a tabela é reconstruída
+    
+    Cada atualização devolve as mudanças (``new``, ``resolved``,
+    ``escalated``), que também ficam em ``change_log`` para resumos e
+    exportação. Sem linhas novas, no mesmo dia e com as mesmas regras, a
+    tabela é devolvida como está; o estado só é regravado em disco quando
+    há mudanças.
+    """
+    
+    def __init__(self, path: str = None):
+        """
+        Args:
+            path: Arquivo onde o estado é persistido (só em memória se None)
+        """
+        self.path = path
+        self.pairs = None
+        self.rows_seen = 0
+        self.source_hash = None
+        self.as_of = None
+        self.rules_signature = None
+        self.change_log = pd.DataFrame(columns=CHANGE_COLUMNS)
+        self.version = 0
+        
+        self._engine = None
+        self._engine_version = -1
+        self._lock = threading.Lock()
+        
+        if path and os.path.exists(path):
+            try:
+                self.__dict__.update(joblib.load(path))
+            except Exception as e:
+                logger.warning(f"Estado de alertas ignorado ({path}): {e}")
+    
+    def _save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        joblib.dump({
+            'pairs': self.pairs,
+            'rows_seen': self.rows_seen,
+            'source_hash': self.source_hash,
+            'as_of': self.as_of,
+            'rules_signature': self.rules_signature,
+            'change_log': self.change_log,
+            'version': self.version
+        }, tmp_path)
+        os.replace(tmp_path, self.path)
+    
+    # ------------------------------------------------------------------
+    # Atualização
+    # ------------------------------------------------------------------
+    
+    def update(self, df_stock: pd.DataFrame, today=None, matcher=None) -> pd.DataFrame:
+        """
+        Atualiza a tabela com as transações atuais da planilha.
+        
+        Args:
+            df_stock: Transações da planilha (todas as linhas, na ordem da aba)
+            today: Data de referência (padrão: hoje)
+            matcher: Regras de troca (padrão: ``get_rule_matcher()``)
+        
+        Returns:
+            DataFrame de mudanças (colunas ``CHANGE_COLUMNS``); vazio se nada mudou
+        """
+        matcher = matcher or get_rule_matcher()
+        as_of = (pd.Timestamp(today) if today is not None else pd.Timestamp(datetime.now())).normalize()
+        
+        with self._lock:
+            row_hashes = _row_hashes(df_stock)
+            unchanged = (
+                self.pairs is not None
+                and as_of == self.as_of
+                and len(row_hashes) == self.rows_seen
+                and matcher.signature() == self.rules_signature
+                and _lineage_hash(row_hashes) == self.source_hash
+            )
+            if unchanged:
+                return pd.DataFrame(columns=CHANGE_COLUMNS)
+            
+            prefix_unchanged = (
+                self.pairs is not None
+                and matcher.signature() == self.rules_signature
+                and len(row_hashes) >= self.rows_seen
+                and _lineage_hash(row_hashes[:self.rows_seen]) == self.source_hash
+            )
+            
+            if prefix_unchanged:
+                changes = self._incremental(df_stock.iloc[self.rows_seen:], as_of, matcher)
+            else:
+                changes = self._rebuild(df_stock, as_of, matcher)
+            
+            self.rows_seen = len(row_hashes)
+            self.source_hash = _lineage_hash(row_hashes)
+            self.as_of = as_of
+            self.rules_signature = matcher.signature()
+            
+            if not changes.empty:
+                changes.insert(0, 'detected_at', pd.Timestamp(datetime.now()))
+                log = [self.change_log, changes] if not self.change_log.empty else [changes]
+                self.change_log = pd.concat(log, ignore_index=True).tail(MAX_CHANGE_LOG).reset_index(drop=True)
+                self.version += 1
+                logger.info(
+                    "Alertas atualizados: "
+                    + ", ".join(f"{count} {change}" for change, count in changes['change'].value_counts().items())
+                )
+                # Sem mudanças o arquivo fica como está: ao recarregar, as
+                # linhas e dias seguintes são reprocessados a partir dele
+                self._save()
+            
+            return changes if not changes.empty else pd.DataFrame(columns=CHANGE_COLUMNS)
+    
+    def _rebuild(self, df_stock: pd.DataFrame, as_of: pd.Timestamp, matcher) -> pd.DataFrame:
+        schedule = replacement_schedule(df_stock, matcher)
+        pairs = schedule.set_index(['requester', 'epi_name'])
+        pairs['level'] = alert_level((as_of - pairs['due_date']).dt.days.values)
+        
+        before = self.pairs['level'] if self.pairs is not None else pd.Series(dtype='int64')
+        self.pairs = pairs
+        self.version += 1
+        logger.info(f"Tabela de alertas reconstruída: {len(pairs)} pares funcionário/EPI")
+        
+        levels = pd.concat([before.rename('before'), pairs['level'].rename('after')], axis=1)
+        return self._changes(levels.fillna(0).astype('int64'), as_of)
+    
+    def _incremental(self, new_rows: pd.DataFrame, as_of: pd.Timestamp, matcher) -> pd.DataFrame:
+        pairs = self.pairs
+        touched = replacement_schedule(new_rows, matcher).set_index(['requester', 'epi_name'])
+        
+        # Pares com novas saídas: última retirada é a mais recente das duas
+        existing = touched.index.intersection(pairs.index)
+        latest = touched.loc[existing, 'last_withdrawal'] > pairs.loc[existing, 'last_withdrawal']
+        updated = touched.loc[existing[latest.values]]
+        added = touched.loc[touched.index.difference(pairs.index)]
+        
+        # Pares cuja data de troca cruzou um limite desde a última avaliação
+        due = pairs['due_date'].values
+        crossed = np.zeros(len(pairs), dtype=bool)
+        if as_of != self.as_of:
+            start, end = sorted([self.as_of, as_of])
+            for days in ESCALATION_DAYS:
+                limit = pd.Timedelta(days=days)
+                crossed |= (due > np.datetime64(start - limit)) & (due <= np.datetime64(end - limit))
+        
+        before = pd.concat([
+            pairs['level'].iloc[np.flatnonzero(crossed)],
+            pairs.loc[updated.index, 'level']
+        ])
+        before = before[~before.index.duplicated()]
+        
+        if len(updated):
+            pairs.loc[updated.index, VALUE_COLUMNS] = updated[VALUE_COLUMNS]
+        if len(added):
+            pairs = pd.concat([pairs, added.assign(level=0)])
+        self.pairs = pairs
+        
+        candidates = before.index.append(added.index)
+        after = pd.Series(
+            alert_level((as_of - pairs.loc[candidates, 'due_date']).dt.days.values), index=candidates
+        )
+        pairs.loc[candidates, 'level'] = after.values
+        
+        if len(updated) or len(added):
+            self.version += 1
+        
+        levels = pd.concat([before.rename('before'), after.rename('after')], axis=1)
+        return self._changes(levels.fillna(0).astype('int64'), as_of)
+    
+    def _changes(self, levels: pd.DataFrame, as_of: pd.Timestamp) -> pd.DataFrame:
+        """Classifica as mudanças de nível: novo, resolvido ou agravado."""
+        change = np.select(
+            [
+                (levels['before'] == 0) & (levels['after'] > 0),
+                (levels['before'] > 0) & (levels['after'] == 0),
+                (levels['before'] > 0) & (levels['after'] > levels['before'])
+            ],
+            ['new', 'resolved', 'escalated'],
+            default=''
+        )
+        levels = levels[change != '']
+        if levels.empty:
+            return pd.DataFrame(columns=CHANGE_COLUMNS[1:])
+        
+        due = self.pairs['due_date'].reindex(levels.index)
+        changes = pd.DataFrame({
+            'change': change[change != ''],
+            'level_before': levels['before'].values,
+            'level_after': levels['after'].values,
+            'due_date': due.values,
+            'days_overdue': (as_of - due).dt.days.values
+        }, index=levels.index)
+        return changes.rename_axis(['requester', 'epi_name']).reset_index()
+    
+    # ------------------------------------------------------------------
+    # Consulta
+    # ------------------------------------------------------------------
+    
+    def schedule(self) -> pd.DataFrame:
+        """Cronograma materializado (mesmo formato de ``replacement_schedule``)."""
+        if self.pairs is None:
+            return replacement_schedule(pd.DataFrame())
+        schedule = self.pairs.drop(columns='level').reset_index().astype(SCHEDULE_DTYPES)
+        return schedule.sort_values('due_date', kind='stable').reset_index(drop=True)
+    
+    def engine(self) -> ReplacementAlerts:
+        """Índices de consulta, reconstruídos só quando a tabela mudou."""
+        with self._lock:
+            if self._engine is None or self._engine_version != self.version:
+                self._engine = ReplacementAlerts(self.schedule())
+                self._engine_version = self.version
+            return self._engine
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_alert_store() -> AlertStore:
+    """Tabela de alertas única do processo, persistida em ``config.cache_dir/alerts``."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            from ML.config import config
+            _store = AlertStore(os.path.join(config.cache_dir, 'alerts', 'alert_store.joblib'))
+        return _store
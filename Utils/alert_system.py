@@ -1,144 +1,404 @@
+import asyncio
+import hashlib
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-from AI_container.credentials.API_Operation import PDFQA
-
-
-EPI_REPLACEMENT_RULES = {
-
-  "Botina de Seguranca": 180,  # 6 meses
-    "Mascara de Protecao": 180, # 6 meses
-    "Abafador de Ruidos": 180,  # 6 meses
-    "Filtro para Mascara": 180, # 6 meses
-    "Cinto de Seguranca": 180,  # 6 meses
-    
-    "keywords": {
-        "botina": 180,
-        "mascara": 180,
-        "abafador": 180,
-        "filtro": 180,
-        "cinto": 180,
-        "oculos": 365, # Exemplo: óculos a cada 1 ano
-    }
-}
+from datetime import datetime
+from AI_container.credentials.gemini_client import GEMINI_MODEL, get_model
+from AI_container.credentials.response_cache import get_response_cache
+from Utils.epi_rules import get_rule_matcher
+
 
-def get_replacement_period(epi_name):
+def get_replacement_period(epi_name, matcher=None):
     """
     Encontra o período de troca para um dado EPI.
-    Primeiro busca por nome exato, depois por palavras-chave.
-    """
-    epi_name_lower = epi_name.lower()
-    
-    # 1. Busca por nome exato (case-insensitive)
-    for name, period in EPI_REPLACEMENT_RULES.items():
-        if name.lower() == epi_name_lower:
-            return period
-    
-    # 2. Se não encontrar, busca por palavras-chave
-    for keyword, period in EPI_REPLACEMENT_RULES["keywords"].items():
-        if keyword in epi_name_lower:
-            return period
-            
-    return None # Retorna None se não houver regra para este EPI
-
-def analyze_replacement_alerts(df_stock):
-    """
-    Analisa os dados de estoque e retorna uma lista de alertas de troca de EPI.
+    Primeiro busca por nome exato, depois por palavras-chave
+    (ver ``Utils.epi_rules``).
+    """
+    matcher = matcher or get_rule_matcher()
+    return matcher.period(epi_name) # Retorna None se não houver regra para este EPI
+
+def replacement_periods(epi_names, matcher=None):
+    """
+    Período de troca para cada nome de EPI da série, consultando as regras
+    uma única vez por nome distinto. EPIs sem regra ficam com NaN.
+    """
+    matcher = matcher or get_rule_matcher()
+    return matcher.periods(epi_names)
+
+SCHEDULE_DTYPES = {
+    'requester': 'string',
+    'epi_name': 'string',
+    'last_withdrawal': 'datetime64[ns]',
+    'replacement_days': 'int64',
+    'due_date': 'datetime64[ns]'
+}
+
+def replacement_schedule(df_stock, matcher=None):
     """
+    Próxima troca prevista de cada par funcionário/EPI que tem regra de troca.
+
+    A última retirada de cada par é obtida com um único groupby, a regra de
+    troca é resolvida uma vez por EPI distinto e as datas de troca são
+    calculadas como operações de array.
+
+    Args:
+        df_stock: DataFrame de transações da planilha
+        matcher: Regras de troca (padrão: ``get_rule_matcher()``)
+
+    Returns:
+        DataFrame com ``requester``, ``epi_name``, ``last_withdrawal``,
+        ``replacement_days`` e ``due_date``, ordenado pela data de troca
+    """
+    schedule = pd.DataFrame({
+        column: pd.Series(dtype=dtype) for column, dtype in SCHEDULE_DTYPES.items()
+    })
     if df_stock.empty:
-        return []
+        return schedule
 
     # Filtra apenas as transações de saída
-    df_saidas = df_stock[df_stock['transaction_type'].str.lower() == 'saída'].copy()
-    
-    if df_saidas.empty:
-        return []
+    df_saidas = df_stock.loc[
+        df_stock['transaction_type'].str.lower() == 'saída', ['requester', 'epi_name', 'date']
+    ].copy()
 
     # Converte a coluna de data e lida com erros
     df_saidas['date'] = pd.to_datetime(df_saidas['date'], errors='coerce')
     df_saidas.dropna(subset=['date', 'requester', 'epi_name'], inplace=True)
+    if df_saidas.empty:
+        return schedule
+
+    # Última data de retirada para cada funcionário/EPI
+    last_withdrawals = df_saidas.groupby(['requester', 'epi_name'], sort=False)['date'].max().reset_index()
+
+    periods = replacement_periods(last_withdrawals['epi_name'], matcher)
+    has_rule = ~np.isnan(periods)
+    last_withdrawals = last_withdrawals[has_rule]
+    periods = periods[has_rule].astype('int64')
+
+    schedule = pd.DataFrame({
+        'requester': last_withdrawals['requester'].values,
+        'epi_name': last_withdrawals['epi_name'].values,
+        'last_withdrawal': last_withdrawals['date'].values,
+        'replacement_days': periods,
+        'due_date': (last_withdrawals['date'] + pd.to_timedelta(periods, unit='D')).values
+    }).astype(SCHEDULE_DTYPES)
 
-    # Agrupa para encontrar a última data de retirada para cada funcionário/EPI
-    last_withdrawals = df_saidas.loc[df_saidas.groupby(['requester', 'epi_name'])['date'].idxmax()]
-
-    alerts = []
-    today = datetime.now()
-
-    for _, row in last_withdrawals.iterrows():
-        requester = row['requester']
-        epi_name = row['epi_name']
-        last_date = row['date']
-        
-        # Pega o período de troca para o EPI
-        replacement_days = get_replacement_period(epi_name)
-        
-        # Se existe uma regra para este EPI, calcula a data de vencimento
-        if replacement_days:
-            due_date = last_date + timedelta(days=replacement_days)
-            days_overdue = (today - due_date).days
-            
-            # Se a data de troca já passou (ou é hoje)
-            if days_overdue >= 0:
-                alerts.append({
-                    "Funcionário": requester,
-                    "EPI": epi_name,
-                    "Última Retirada": last_date.strftime('%d/%m/%Y'),
-                    "Próxima Troca Prevista": due_date.strftime('%d/%m/%Y'),
-                    "Status": f"{days_overdue} dias vencido"
-                })
-
-    # Ordena os alertas pelos mais vencidos primeiro
-    sorted_alerts = sorted(alerts, key=lambda x: (x['Status'].split(' ')[0]), reverse=True)
-    return sorted_alerts
-
-
-def get_ia_insights_for_alert(requester, epi_name, df_stock):
+    return schedule.sort_values('due_date', kind='stable').reset_index(drop=True)
+
+class ReplacementAlerts:
     """
-    Usa a IA Generativa para analisar o histórico de um funcionário/EPI
-    e fornecer insights adicionais sobre o consumo.
+    Consultas sobre o cronograma de trocas: vencidas, a vencer nos próximos
+    N dias, por funcionário e por EPI.
+
+    O cronograma fica ordenado pela data de troca (a mais vencida primeiro)
+    e os índices por funcionário e por EPI guardam as posições de cada um
+    já nessa ordem. Como "vencido até a data X" é um prefixo dessa ordem,
+    cada consulta é uma busca binária, sem recalcular nem reordenar nada;
+    a data de referência pode mudar entre consultas.
     """
-    try:
-        history_df = df_stock[
-            (df_stock['requester'] == requester) &
-            (df_stock['epi_name'] == epi_name) &
-            (df_stock['transaction_type'].str.lower() == 'saída')
-        ].copy()
-
-        if len(history_df) < 2:
-            return "Histórico insuficiente para análise de padrão de consumo."
-
-        history_df['date'] = pd.to_datetime(history_df['date'], errors='coerce')
-        history_df = history_df.sort_values(by='date')
-        
-        # Calcula os dias entre cada retirada
-        history_df['intervalo_dias'] = history_df['date'].diff().dt.days
-        
-        # Prepara o contexto para a IA
-        datas_retirada = history_df['date'].dt.strftime('%d/%m/%Y').tolist()
-        intervalos = history_df['intervalo_dias'].dropna().astype(int).tolist()
-        media_intervalo = sum(intervalos) / len(intervalos) if intervalos else 0
-        regra_troca = get_replacement_period(epi_name) or "Não definida"
-
-        contexto = f"""
-        Analise o padrão de consumo do EPI '{epi_name}' para o funcionário '{requester}'.
-
-        Dados:
-        - Datas de retirada (do mais antigo ao mais novo): {datas_retirada}
-        - Intervalo em dias entre as retiradas: {intervalos}
-        - Média de troca observada: {media_intervalo:.1f} dias.
-        - Regra de troca esperada: {regra_troca} dias.
-
-        Com base nesses dados, forneça uma análise curta e direta respondendo a:
-        1. O consumo deste funcionário é regular, muito frequente (acelerado) ou pouco frequente (lento) em comparação com a regra esperada?
-        2. Existe algum comportamento que mereça atenção (ex: um pico de retiradas, ou um longo período sem retirar)?
-        3. Dê uma recomendação breve.
+
+    def __init__(self, schedule):
+        """
+        Args:
+            schedule: Saída de ``replacement_schedule``
+        """
+        self.schedule = schedule.reset_index(drop=True)
+        self._due = self.schedule['due_date'].values
+        self._by_requester = {
+            name: positions for name, positions in self.schedule.groupby('requester', sort=True).indices.items()
+        }
+        self._by_epi = {
+            name: positions for name, positions in self.schedule.groupby('epi_name', sort=True).indices.items()
+        }
+
+    @classmethod
+    def from_stock(cls, df_stock, matcher=None):
+        """Monta o cronograma a partir das transações e indexa."""
+        return cls(replacement_schedule(df_stock, matcher))
+
+    @property
+    def requesters(self):
+        """Funcionários com alguma troca programada, em ordem alfabética."""
+        return list(self._by_requester)
+
+    @property
+    def epis(self):
+        """EPIs com alguma troca programada, em ordem alfabética."""
+        return list(self._by_epi)
+
+    def query(self, due_within_days=0, requester=None, epi_name=None, today=None):
+        """
+        Trocas vencidas ou que vencem em até ``due_within_days`` dias.
+
+        Args:
+            due_within_days: Janela à frente (0 = só as vencidas, inclusive hoje)
+            requester: Filtra por funcionário (opcional)
+            epi_name: Filtra por EPI (opcional)
+            today: Data de referência (padrão: agora)
+
+        Returns:
+            DataFrame do cronograma com ``days_overdue`` (negativo = dias que
+            faltam para a troca), dos mais vencidos para os menos vencidos
         """
-        
-        # Chama a IA
-        ai_engine = PDFQA()
-        # Usamos uma função genérica de pergunta/resposta da sua classe de IA
-        response = ai_engine.ask_gemini(contexto, "Qual a análise do padrão de consumo?")
-        
-        return response
+        today = pd.Timestamp(today) if today is not None else pd.Timestamp(datetime.now())
+
+        positions = np.arange(len(self.schedule))
+        if requester is not None:
+            positions = self._by_requester.get(requester, positions[:0])
+        if epi_name is not None:
+            epi_positions = self._by_epi.get(epi_name, positions[:0])
+            positions = epi_positions if requester is None else np.intersect1d(positions, epi_positions)
+
+        # Vence até ``today + due_within_days`` <=> dias de atraso >= -due_within_days
+        limit = np.datetime64(today + pd.Timedelta(days=due_within_days), 'ns')
+        positions = positions[:np.searchsorted(self._due[positions], limit, side='right')]
+
+        result = self.schedule.iloc[positions].reset_index(drop=True)
+        result['days_overdue'] = (today - result['due_date']).dt.days.astype('int64')
+        return result
+
+    def overdue(self, requester=None, epi_name=None, today=None):
+        """Trocas vencidas (ou que vencem hoje)."""
+        return self.query(0, requester, epi_name, today)
+
+    def due_within(self, days, requester=None, epi_name=None, today=None):
+        """Trocas ainda não vencidas que vencem nos próximos ``days`` dias."""
+        result = self.query(days, requester, epi_name, today)
+        return result[result['days_overdue'] < 0].reset_index(drop=True)
+
+    def upcoming_demand(self, days, today=None):
+        """
+        Trocas por EPI até ``days`` dias à frente, para planejar compras.
+
+        Returns:
+            DataFrame por EPI com ``overdue`` (já vencidas), ``upcoming``
+            (a vencer na janela), ``total`` e ``next_due`` (próxima troca
+            ainda não vencida), ordenado pelo total
+        """
+        result = self.query(days, today=today)
+        result['is_overdue'] = result['days_overdue'] >= 0
+        result['upcoming_due'] = result['due_date'].where(~result['is_overdue'])
+
+        demand = result.groupby('epi_name').agg(
+            overdue=('is_overdue', 'sum'),
+            total=('requester', 'size'),
+            next_due=('upcoming_due', 'min')
+        )
+        demand['upcoming'] = demand['total'] - demand['overdue']
+        demand = demand[['overdue', 'upcoming', 'total', 'next_due']].astype(
+            {'overdue': 'int64', 'upcoming': 'int64', 'total': 'int64'}
+        )
+        return demand.sort_values('total', ascending=False, kind='stable').reset_index()
+
+def analyze_replacement_alerts(df_stock, today=None, matcher=None):
+    """
+    Analisa os dados de estoque e retorna os alertas de troca de EPI vencida.
+
+    Args:
+        df_stock: DataFrame de transações da planilha
+        today: Data de referência (padrão: agora)
+        matcher: Regras de troca (padrão: ``get_rule_matcher()``)
 
+    Returns:
+        DataFrame com ``requester``, ``epi_name``, ``last_withdrawal``,
+        ``replacement_days``, ``due_date`` e ``days_overdue``, dos mais
+        vencidos para os menos vencidos
+    """
+    return ReplacementAlerts.from_stock(df_stock, matcher).overdue(today=today)
+
+
+# Retiradas mais recentes listadas no contexto de cada alerta
+INSIGHT_MAX_DATES = 12
+
+# Chamadas simultâneas ao Gemini na análise em lote
+INSIGHT_MAX_CONCURRENCY = 4
+
+INSIGHT_QUESTION = "Qual a análise do padrão de consumo?"
+
+INSIGHT_PROMPT = """
+Analise o padrão de consumo do EPI '{epi_name}' para o funcionário '{requester}'.
+
+Dados:
+- Retiradas registradas: {n_withdrawals} (de {first} a {last})
+- Últimas datas de retirada (do mais antigo ao mais novo): {recent_dates}
+- Últimos intervalos em dias entre as retiradas: {recent_intervals}
+- Intervalo observado: média {mean_interval:.1f}, mínimo {min_interval}, máximo {max_interval} dias.
+- Regra de troca esperada: {rule} dias.
+
+Com base nesses dados, forneça uma análise curta e direta respondendo a:
+1. O consumo deste funcionário é regular, muito frequente (acelerado) ou pouco frequente (lento) em comparação com a regra esperada?
+2. Existe algum comportamento que mereça atenção (ex: um pico de retiradas, ou um longo período sem retirar)?
+3. Dê uma recomendação breve.
+"""
+
+INSUFFICIENT_HISTORY = "Histórico insuficiente para análise de padrão de consumo."
+
+def build_insight_contexts(pairs, df_stock, matcher=None):
+    """
+    Contextos compactos da análise de consumo de vários alertas de uma vez.
+
+    O histórico de saídas de todos os pares é filtrado, ordenado e resumido
+    (contagem, intervalos, últimas datas) em um único groupby.
+
+    Args:
+        pairs: Pares ``(funcionário, EPI)`` a analisar
+        df_stock: DataFrame de transações da planilha
+        matcher: Regras de troca (padrão: ``get_rule_matcher()``)
+
+    Returns:
+        DataFrame com ``requester``, ``epi_name``, ``n_withdrawals``,
+        ``context`` (None se o histórico for insuficiente) e ``context_hash``
+    """
+    keys = pd.MultiIndex.from_tuples(list(pairs), names=['requester', 'epi_name'])
+
+    is_saida = df_stock['transaction_type'].str.lower() == 'saída'
+    in_pairs = pd.MultiIndex.from_frame(df_stock[['requester', 'epi_name']]).isin(keys)
+    history = df_stock.loc[is_saida & in_pairs, ['requester', 'epi_name', 'date']].copy()
+    history['date'] = pd.to_datetime(history['date'], errors='coerce')
+    history = history.dropna(subset=['date']).sort_values(['requester', 'epi_name', 'date'], kind='stable')
+
+    # Calcula os dias entre cada retirada
+    grouped = history.groupby(['requester', 'epi_name'], sort=False)
+    history['interval'] = grouped['date'].diff().dt.days
+
+    recent = history.groupby(['requester', 'epi_name'], sort=False).tail(INSIGHT_MAX_DATES)
+    recent = recent.assign(date_text=recent['date'].dt.strftime('%d/%m/%Y'))
+    recent_grouped = recent.groupby(['requester', 'epi_name'], sort=False)
+
+    summary = grouped.agg(
+        n_withdrawals=('date', 'size'),
+        first=('date', 'min'),
+        last=('date', 'max'),
+        mean_interval=('interval', 'mean'),
+        min_interval=('interval', 'min'),
+        max_interval=('interval', 'max')
+    ).join(recent_grouped.agg(
+        recent_dates=('date_text', list),
+        recent_intervals=('interval', lambda s: s.dropna().astype(int).tolist())
+    )).reindex(keys)
+    summary['n_withdrawals'] = summary['n_withdrawals'].fillna(0).astype(int)
+    summary['rule'] = [
+        period if period is not None else "Não definida"
+        for period in (get_replacement_period(epi_name, matcher) for epi_name in keys.get_level_values('epi_name'))
+    ]
+
+    contexts = []
+    for (requester, epi_name), row in summary.iterrows():
+        if row['n_withdrawals'] < 2:
+            contexts.append(None)
+            continue
+        contexts.append(INSIGHT_PROMPT.format(
+            epi_name=epi_name,
+            requester=requester,
+            n_withdrawals=row['n_withdrawals'],
+            first=row['first'].strftime('%d/%m/%Y'),
+            last=row['last'].strftime('%d/%m/%Y'),
+            recent_dates=row['recent_dates'],
+            recent_intervals=row['recent_intervals'],
+            mean_interval=row['mean_interval'],
+            min_interval=int(row['min_interval']),
+            max_interval=int(row['max_interval']),
+            rule=row['rule']
+        ))
+
+    result = summary[['n_withdrawals']].reset_index()
+    result['context'] = contexts
+    result['context_hash'] = [
+        hashlib.sha256(context.encode('utf-8')).hexdigest() if context else None for context in contexts
+    ]
+    return result
+
+async def _generate_insights(model, prompts, max_concurrency):
+    """
+    Envia os prompts ao Gemini em paralelo, no máximo ``max_concurrency``
+    por vez. Cada chamada bloqueante roda em uma thread do loop, então o
+    mesmo modelo pode ser usado em chamadas sucessivas de ``asyncio.run``.
+
+    Returns:
+        Lista de ``(texto, sucesso)`` na ordem dos prompts
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def generate(prompt):
+        async with semaphore:
+            try:
+                response = await asyncio.to_thread(model.generate_content, prompt)
+                return response.text, True
+            except Exception as e:
+                return f"Erro na análise de IA: {str(e)}", False
+
+    return await asyncio.gather(*(generate(prompt) for prompt in prompts))
+
+def insight_prompt(context):
+    """Prompt completo enviado ao Gemini para um contexto de alerta."""
+    return (
+        f"Contexto: {context}\n\nPergunta: {INSIGHT_QUESTION}\n\n"
+        "Por favor, forneça uma resposta detalhada e precisa."
+    )
+
+def get_ia_insights_batch(pairs, df_stock, matcher=None, max_concurrency=INSIGHT_MAX_CONCURRENCY, use_cache=True):
+    """
+    Análise de IA do padrão de consumo de vários alertas.
+
+    Os contextos são montados em lote (``build_insight_contexts``), os já
+    respondidos saem do cache persistente de respostas e o restante é
+    enviado ao Gemini de forma concorrente.
+
+    Args:
+        pairs: Pares ``(funcionário, EPI)`` a analisar
+        df_stock: DataFrame de transações da planilha
+        matcher: Regras de troca (padrão: ``get_rule_matcher()``)
+        max_concurrency: Máximo de chamadas simultâneas
+        use_cache: False ignora o cache e força novas análises
+
+    Returns:
+        Dict ``{(funcionário, EPI): análise}``
+    """
+    pairs = list(dict.fromkeys(pairs))
+    if not pairs:
+        return {}
+
+    try:
+        contexts = build_insight_contexts(pairs, df_stock, matcher)
     except Exception as e:
-        return f"Erro na análise de IA: {str(e)}"  
+        return {pair: f"Erro na análise de IA: {str(e)}" for pair in pairs}
+
+    cache = get_response_cache()
+    distinct = contexts.dropna(subset=['context']).drop_duplicates('context_hash')
+    prompts = dict(zip(distinct['context_hash'], distinct['context'].map(insight_prompt)))
+
+    answers = {}
+    if use_cache:
+        for context_hash, prompt in prompts.items():
+            cached = cache.get(prompt, GEMINI_MODEL)
+            if cached is not None:
+                answers[context_hash] = cached
+
+    pending = [context_hash for context_hash in prompts if context_hash not in answers]
+    if pending:
+        try:
+            responses = asyncio.run(_generate_insights(
+                get_model(), [prompts[context_hash] for context_hash in pending], max_concurrency
+            ))
+        except Exception as e:
+            return {pair: f"Erro na análise de IA: {str(e)}" for pair in pairs}
+
+        # Só respostas válidas vão para o cache; erros são tentados de novo
+        for context_hash, (text, ok) in zip(pending, responses):
+            answers[context_hash] = text
+            if ok:
+                cache.set(prompts[context_hash], GEMINI_MODEL, text)
+
+    insights = {}
+    for row in contexts.itertuples(index=False):
+        if pd.isna(row.context):
+            insights[(row.requester, row.epi_name)] = INSUFFICIENT_HISTORY
+        else:
+            insights[(row.requester, row.epi_name)] = answers[row.context_hash]
+    return insights
+
+def get_ia_insights_for_alert(requester, epi_name, df_stock, matcher=None, use_cache=True):
+    """
+    Usa a IA Generativa para analisar o histórico de um funcionário/EPI
+    e fornecer insights adicionais sobre o consumo.
+    """
+    return get_ia_insights_batch([(requester, epi_name)], df_stock, matcher, use_cache=use_cache)[(requester, epi_name)]
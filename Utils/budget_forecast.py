@@ -2,9 +2,10 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 from AI_container.credentials.API_Operation import PDFQA
+from Utils.epi_rules import get_rule_matcher
 import logging
 
-def generate_budget_forecast(sheet_operations, ano_base, margem_seguranca_percent):
+def generate_budget_forecast(sheet_operations, ano_base, margem_seguranca_percent, use_cache=True, stream=False):
     """
     Gera uma previsão orçamentária para o próximo ano baseada no histórico de consumo.
     
@@ -12,6 +13,10 @@ def generate_budget_forecast(sheet_operations, ano_base, margem_seguranca_percen
         sheet_operations: Instância de SheetOperations para acessar os dados
         ano_base: Ano que será usado como base para a análise
         margem_seguranca_percent: Percentual de margem de segurança a ser aplicado
+        use_cache: False ignora o cache de respostas da IA e gera um novo relatório
+        stream: True devolve em "relatorio_stream" um gerador dos trechos do
+            relatório (cabeçalho, texto da IA conforme chega e observações
+            finais) no lugar de "relatorio_completo"
         
     Returns:
         dict: Contém o relatório completo, valores previstos e detalhes
@@ -50,6 +55,12 @@ def generate_budget_forecast(sheet_operations, ano_base, margem_seguranca_percen
         
         estatisticas_epi.columns = ['Quantidade Total', 'Valor Total Gasto', 'Valor Médio Unitário']
         
+        # Periodicidade de troca de cada EPI (mesmas regras dos alertas)
+        matcher = get_rule_matcher(sheet_operations)
+        estatisticas_epi['Troca (dias)'] = pd.Series(
+            matcher.periods(estatisticas_epi.index), index=estatisticas_epi.index
+        ).astype('Int64')
+        
         # Carregar dados de funcionários
         try:
             emp_data = sheet_operations.carregar_dados_funcionarios()
@@ -70,7 +81,7 @@ def generate_budget_forecast(sheet_operations, ano_base, margem_seguranca_percen
         - Total gasto com EPIs: R$ {estatisticas_epi['Valor Total Gasto'].sum():,.2f}
         - Número de EPIs diferentes adquiridos: {len(estatisticas_epi)}
         
-        Detalhamento por EPI:
+        Detalhamento por EPI (coluna "Troca (dias)": periodicidade de troca cadastrada; vazia se não houver regra):
         {estatisticas_epi.to_string()}
         
         Informações Importantes:
@@ -108,17 +119,13 @@ def generate_budget_forecast(sheet_operations, ano_base, margem_seguranca_percen
         Formato: Use Markdown para formatação clara e profissional.
         """
         
-        # Chamar IA
-        ai_engine = PDFQA()
-        relatorio_ia = ai_engine.model.generate_content(contexto).text
-        
         # Calcular valores
         total_previsto = estatisticas_epi['Valor Total Gasto'].sum()
         margem = total_previsto * (margem_seguranca_percent / 100)
         total_com_margem = total_previsto + margem
         
         # Montar relatório completo
-        relatorio_completo = f"""
+        cabecalho = f"""
 # Previsão Orçamentária de EPIs - Ano {ano_base + 1}
 
 **Data de Geração:** {datetime.now().strftime('%d/%m/%Y %H:%M')}
@@ -141,7 +148,8 @@ def generate_budget_forecast(sheet_operations, ano_base, margem_seguranca_percen
 
 ---
 
-{relatorio_ia}
+"""
+        rodape = """
 
 ---
 
@@ -154,14 +162,28 @@ Recomenda-se revisão trimestral para ajustes conforme necessário.
 ou alterações nas normas de segurança do trabalho.
         """
         
-        return {
-            "relatorio_completo": relatorio_completo,
+        resultado = {
             "total_previsto": total_previsto,
             "total_com_margem": total_com_margem,
             "margem": margem,
             "estatisticas": estatisticas_epi.to_dict()
         }
         
+        # Chamar IA
+        ai_engine = PDFQA()
+        if stream:
+            def relatorio_stream():
+                yield cabecalho
+                yield from ai_engine.generate_stream(contexto, use_cache)
+                yield rodape
+            
+            resultado["relatorio_stream"] = relatorio_stream()
+        else:
+            relatorio_ia = ai_engine.generate(contexto, use_cache)
+            resultado["relatorio_completo"] = cabecalho + relatorio_ia + rodape
+        
+        return resultado
+        
     except Exception as e:
         logging.error(f"Erro ao gerar previsão orçamentária: {e}")
         return {"erro": f"Erro ao gerar previsão: {str(e)}"}
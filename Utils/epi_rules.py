@@ -0,0 +1,268 @@
+"""
+Regras de periodicidade de troca dos EPIs e o matcher compilado que as aplica.
+
+As regras vêm, nesta ordem, da aba ``regras_troca`` da planilha, de um
+arquivo JSON (``EPI_RULES_FILE`` ou ``Utils/epi_rules.json``) ou das regras
+padrão abaixo.
+
+Aba ``regras_troca`` (uma regra por linha)::
+
+    tipo          | padrao              | dias | prioridade
+    nome          | Botina de Seguranca | 180  |
+    palavra_chave | oculos              | 365  | 1
+
+Arquivo JSON::
+
+    {"exact": {"Botina de Seguranca": 180},
+     "keywords": {"botina": 180, "oculos": 365}}
+
+Precedência: nome exato (sem diferenciar maiúsculas e acentos) vence
+qualquer palavra-chave; entre palavras-chave presentes no nome vence a de
+menor ``prioridade`` e, no empate, a que aparece primeiro nas regras.
+"""
+import os
+import re
+import json
+import time
+import logging
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+RULES_SHEET = 'regras_troca'
+RULES_FILE = os.environ.get('EPI_RULES_FILE', os.path.join(os.path.dirname(__file__), 'epi_rules.json'))
+
+# Intervalo para reler as regras da planilha (segundos)
+RULES_TTL = 300
+
+DEFAULT_RULES = {
+    "exact": {
+        "Botina de Seguranca": 180,  # 6 meses
+        "Mascara de Protecao": 180,  # 6 meses
+        "Abafador de Ruidos": 180,  # 6 meses
+        "Filtro para Mascara": 180,  # 6 meses
+        "Cinto de Seguranca": 180,  # 6 meses
+    },
+    "keywords": {
+        "botina": 180,
+        "mascara": 180,
+        "abafador": 180,
+        "filtro": 180,
+        "cinto": 180,
+        "oculos": 365,  # Exemplo: óculos a cada 1 ano
+    }
+}
+
+
+def normalize_name(text) -> str:
+    """Nome em minúsculas, sem acentos e com espaços simples."""
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.lower().split())
+
+
+class RuleMatcher:
+    """
+    Regras de troca compiladas para consulta rápida.
+    
+    - Nomes exatos ficam em um dict (hash) indexado pelo nome normalizado
+    - Palavras-chave viram uma única regex de alternância, da mais longa
+      para a mais curta, aplicada com lookahead para achar também
+      ocorrências sobrepostas; as palavras-chave que são prefixo da
+      encontrada em cada posição completam os candidatos, de modo que todas
+      as palavras presentes no nome são consideradas na precedência
+    - O resultado de cada nome distinto fica memorizado
+    """
+    
+    def __init__(self, exact: Dict[str, int], keywords: List[Tuple[str, int, int]]):
+        """
+        Args:
+            exact: Período (dias) por nome exato de EPI
+            keywords: Tuplas ``(palavra_chave, dias, prioridade)`` na ordem das regras
+        """
+        self.exact = {normalize_name(name): int(days) for name, days in exact.items()}
+        
+        self.keywords = {}
+        for order, (keyword, days, priority) in enumerate(keywords):
+            keyword = normalize_name(keyword)
+            if keyword and keyword not in self.keywords:
+                self.keywords[keyword] = (int(days), (priority, order))
+        
+        self._pattern = None
+        self._prefixes = {}
+        if self.keywords:
+            by_length = sorted(self.keywords, key=len, reverse=True)
+            self._pattern = re.compile('(?=(' + '|'.join(map(re.escape, by_length)) + '))')
+            self._prefixes = {
+                keyword: [other for other in self.keywords if keyword.startswith(other)]
+                for keyword in self.keywords
+            }
+        
+        self._memo = {}
+    
+    # ------------------------------------------------------------------
+    # Construção
+    # ------------------------------------------------------------------
+    
+    @classmethod
+    def from_config(cls, rules: Dict) -> 'RuleMatcher':
+        """
+        Matcher a partir de um dict ``{"exact": {...}, "keywords": {...}}``.
+        
+        Também aceita o formato antigo, com os nomes exatos na raiz e as
+        palavras-chave em ``keywords``.
+        """
+        keywords = rules.get('keywords', {})
+        exact = rules.get('exact', {k: v for k, v in rules.items() if k != 'keywords'})
+        return cls(exact, [(keyword, days, 0) for keyword, days in keywords.items()])
+    
+    @classmethod
+    def from_file(cls, path: str) -> 'RuleMatcher':
+        """Matcher a partir de um arquivo JSON (ver docstring do módulo)."""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_config(json.load(f))
+    
+    @classmethod
+    def from_sheet_rows(cls, rows: List[List]) -> 'RuleMatcher':
+        """
+        Matcher a partir das linhas da aba ``regras_troca``.
+        
+        Args:
+            rows: Saída de ``SheetOperations.carregar_regras_troca()``
+                (primeira linha com os cabeçalhos)
+        
+        Returns:
+            RuleMatcher; linhas com tipo desconhecido ou dias inválidos são ignoradas
+        """
+        df = pd.DataFrame(rows[1:], columns=[normalize_name(c) for c in rows[0]])
+        if 'prioridade' not in df.columns:
+            df['prioridade'] = 0
+        
+        df['dias'] = pd.to_numeric(df['dias'], errors='coerce')
+        df['prioridade'] = pd.to_numeric(df['prioridade'], errors='coerce').fillna(0)
+        df['tipo'] = df['tipo'].map(normalize_name).str.replace(' ', '_')
+        valid = df['dias'].notna() & (df['padrao'].str.strip() != '')
+        if (~valid).any():
+            logger.warning(f"{int((~valid).sum())} regra(s) de troca inválida(s) ignorada(s) na aba '{RULES_SHEET}'")
+        df = df[valid]
+        
+        exact = df[df['tipo'] == 'nome']
+        keywords = df[df['tipo'] == 'palavra_chave']
+        return cls(
+            dict(zip(exact['padrao'], exact['dias'])),
+            list(zip(keywords['padrao'], keywords['dias'], keywords['prioridade']))
+        )
+    
+    # ------------------------------------------------------------------
+    # Consulta
+    # ------------------------------------------------------------------
+    
+    def match(self, epi_name) -> Optional[Tuple[str, str, int]]:
+        """
+        Regra aplicada a um EPI.
+        
+        Returns:
+            ``(tipo, padrao, dias)`` com tipo ``'nome'`` ou ``'palavra_chave'``,
+            ou None se nenhuma regra se aplica
+        """
+        if epi_name in self._memo:
+            return self._memo[epi_name]
+        
+        name = normalize_name(epi_name)
+        result = None
+        if name in self.exact:
+            result = ('nome', name, self.exact[name])
+        elif self._pattern is not None:
+            found = {
+                keyword
+                for match in self._pattern.finditer(name)
+                for keyword in self._prefixes[match.group(1)]
+            }
+            if found:
+                keyword = min(found, key=lambda k: self.keywords[k][1])
+                result = ('palavra_chave', keyword, self.keywords[keyword][0])
+        
+        self._memo[epi_name] = result
+        return result
+    
+    def period(self, epi_name) -> Optional[int]:
+        """Período de troca (dias) de um EPI, ou None se não houver regra."""
+        result = self.match(epi_name)
+        return result[2] if result else None
+    
+    def periods(self, epi_names) -> np.ndarray:
+        """
+        Período de troca para cada nome de uma série, consultando as regras
+        uma única vez por nome distinto. EPIs sem regra ficam com NaN.
+        """
+        codes, unique_names = pd.factorize(pd.Series(epi_names), sort=False)
+        
+        # Nomes ausentes recebem o código -1, que aponta para o NaN final
+        periods = np.array([self.period(name) for name in unique_names] + [None], dtype=float)
+        return periods[codes]
+    
+    def signature(self) -> Tuple:
+        """Conteúdo das regras (para saber se uma recarga mudou algo)."""
+        return tuple(sorted(self.exact.items())), tuple(self.keywords.items())
+
+
+def load_rule_matcher(sheet_operations=None, path: str = None) -> RuleMatcher:
+    """
+    Carrega as regras: aba ``regras_troca`` (se houver ``sheet_operations``
+    e a aba tiver regras), arquivo JSON (se existir) ou regras padrão.
+    """
+    if sheet_operations is not None:
+        try:
+            rows = sheet_operations.carregar_regras_troca()
+            if rows and len(rows) > 1:
+                matcher = RuleMatcher.from_sheet_rows(rows)
+                logger.info(f"Regras de troca carregadas da aba '{RULES_SHEET}'")
+                return matcher
+        except Exception as e:
+            logger.warning(f"Não foi possível ler as regras da aba '{RULES_SHEET}': {e}")
+    
+    path = path or RULES_FILE
+    if os.path.exists(path):
+        try:
+            matcher = RuleMatcher.from_file(path)
+            logger.info(f"Regras de troca carregadas de {path}")
+            return matcher
+        except (OSError, ValueError, AttributeError) as e:
+            logger.error(f"Arquivo de regras de troca inválido ({path}): {e}")
+    
+    return RuleMatcher.from_config(DEFAULT_RULES)
+
+
+_lock = threading.Lock()
+_matcher = None
+_loaded_at = 0.0
+_from_sheet = False
+
+
+def get_rule_matcher(sheet_operations=None) -> RuleMatcher:
+    """
+    Matcher compartilhado do processo (alertas, insights de IA e previsão
+    orçamentária).
+    
+    Com ``sheet_operations``, as regras da planilha são relidas a cada
+    ``RULES_TTL`` segundos; se não mudaram, o matcher anterior (e sua
+    memória de consultas) é mantido.
+    """
+    global _matcher, _loaded_at, _from_sheet
+    
+    with _lock:
+        expired = time.time() - _loaded_at > RULES_TTL
+        wants_sheet = sheet_operations is not None and (not _from_sheet or expired)
+        if _matcher is None or wants_sheet:
+            matcher = load_rule_matcher(sheet_operations)
+            if _matcher is None or matcher.signature() != _matcher.signature():
+                _matcher = matcher
+            _loaded_at = time.time()
+            _from_sheet = _from_sheet or sheet_operations is not None
+        return _matcher
@@ -0,0 +1,431 @@
+"""
+Índice semântico local do catálogo: CAs da aba 'db_ca' e EPIs do estoque
+"""
+import os
+import hashlib
+import logging
+import threading
+from typing import Callable, Dict, List, Sequence
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from Utils.epi_rules import normalize_name
+
+logger = logging.getLogger(__name__)
+
+
+# Dimensão dos vetores do HashingEmbedder
+HASHING_FEATURES = 2 ** 10
+
+# Textos enviados ao embedder por chamada
+EMBED_BATCH_SIZE = 256
+
+DOCUMENT_COLUMNS = ['doc_id', 'kind', 'key', 'text']
+
+RESULT_COLUMNS = ['rank', 'doc_id', 'kind', 'key', 'text', 'score']
+
+# Embedder padrão do índice do processo (variável SEMANTIC_EMBEDDER)
+DEFAULT_EMBEDDER = 'hashing'
+
+
+class HashingEmbedder:
+    """
+    Embeddings offline por hashing de n-gramas de caracteres, sem modelo nem
+    rede. Aproxima nomes com grafia parecida ("luva nitrilica" e "Luva
+    Nitrílica cano longo"), mas não reconhece sinônimos.
+    """
+    
+    def __init__(self, n_features: int = HASHING_FEATURES, ngram_range=(3, 5)):
+        from sklearn.feature_extraction.text import HashingVectorizer
+        
+        self._vectorizer = HashingVectorizer(
+            analyzer='char_wb', ngram_range=ngram_range, n_features=n_features,
+            alternate_sign=False, norm='l2', preprocessor=normalize_name
+        )
+        self.name = f"hashing-char{ngram_range[0]}-{ngram_range[1]}-{n_features}"
+    
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        return self._vectorizer.transform(texts).toarray().astype(np.float32)
+
+
+class GeminiEmbedder:
+    """Embeddings do Gemini (reconhece sinônimos; exige a API configurada)."""
+    
+    def __init__(self, model_name: str = 'models/embedding-001'):
+        self.model_name = model_name
+        self.name = f"gemini-{model_name}"
+    
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        from AI_container.credentials.gemini_client import get_genai
+        
+        result = get_genai().embed_content(
+            model=self.model_name, content=list(texts), task_type='semantic_similarity'
+        )
+        return np.asarray(result['embedding'], dtype=np.float32)
+
+
+EMBEDDERS = {'hashing': HashingEmbedder, 'gemini': GeminiEmbedder}
+
+
+def _embedder_name(embedder: Callable) -> str:
+    return getattr(embedder, 'name', None) or getattr(embedder, '__qualname__', type(embedder).__name__)
+
+
+def _text_hashes(texts: pd.Series) -> np.ndarray:
+    return np.array([hashlib.sha1(text.encode('utf-8')).hexdigest() for text in texts], dtype=object)
+
+
+_faiss_module = None
+
+
+def _faiss():
+    """Módulo ``faiss`` se instalado; senão a busca usa numpy."""
+    global _faiss_module
+    if _faiss_module is None:
+        try:
+            import faiss
+            _faiss_module = faiss
+        except ImportError:
+            _faiss_module = False
+    return _faiss_module or None
+
+
+class SemanticIndex:
+    """
+    Vetores de documentos do catálogo (um por ``doc_id``) para busca por
+    similaridade de cosseno.
+    
+    - ``sync`` só calcula embeddings de documentos novos ou com texto
+      alterado; os que saíram do catálogo são removidos
+    - O estado (documentos e vetores) é persistido em disco; se o embedder
+      mudar, os vetores salvos são descartados e recalculados no próximo
+      ``sync``
+    - A busca usa FAISS (produto interno em vetores normalizados) quando
+      disponível, senão numpy
+    
+    O embedder é qualquer função ``textos -> array (n, d)``; o atributo
+    ``name``, se existir, identifica o embedder no arquivo persistido.
+    """
+    
+    def __init__(self, path: str = None, embedder: Callable = None):
+        """
+        Args:
+            path: Arquivo onde o índice é persistido (só em memória se None)
+            embedder: Função de embedding (padrão: ``HashingEmbedder``)
+        """
+        self.path = path
+        self.embedder = embedder or HashingEmbedder()
+        self.embedder_name = _embedder_name(self.embedder)
+        self.documents = pd.DataFrame(columns=DOCUMENT_COLUMNS + ['text_hash'])
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.version = 0
+        
+        self._backends = {}
+        self._backend_version = -1
+        self._lock = threading.Lock()
+        
+        if path and os.path.exists(path):
+            try:
+                state = joblib.load(path)
+                if state['embedder_name'] == self.embedder_name:
+                    self.documents = state['documents']
+                    self.vectors = state['vectors']
+                    self.version = state['version']
+                else:
+                    logger.info(
+                        f"Índice semântico em {path} usa outro embedder "
+                        f"({state['embedder_name']}); será recalculado"
+                    )
+            except Exception as e:
+                logger.warning(f"Índice semântico ignorado ({path}): {e}")
+    
+    def __len__(self):
+        return len(self.documents)
+    
+    def _save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        joblib.dump({
+            'documents': self.documents,
+            'vectors': self.vectors,
+            'embedder_name': self.embedder_name,
+            'version': self.version
+        }, tmp_path)
+        os.replace(tmp_path, self.path)
+    
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        """Embeddings em lotes, normalizados (norma 1) para o produto interno ser o cosseno."""
+        vectors = np.vstack([
+            np.asarray(self.embedder(texts[start:start + EMBED_BATCH_SIZE]), dtype=np.float32)
+            for start in range(0, len(texts), EMBED_BATCH_SIZE)
+        ])
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1)
+    
+    # ------------------------------------------------------------------
+    # Atualização
+    # ------------------------------------------------------------------
+    
+    def sync(self, documents: pd.DataFrame, remove_missing: bool = True) -> Dict[str, int]:
+        """
+        Alinha o índice com os documentos atuais do catálogo.
+        
+        Args:
+            documents: DataFrame com ``DOCUMENT_COLUMNS`` (ver ``catalog_documents``)
+            remove_missing: Remove do índice os documentos ausentes em ``documents``
+        
+        Returns:
+            Contagem de documentos ``added``, ``updated``, ``removed`` e ``unchanged``
+        """
+        docs = documents[DOCUMENT_COLUMNS].drop_duplicates('doc_id', keep='last').reset_index(drop=True)
+        docs['text'] = docs['text'].fillna('').astype(str)
+        docs['text_hash'] = _text_hashes(docs['text'])
+        
+        with self._lock:
+            current = pd.Series(self.documents['text_hash'].values, index=self.documents['doc_id'].values)
+            known = docs['doc_id'].isin(current.index).values
+            changed = known & (docs['doc_id'].map(current).values != docs['text_hash'].values)
+            removed = (
+                ~self.documents['doc_id'].isin(docs['doc_id']).values if remove_missing
+                else np.zeros(len(self.documents), dtype=bool)
+            )
+            counts = {
+                'added': int((~known).sum()),
+                'updated': int(changed.sum()),
+                'removed': int(removed.sum()),
+                'unchanged': int((known & ~changed).sum())
+            }
+            if not (counts['added'] or counts['updated'] or counts['removed']):
+                return counts
+            
+            to_embed = docs[~known | changed].reset_index(drop=True)
+            new_vectors = (
+                self._embed(to_embed['text'].tolist()) if len(to_embed)
+                else np.zeros((0, self.vectors.shape[1]), dtype=np.float32)
+            )
+            embedded = pd.Series(np.arange(len(to_embed)), index=to_embed['doc_id'].values)
+            
+            base = self.documents.loc[~removed].reset_index(drop=True)
+            base_vectors = self.vectors[~removed] if len(self.documents) else new_vectors[:0]
+            
+            # Textos alterados: vetor substituído na mesma posição
+            replaced = base['doc_id'].isin(embedded.index).values
+            if replaced.any():
+                rows = embedded[base.loc[replaced, 'doc_id']].values
+                base_vectors[replaced] = new_vectors[rows]
+                base.loc[replaced, DOCUMENT_COLUMNS[1:] + ['text_hash']] = (
+                    to_embed.loc[rows, DOCUMENT_COLUMNS[1:] + ['text_hash']].values
+                )
+            
+            added = ~to_embed['doc_id'].isin(base['doc_id']).values
+            self.documents = pd.concat([base, to_embed[added]], ignore_index=True)
+            self.vectors = np.ascontiguousarray(np.vstack([base_vectors, new_vectors[added]]))
+            self.version += 1
+            self._save()
+        
+        logger.info(
+            f"Índice semântico: {counts['added']} novo(s), {counts['updated']} alterado(s), "
+            f"{counts['removed']} removido(s), {len(self.documents)} no total"
+        )
+        return counts
+    
+    # ------------------------------------------------------------------
+    # Busca
+    # ------------------------------------------------------------------
+    
+    def _backend(self, kind: str = None):
+        """Posições, vetores e índice FAISS (ou None) do subconjunto ``kind``."""
+        if self._backend_version != self.version:
+            self._backends = {}
+            self._backend_version = self.version
+        
+        if kind not in self._backends:
+            positions = (
+                np.arange(len(self.documents)) if kind is None
+                else np.flatnonzero(self.documents['kind'].values == kind)
+            )
+            vectors = np.ascontiguousarray(self.vectors[positions]) if len(positions) else None
+            index = None
+            faiss = _faiss()
+            if faiss is not None and vectors is not None:
+                index = faiss.IndexFlatIP(vectors.shape[1])
+                index.add(vectors)
+            self._backends[kind] = (positions, vectors, index)
+        return self._backends[kind]
+    
+    def search_many(self, queries: Sequence[str], k: int = 5, kind: str = None,
+                    min_score: float = 0.0) -> pd.DataFrame:
+        """
+        Documentos mais parecidos com cada consulta.
+        
+        Args:
+            queries: Textos de busca (ex.: nomes de itens do estoque)
+            k: Resultados por consulta
+            kind: Restringe a ``'ca'`` ou ``'epi'`` (padrão: todos)
+            min_score: Similaridade mínima (cosseno) para entrar no resultado
+        
+        Returns:
+            DataFrame com ``query`` e ``RESULT_COLUMNS``, do mais parecido ao menos parecido
+        """
+        queries = [str(query) for query in queries]
+        with self._lock:
+            positions, vectors, index = self._backend(kind)
+            documents = self.documents
+        
+        k = min(k, len(positions))
+        if not queries or k == 0:
+            return pd.DataFrame(columns=['query'] + RESULT_COLUMNS)
+        
+        query_vectors = self._embed(queries)
+        if index is not None:
+            scores, rows = index.search(query_vectors, k)
+        else:
+            similarity = query_vectors @ vectors.T
+            rows = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+            scores = np.take_along_axis(similarity, rows, axis=1)
+            order = np.argsort(-scores, axis=1, kind='stable')
+            rows = np.take_along_axis(rows, order, axis=1)
+            scores = np.take_along_axis(scores, order, axis=1)
+        
+        matches = documents.iloc[positions[rows.ravel()]][DOCUMENT_COLUMNS].reset_index(drop=True)
+        matches.insert(0, 'query', np.repeat(queries, k))
+        matches.insert(1, 'rank', np.tile(np.arange(1, k + 1), len(queries)))
+        matches['score'] = scores.ravel().round(4)
+        return matches[matches['score'] >= min_score].reset_index(drop=True)
+    
+    def search(self, query: str, k: int = 5, kind: str = None, min_score: float = 0.0) -> pd.DataFrame:
+        """Documentos mais parecidos com ``query`` (ver ``search_many``)."""
+        return self.search_many([query], k, kind, min_score).drop(columns='query')
+
+
+# ----------------------------------------------------------------------
+# Catálogo
+# ----------------------------------------------------------------------
+
+def catalog_documents(db_ca_df: pd.DataFrame = None, epi_names: Sequence[str] = None) -> pd.DataFrame:
+    """
+    Documentos do catálogo: um por CA (nome + descrição do equipamento, do
+    registro mais recente da aba 'db_ca') e um por nome distinto de EPI do
+    estoque.
+    
+    Args:
+        db_ca_df: Aba 'db_ca' (colunas ``ca``, ``nome_equipamento``, ``descricao_equipamento``)
+        epi_names: Nomes de EPI das transações do estoque
+    
+    Returns:
+        DataFrame com ``DOCUMENT_COLUMNS``
+    """
+    parts = []
+    
+    if db_ca_df is not None and not db_ca_df.empty and 'ca' in db_ca_df.columns:
+        ca = db_ca_df
+        if 'ultima_consulta_dt' in ca.columns:
+            ca = ca.sort_values('ultima_consulta_dt', kind='stable')
+        ca = ca.assign(ca=ca['ca'].astype(str).str.strip()).drop_duplicates('ca', keep='last')
+        fields = ca.reindex(columns=['nome_equipamento', 'descricao_equipamento']).fillna('').astype(str)
+        text = (fields['nome_equipamento'].str.strip() + '. ' + fields['descricao_equipamento'].str.strip()).str.strip('. ')
+        parts.append(pd.DataFrame({
+            'doc_id': 'ca:' + ca['ca'].values,
+            'kind': 'ca',
+            'key': ca['ca'].values,
+            'text': text.values
+        }))
+    
+    if epi_names is not None:
+        names = pd.Series(epi_names, dtype=object).dropna().astype(str).str.strip()
+        names = names[names != ''].drop_duplicates()
+        normalized = names.map(normalize_name)
+        keep = ~normalized.duplicated()
+        parts.append(pd.DataFrame({
+            'doc_id': 'epi:' + normalized[keep].values,
+            'kind': 'epi',
+            'key': names[keep].values,
+            'text': names[keep].values
+        }))
+    
+    if not parts:
+        return pd.DataFrame(columns=DOCUMENT_COLUMNS)
+    documents = pd.concat(parts, ignore_index=True)
+    return documents[documents['text'] != ''].reset_index(drop=True)
+
+
+def load_catalog(sheet_operations):
+    """
+    Aba 'db_ca' e nomes de EPI da aba de estoque.
+    
+    Returns:
+        (DataFrame da 'db_ca', lista de nomes de EPI); None no que não pôde ser lido
+    """
+    db_ca_df, epi_names = None, None
+    try:
+        data = sheet_operations.carregar_dados_aba('db_ca')
+        db_ca_df = pd.DataFrame(data[1:], columns=data[0]) if data else pd.DataFrame()
+        if not db_ca_df.empty:
+            if 'ultima_consulta' in db_ca_df.columns:
+                db_ca_df['ultima_consulta_dt'] = pd.to_datetime(
+                    db_ca_df['ultima_consulta'], dayfirst=True, errors='coerce'
+                )
+    except Exception as e:
+        logger.error(f"Erro ao carregar a aba 'db_ca' para o índice semântico: {e}")
+    try:
+        data = sheet_operations.carregar_dados()
+        epi_names = []
+        if data and 'epi_name' in data[0]:
+            column = data[0].index('epi_name')
+            epi_names = [row[column] for row in data[1:] if len(row) > column]
+    except Exception as e:
+        logger.error(f"Erro ao carregar os EPIs do estoque para o índice semântico: {e}")
+    return db_ca_df, epi_names
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_semantic_index() -> SemanticIndex:
+    """
+    Índice único do processo, em ``config.cache_dir/semantic``. O embedder
+    vem da variável de ambiente ``SEMANTIC_EMBEDDER`` (``hashing`` ou
+    ``gemini``; padrão ``DEFAULT_EMBEDDER``).
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            from ML.config import config
+            
+            name = os.environ.get('SEMANTIC_EMBEDDER', DEFAULT_EMBEDDER)
+            if name not in EMBEDDERS:
+                logger.warning(f"SEMANTIC_EMBEDDER desconhecido ({name}); usando '{DEFAULT_EMBEDDER}'")
+                name = DEFAULT_EMBEDDER
+            _index = SemanticIndex(
+                os.path.join(config.cache_dir, 'semantic', f'catalog_index_{name}.joblib'),
+                EMBEDDERS[name]()
+            )
+        return _index
+
+
+def refresh_catalog_index(sheet_operations=None, db_ca_df: pd.DataFrame = None,
+                          epi_names: Sequence[str] = None) -> Dict[str, int]:
+    """
+    Atualiza o índice do processo com o catálogo atual. O que não for
+    passado é lido da planilha; se uma das leituras falhar, nada é removido
+    do índice.
+    
+    Returns:
+        Contagem de mudanças de ``SemanticIndex.sync``
+    """
+    if db_ca_df is None or epi_names is None:
+        if sheet_operations is None:
+            from End.Operations import SheetOperations
+            sheet_operations = SheetOperations()
+        sheet_ca, sheet_names = load_catalog(sheet_operations)
+        db_ca_df = sheet_ca if db_ca_df is None else db_ca_df
+        epi_names = sheet_names if epi_names is None else epi_names
+    return get_semantic_index().sync(
+        catalog_documents(db_ca_df, epi_names),
+        remove_missing=db_ca_df is not None and epi_names is not None
+    )
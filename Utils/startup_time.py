@@ -0,0 +1,93 @@
+"""
+Mede o tempo de importação dos módulos carregados na inicialização do app.
+
+Cada módulo é importado em um processo Python novo (sem cache de módulos),
+várias vezes, e é reportada a mediana. Também lista quais bibliotecas
+pesadas de ML/gráficos acabaram carregadas pela importação.
+
+Uso:
+    python -m Utils.startup_time
+    python -m Utils.startup_time ML.config pages.ml_forecast --runs 5
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+DEFAULT_MODULES = [
+    # Referência: o próprio Streamlit já carrega plotly (tema dos gráficos)
+    'streamlit',
+    'ML',
+    'ML.config',
+    'ML.job_runner',
+    'ML.demand_forecasting',
+    'pages.ml_forecast',
+    'Front.ml_forecast_page',
+    'main'
+]
+
+HEAVY_LIBRARIES = ['prophet', 'xgboost', 'lightgbm', 'sklearn', 'plotly', 'statsmodels', 'google.generativeai']
+
+_PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    'seconds': elapsed,
+    'heavy': [name for name in {heavy!r} if name in sys.modules]
+}}))
+"""
+
+
+def measure_import(module: str, runs: int = 3, cwd: str = None) -> dict:
+    """
+    Tempo de ``import module`` em processos novos.
+    
+    Args:
+        module: Nome do módulo
+        runs: Número de repetições (reporta a mediana)
+        cwd: Raiz do projeto (padrão: diretório acima de ``Utils``)
+    
+    Returns:
+        Dict com ``seconds`` (mediana), ``heavy`` (bibliotecas pesadas
+        carregadas) ou ``error``
+    """
+    cwd = cwd or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = _PROBE.format(module=module, heavy=HEAVY_LIBRARIES)
+    timings, heavy = [], []
+    
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, '-c', code], cwd=cwd, capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            last_line = (proc.stderr.strip().splitlines() or ['erro desconhecido'])[-1]
+            return {'module': module, 'error': last_line}
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        timings.append(result['seconds'])
+        heavy = result['heavy']
+    
+    return {'module': module, 'seconds': statistics.median(timings), 'heavy': heavy}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo de importação dos módulos do app")
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+    
+    print(f"{'Módulo':<28} {'Tempo (s)':>10}  Bibliotecas pesadas carregadas")
+    print('-' * 80)
+    for module in args.modules:
+        result = measure_import(module, args.runs)
+        if 'error' in result:
+            print(f"{module:<28} {'erro':>10}  {result['error']}")
+        else:
+            print(f"{module:<28} {result['seconds']:>10.2f}  {', '.join(result['heavy']) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,8 @@ from auth import (
     can_view
 )
 
-# Importar as funções das páginas
+# Importar as funções das páginas (cada uma só importa o seu módulo do Front,
+# e as bibliotecas dele, quando a página é aberta)
 from pages.home import page_home
 from pages.alerts import page_alerts
 from pages.ficha import page_ficha
@@ -1,7 +1,7 @@
 import streamlit as st
-from Front.admin_page import admin_page
 
 def page_admin():
+    from Front.admin_page import admin_page
     admin_page()
 
 if __name__ == "__main__":
@@ -1,7 +1,7 @@
 import streamlit as st
-from Front.ai_recommendations_page import ai_recommendations_page
 
 def page_ai_analysis():
+    from Front.ai_recommendations_page import ai_recommendations_page
     ai_recommendations_page()
 
 if __name__ == "__main__":
@@ -1,7 +1,7 @@
 import streamlit as st
-from Front.alerts_page import alerts_page
 
 def page_alerts():
+    from Front.alerts_page import alerts_page
     alerts_page()
 
 if __name__ == "__main__":
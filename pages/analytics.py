@@ -1,7 +1,7 @@
 import streamlit as st
-from Front.analytics_page import analytics_page
 
 def page_analytics():
+    from Front.analytics_page import analytics_page
     analytics_page()
 
 if __name__ == "__main__":
@@ -1,7 +1,7 @@
 import streamlit as st
-from Front.ca_lookup_page import ca_lookup_page
 
 def page_consulta_ca():
+    from Front.ca_lookup_page import ca_lookup_page
     ca_lookup_page()
 
 if __name__ == "__main__":
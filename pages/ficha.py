@@ -1,7 +1,7 @@
 import streamlit as st
-from Front.generate_ficha_page import generate_ficha_page
 
 def page_ficha():
+    from Front.generate_ficha_page import generate_ficha_page
     generate_ficha_page()
 
 if __name__ == "__main__":
@@ -1,7 +1,7 @@
 import streamlit as st
-from Front.pageone import front_page
 
 def page_home():
+    from Front.pageone import front_page
     front_page()
 
 if __name__ == "__main__":
@@ -1,8 +1,8 @@
 import streamlit as st
-from Front.ml_forecast_page import ml_forecast_page
 
 def page_ml_forecast():
     """Rota para a página de previsão com ML"""
+    from Front.ml_forecast_page import ml_forecast_page
     ml_forecast_page()
 
 if __name__ == "__main__":
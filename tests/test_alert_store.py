@@ -0,0 +1,29 @@
+import os
+
+import pandas as pd
+
+from Utils.alert_store import AlertStore
+from Utils.epi_rules import get_rule_matcher
+
+
+def transactions(rows):
+    return pd.DataFrame([
+        {'requester': requester, 'epi_name': epi, 'transaction_type': 'saída', 'date': date}
+        for requester, epi, date in rows
+    ])
+
+
+def test_unchanged_sheet_skips_update_and_write(tmp_path):
+    path = str(tmp_path / 'alerts.joblib')
+    df = transactions([('Ana', 'Botina', '2023-01-10'), ('Bruno', 'Luva CA 28011', '2023-06-01')])
+    store = AlertStore(path)
+
+    changes = store.update(df, today='2024-01-01', matcher=get_rule_matcher())
+    assert not changes.empty and os.path.exists(path)
+    saved_at = os.stat(path).st_mtime_ns
+    version = store.version
+
+    again = store.update(df, today='2024-01-01', matcher=get_rule_matcher())
+    assert again.empty
+    assert store.version == version
+    assert os.stat(path).st_mtime_ns == saved_at
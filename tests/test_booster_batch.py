@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from ML.booster_batch import BoosterBatch
+
+xgb = pytest.importorskip('xgboost')
+
+
+def test_batch_matches_each_booster_prediction():
+    rng = np.random.default_rng(0)
+    boosters = [
+        xgb.XGBRegressor(n_estimators=n_trees, max_depth=4).fit(rng.random((80, 5)), rng.random(80) * 5).get_booster()
+        for n_trees in (10, 25, 40)
+    ]
+    X = rng.random((3, 5))
+    X[1, 2] = np.nan
+
+    expected = np.concatenate([booster.inplace_predict(X[i:i + 1]) for i, booster in enumerate(boosters)])
+
+    assert BoosterBatch.supports(boosters)
+    np.testing.assert_allclose(BoosterBatch(boosters).predict(X), expected, rtol=1e-5, atol=1e-5)
+
+
+def test_link_objectives_are_not_supported():
+    rng = np.random.default_rng(0)
+    booster = xgb.XGBRegressor(n_estimators=5, objective='count:poisson').fit(
+        rng.random((40, 3)), rng.integers(0, 5, 40)
+    ).get_booster()
+
+    assert not BoosterBatch.supports([booster])
@@ -0,0 +1,21 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from ML.config import apply_config, config
+
+
+def _origin_step():
+    from ML.config import config
+    return config.model.quantile_origin_step
+
+
+def test_spawned_workers_receive_runtime_overrides(monkeypatch):
+    monkeypatch.setattr(config.model, 'quantile_origin_step', 3)
+
+    with ProcessPoolExecutor(
+        max_workers=1,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=apply_config,
+        initargs=(config,)
+    ) as executor:
+        assert executor.submit(_origin_step).result() == 3
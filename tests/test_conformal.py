@@ -0,0 +1,34 @@
+import numpy as np
+
+from ML.conformal import HORIZON_BANDS, MIN_RESIDUALS, horizon_offsets, intermittent_quantiles
+
+
+def test_horizon_offsets_use_the_residuals_of_each_band():
+    rng = np.random.default_rng(0)
+    horizons = np.repeat(np.arange(1, 61), 20)
+    # Erro cresce com o horizonte
+    residuals = rng.normal(0, 1, len(horizons)) * np.where(horizons <= HORIZON_BANDS[0], 1.0, 5.0)
+    
+    offsets = horizon_offsets({'horizon': horizons, 'residual': residuals}, [0.1, 0.5, 0.9], 120)
+    
+    assert offsets.shape == (3, 120)
+    short, long = offsets[2, 0], offsets[2, 40]
+    assert long > 3 * short
+    # Além do período de validação vale a faixa medida mais longa
+    np.testing.assert_allclose(offsets[:, 119], offsets[:, 59])
+
+
+def test_horizon_offsets_need_enough_residuals():
+    few = {'horizon': np.arange(1, MIN_RESIDUALS), 'residual': np.ones(MIN_RESIDUALS - 1)}
+    assert horizon_offsets(few, [0.5, 0.9], 30) is None
+
+
+def test_intermittent_quantiles_follow_the_observed_sizes():
+    sizes = np.array([1, 1, 2, 2, 3, 10])
+    # Retirada em 40% dos dias, tamanho médio 3.17
+    rate = np.array([0.4 * sizes.mean()])
+    quantiles = intermittent_quantiles(rate, np.array([sizes.mean()]), [sizes], [0.1, 0.5, 0.9, 0.99])
+    
+    assert quantiles['p10'][0] == 0
+    assert quantiles['p50'][0] == 0
+    assert 0 < quantiles['p90'][0] < quantiles['p99'][0] == 10
@@ -0,0 +1,32 @@
+import os
+
+from ML.job_runner import DONE, INTERRUPTED, QUEUED, RUNNING, JobRunner, _write_json
+
+
+def write_job(jobs_dir, job_id, status, created_at, result=True):
+    _write_json(os.path.join(jobs_dir, f"{job_id}.json"), {
+        'job_id': job_id, 'kind': 'compare', 'status': status, 'created_at': created_at
+    })
+    if result:
+        open(os.path.join(jobs_dir, f"{job_id}.joblib"), 'w').close()
+
+
+def test_list_jobs_keeps_only_the_most_recent_finished_jobs(tmp_path):
+    runner = JobRunner(jobs_dir=str(tmp_path), max_workers=1, max_jobs=2)
+    for day in range(1, 5):
+        write_job(str(tmp_path), f"job{day}", DONE, f"2024-01-0{day}")
+    open(tmp_path / 'lost.joblib', 'w').close()
+
+    jobs = runner.list_jobs()
+
+    assert [job['job_id'] for job in jobs] == ['job4', 'job3']
+    assert sorted(os.listdir(tmp_path)) == ['job3.joblib', 'job3.json', 'job4.joblib', 'job4.json']
+
+
+def test_jobs_without_a_live_worker_are_interrupted(tmp_path):
+    runner = JobRunner(jobs_dir=str(tmp_path), max_workers=1)
+    write_job(str(tmp_path), 'queued', QUEUED, '2024-01-01', result=False)
+    write_job(str(tmp_path), 'running', RUNNING, '2024-01-02', result=False)
+
+    assert runner.status('queued')['status'] == INTERRUPTED
+    assert runner.status('running')['status'] == INTERRUPTED
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from ML.model_registry import ModelRegistry
+
+xgb = pytest.importorskip('xgboost')
+pytest.importorskip('prophet')
+
+
+def test_loaded_xgboost_keeps_training_params(tmp_path):
+    import pandas as pd
+    from prophet import Prophet
+
+    rng = np.random.default_rng(0)
+    model = xgb.XGBRegressor(n_estimators=20, max_depth=3, learning_rate=0.05)
+    model.fit(rng.random((50, 4)), rng.random(50))
+
+    prophet = Prophet().fit(pd.DataFrame({'ds': pd.date_range('2024-01-01', periods=30), 'y': rng.random(30)}))
+
+    registry = ModelRegistry(str(tmp_path))
+    residuals = {'horizon': np.array([1, 2, 3]), 'residual': np.array([0.5, -1.0, 2.0])}
+    registry.save('LUVA A', model, prophet, metrics={}, residuals=residuals)
+    loaded = registry.load('LUVA A')['xgboost']
+
+    params = loaded.get_params()
+    assert (params['n_estimators'], params['max_depth'], params['learning_rate']) == (20, 3, 0.05)
+    X = rng.random((5, 4))
+    np.testing.assert_allclose(loaded.predict(X), model.predict(X), rtol=1e-6)
+
+    stored = registry.load_residuals('LUVA A')
+    np.testing.assert_array_equal(stored['horizon'], residuals['horizon'])
+    np.testing.assert_allclose(stored['residual'], residuals['residual'])
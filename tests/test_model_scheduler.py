@@ -0,0 +1,25 @@
+import pandas as pd
+
+from ML.feature_store import aggregate_daily
+from ML.model_scheduler import ModelScheduler
+
+
+def withdrawals(rows):
+    return pd.DataFrame([
+        {'date': pd.Timestamp(date), 'epi_name': epi, 'quantity': quantity, 'transaction_type': 'saída'}
+        for date, epi, quantity in rows
+    ])
+
+
+def epi_hash(df, epi):
+    daily = aggregate_daily(df)
+    return ModelScheduler._history_hash(daily[daily['epi_name'] == epi])
+
+
+def test_history_hash_ignores_other_epis_new_withdrawals():
+    df = withdrawals([('2024-01-01', 'A', 2), ('2024-01-05', 'A', 3), ('2024-01-03', 'B', 1)])
+    other = pd.concat([df, withdrawals([('2024-01-20', 'B', 4)])])
+    same = pd.concat([df, withdrawals([('2024-01-20', 'A', 4)])])
+
+    assert epi_hash(other, 'A') == epi_hash(df, 'A')
+    assert epi_hash(same, 'A') != epi_hash(df, 'A')
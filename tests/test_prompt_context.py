@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+from AI_container.credentials.prompt_context import SIZE_COLUMNS, build_stock_context, estimate_tokens
+
+
+def legacy_stock_context(stock_data, purchase_history=None, usage_history=None, employee_data=None) -> str:
+    """Dados como eram inseridos no prompt antes da compactação (repr dos dicts)."""
+    parts = [f"Dados atuais do estoque: {stock_data}"]
+    if purchase_history:
+        parts.append(f"Histórico de compras: {purchase_history}")
+    if usage_history:
+        parts.append(f"Histórico de uso: {usage_history}")
+    if employee_data is not None:
+        size_counts = {
+            item: employee_data[column].value_counts().to_dict()
+            for item, column in SIZE_COLUMNS.items() if column in employee_data.columns
+        }
+        parts.append(f"Distribuição de tamanhos por EPI: {size_counts}")
+    return '\n\n'.join(parts)
+
+
+def sample_data(n_epis=120, n_moves=400, seed=0):
+    rng = np.random.default_rng(seed)
+    epis = [f"EPI {i:03d}" for i in range(n_epis)]
+    stock = {epi: float(rng.integers(-5, 200)) for epi in epis}
+    dates = pd.date_range('2024-01-01', periods=n_moves, freq='D').strftime('%Y-%m-%d')
+    purchases = [
+        {'date': d, 'epi_name': rng.choice(epis), 'quantity': int(rng.integers(1, 50)), 'value': 12.5}
+        for d in dates
+    ]
+    usage = [
+        {'date': d, 'epi_name': rng.choice(epis), 'quantity': int(rng.integers(1, 5)), 'requester': f"R{rng.integers(30)}"}
+        for d in dates
+    ]
+    return stock, purchases, usage
+
+
+def test_stock_table_is_not_cut_under_budget():
+    stock, _, _ = sample_data(n_epis=120)
+    text, stats = build_stock_context(stock, token_budget=100_000)
+
+    assert stats['estoque'] is None
+    assert 'omitida' not in text
+    assert all(epi in text for epi in stock)
+
+
+def test_truncated_stock_keeps_lowest_and_highest_balance():
+    stock, purchases, usage = sample_data()
+    text, stats = build_stock_context(stock, purchases, usage, token_budget=300)
+
+    ordered = sorted(stock, key=stock.get)
+    assert stats['estoque'] is not None
+    assert 'omitida' in text
+    assert ordered[0] in text and ordered[-1] in text
+
+
+def test_compact_context_is_smaller_than_legacy():
+    stock, purchases, usage = sample_data()
+    text, stats = build_stock_context(stock, purchases, usage)
+    legacy = estimate_tokens(legacy_stock_context(stock, purchases, usage))
+
+    assert stats['tokens'] == estimate_tokens(text)
+    assert stats['tokens'] < legacy / 2